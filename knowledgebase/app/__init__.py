@@ -5,9 +5,10 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from config import Config
+from app.db_routing import RoutingSession
 
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
 def create_app(config_class=Config):
@@ -16,19 +17,43 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
     
     # Initialize extensions with app
+    from app.sqlite_tuning import configure_engine_options, init_sqlite_tuning
+    from app.metrics import configure_pool_metrics, init_metrics
+    configure_engine_options(app)
+    configure_pool_metrics(app)
     db.init_app(app)
+    init_sqlite_tuning(app, db)
+    from app.db_routing import init_db_routing
+    init_db_routing(app)
+    
+    # Prometheus metrics and opt-in request timing; registered first so
+    # their hooks wrap the others
+    init_metrics(app, db)
+    from app.profiling import init_profiling
+    init_profiling(app, db)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Please log in to access this page.'
     login_manager.login_message_category = 'info'
     
+    # Template bytecode cache and the {% cache %} fragment tag
+    from app.templating import init_templating
+    init_templating(app)
+    
+    # Fingerprinted, precompressed static bundles (`flask build-assets`)
+    from app.assets import init_assets
+    init_assets(app)
+    
     # Register custom template filters
-    from app.utils import render_markdown, get_reading_time, truncate_text
+    from app.utils import get_reading_time, truncate_text
+    from app.markdown_cache import init_markdown_cache, render_markdown_cached
     from datetime import datetime
     
+    init_markdown_cache(app)
+    
     @app.template_filter('markdown')
     def markdown_filter(text):
-        return render_markdown(text)
+        return render_markdown_cached(text)
     
     @app.template_filter('reading_time')
     def reading_time_filter(text):
@@ -54,6 +79,24 @@ def create_app(config_class=Config):
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(admin_bp)
     
+    # Register session hooks that maintain the published article counters
+    # and announce content changes, then the caches that listen for them
+    from app import counters, signals  # noqa: F401
+    from app.page_cache import init_page_cache
+    init_page_cache(app)
+    from app.suggestions import init_suggestion_index
+    init_suggestion_index(app)
+    from app.related import init_related_articles
+    init_related_articles(app)
+    
+    # Compress text responses (cached pages are stored precompressed)
+    from app.compression import init_compression
+    init_compression(app)
+    
+    # Register CLI commands
+    from app.commands import register_commands
+    register_commands(app)
+    
     # Register error handlers
     @app.errorhandler(404)
     def not_found_error(error):
@@ -66,10 +109,8 @@ def create_app(config_class=Config):
         db.session.rollback()
         return render_template('errors/500.html'), 500
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-    
+    # Tables and the search index are created by `flask init-db` /
+    # `flask create-schema`, not on every worker boot
     return app
 
 @login_manager.user_loader
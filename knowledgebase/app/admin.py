@@ -1,22 +1,21 @@
 """
 Admin Routes - Content Management
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from app import db
 from app.models import Category, SubCategory, Article, Tag
+from app.markdown_cache import warm_markdown_cache, discard_markdown_cache
+from app.counts import subcategory_counts_by_category, article_counts_by_tag
+from app.pagination import keyset_paginate
+from app.slugs import slug_base, commit_with_unique_slug
+from app.bulk import (set_published, set_featured, move_articles, add_tags, remove_tags,
+                      delete_articles)
+from app.signals import notify_content_changed
 from datetime import datetime
-import re
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
-def slugify(text):
-    """Convert text to URL-friendly slug"""
-    text = text.lower().strip()
-    text = re.sub(r'[^\w\s-]', '', text)
-    text = re.sub(r'[-\s]+', '-', text)
-    return text
-
 # ==========================================
 # Dashboard
 # ==========================================
@@ -36,7 +35,8 @@ def dashboard():
         'featured_articles': Article.query.filter_by(is_featured=True).count(),
     }
     
-    recent_articles = Article.query.order_by(Article.updated_at.desc()).limit(5).all()
+    recent_articles = Article.query.options(*Article.listing_options())\
+        .order_by(Article.updated_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html', stats=stats, recent_articles=recent_articles)
 
@@ -49,7 +49,9 @@ def dashboard():
 def categories():
     """List all categories"""
     categories = Category.query.order_by(Category.order, Category.name).all()
-    return render_template('admin/categories.html', categories=categories)
+    return render_template('admin/categories.html', 
+                         categories=categories,
+                         subcategory_counts=subcategory_counts_by_category())
 
 @admin_bp.route('/category/new', methods=['GET', 'POST'])
 @login_required
@@ -64,22 +66,20 @@ def category_new():
             flash('Category name is required', 'error')
             return redirect(url_for('admin.category_new'))
         
-        slug = slugify(name)
-        
-        # Check if slug already exists
-        if Category.query.filter_by(slug=slug).first():
+        # Check if the name is taken (names differing only in case would
+        # read the same in the navigation)
+        if Category.query.filter(db.func.lower(Category.name) == name.lower()).first():
             flash('A category with this name already exists', 'error')
             return redirect(url_for('admin.category_new'))
         
         category = Category(
             name=name,
-            slug=slug,
             description=description,
             order=order
         )
         
         db.session.add(category)
-        db.session.commit()
+        commit_with_unique_slug(category, slug_base(name, Category.slug, 'category'))
         
         flash(f'Category "{name}" created successfully!', 'success')
         return redirect(url_for('admin.categories'))
@@ -101,21 +101,18 @@ def category_edit(id):
             flash('Category name is required', 'error')
             return redirect(url_for('admin.category_edit', id=id))
         
-        slug = slugify(name)
-        
-        # Check if slug exists (excluding current category)
-        existing = Category.query.filter_by(slug=slug).first()
+        # Check if the name is taken (excluding current category)
+        existing = Category.query.filter(db.func.lower(Category.name) == name.lower()).first()
         if existing and existing.id != id:
             flash('A category with this name already exists', 'error')
             return redirect(url_for('admin.category_edit', id=id))
         
         category.name = name
-        category.slug = slug
         category.description = description
         category.order = order
         category.updated_at = datetime.utcnow()
         
-        db.session.commit()
+        commit_with_unique_slug(category, slug_base(name, Category.slug, 'category'))
         
         flash(f'Category "{name}" updated successfully!', 'success')
         return redirect(url_for('admin.categories'))
@@ -148,9 +145,9 @@ def category_delete(id):
 @login_required
 def subcategories():
     """List all subcategories"""
-    subcategories = SubCategory.query.join(Category).order_by(
-        Category.name, SubCategory.order, SubCategory.name
-    ).all()
+    subcategories = SubCategory.query.join(Category)\
+        .options(db.contains_eager(SubCategory.category))\
+        .order_by(Category.name, SubCategory.order, SubCategory.name).all()
     return render_template('admin/subcategories.html', subcategories=subcategories)
 
 @admin_bp.route('/subcategory/new', methods=['GET', 'POST'])
@@ -173,12 +170,10 @@ def subcategory_new():
             flash('Please select a category', 'error')
             return redirect(url_for('admin.subcategory_new'))
         
-        slug = slugify(name)
-        
         # Check if subcategory exists in this category
-        existing = SubCategory.query.filter_by(
-            category_id=category_id, 
-            slug=slug
+        existing = SubCategory.query.filter(
+            SubCategory.category_id == category_id,
+            db.func.lower(SubCategory.name) == name.lower()
         ).first()
         
         if existing:
@@ -187,14 +182,14 @@ def subcategory_new():
         
         subcategory = SubCategory(
             name=name,
-            slug=slug,
             description=description,
             category_id=category_id,
             order=order
         )
         
         db.session.add(subcategory)
-        db.session.commit()
+        commit_with_unique_slug(subcategory, slug_base(name, SubCategory.slug, 'subcategory'),
+                                where=SubCategory.category_id == category_id)
         
         flash(f'Subcategory "{name}" created successfully!', 'success')
         return redirect(url_for('admin.subcategories'))
@@ -224,12 +219,10 @@ def subcategory_edit(id):
             flash('Please select a category', 'error')
             return redirect(url_for('admin.subcategory_edit', id=id))
         
-        slug = slugify(name)
-        
         # Check if subcategory exists (excluding current)
-        existing = SubCategory.query.filter_by(
-            category_id=category_id, 
-            slug=slug
+        existing = SubCategory.query.filter(
+            SubCategory.category_id == category_id,
+            db.func.lower(SubCategory.name) == name.lower()
         ).first()
         
         if existing and existing.id != id:
@@ -237,13 +230,13 @@ def subcategory_edit(id):
             return redirect(url_for('admin.subcategory_edit', id=id))
         
         subcategory.name = name
-        subcategory.slug = slug
         subcategory.description = description
         subcategory.category_id = category_id
         subcategory.order = order
         subcategory.updated_at = datetime.utcnow()
         
-        db.session.commit()
+        commit_with_unique_slug(subcategory, slug_base(name, SubCategory.slug, 'subcategory'),
+                                where=SubCategory.category_id == category_id)
         
         flash(f'Subcategory "{name}" updated successfully!', 'success')
         return redirect(url_for('admin.subcategories'))
@@ -278,14 +271,97 @@ def subcategory_delete(id):
 @login_required
 def articles():
     """List all articles"""
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
+    category_id = request.args.get('category_id', type=int)
     per_page = 20
     
-    articles = Article.query.order_by(Article.updated_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    query = Article.query.options(*Article.listing_options())
+    if category_id:
+        query = query.filter(Article.category_id == category_id)
+    
+    # Most recently updated first; keyset pagination keeps deep pages cheap
+    articles = keyset_paginate(
+        query,
+        [(Article.updated_at, True), (Article.id, True)],
+        cursor=cursor, per_page=per_page
     )
     
-    return render_template('admin/articles.html', articles=articles)
+    # Choices for the filter and the bulk actions; only ids and names are
+    # shown, so plain rows save loading up to a thousand tag objects
+    categories = db.session.execute(
+        db.select(Category.id, Category.name).order_by(Category.name)).all()
+    all_tags = db.session.execute(db.select(Tag.id, Tag.name).order_by(Tag.name)).all()
+    
+    return render_template('admin/articles.html', 
+                         articles=articles,
+                         category_id=category_id,
+                         categories=categories,
+                         all_tags=all_tags)
+
+# Bulk actions: form value -> (operation, fixed arguments, past tense)
+_BULK_ACTIONS = {
+    'publish': (set_published, {'published': True}, 'Published'),
+    'unpublish': (set_published, {'published': False}, 'Unpublished'),
+    'feature': (set_featured, {'featured': True}, 'Featured'),
+    'unfeature': (set_featured, {'featured': False}, 'Unfeatured'),
+    'add_tag': (add_tags, {}, 'Tagged'),
+    'remove_tag': (remove_tags, {}, 'Untagged'),
+    'move': (move_articles, {}, 'Moved'),
+    'delete': (delete_articles, {}, 'Deleted'),
+}
+
+@admin_bp.route('/articles/bulk', methods=['POST'])
+@login_required
+def articles_bulk():
+    """Apply one action to many articles in a single transaction"""
+    action = request.form.get('action')
+    filter_category_id = request.form.get('filter_category_id', type=int)
+    back = redirect(url_for('admin.articles', category_id=filter_category_id))
+    
+    if action not in _BULK_ACTIONS:
+        flash('Choose an action', 'error')
+        return back
+    operation, arguments, done = _BULK_ACTIONS[action]
+    arguments = dict(arguments)
+    
+    # Either the checked articles or every article the list is showing
+    if request.form.get('all_matching') == 'on':
+        query = db.select(Article.id)
+        if filter_category_id:
+            query = query.where(Article.category_id == filter_category_id)
+        article_ids = db.session.execute(query).scalars().all()
+    else:
+        article_ids = request.form.getlist('article_ids', type=int)
+    
+    if not article_ids:
+        flash('Select at least one article', 'error')
+        return back
+    
+    if action in ('add_tag', 'remove_tag'):
+        tag_id = request.form.get('tag_id', type=int)
+        if not tag_id:
+            flash('Please select a tag', 'error')
+            return back
+        arguments['tag_ids'] = [tag_id]
+    elif action == 'move':
+        category = db.session.get(Category, request.form.get('category_id', type=int) or 0)
+        if category is None:
+            flash('Please select a category', 'error')
+            return back
+        subcategory_id = request.form.get('subcategory_id', type=int) or None
+        if subcategory_id is not None:
+            subcategory = db.session.get(SubCategory, subcategory_id)
+            if subcategory is None or subcategory.category_id != category.id:
+                flash('The subcategory does not belong to that category', 'error')
+                return back
+        arguments.update(category_id=category.id, subcategory_id=subcategory_id)
+    
+    tags = operation(article_ids, **arguments)
+    db.session.commit()
+    notify_content_changed(tags)
+    
+    flash(f'{done} {len(article_ids)} article(s).', 'success')
+    return back
 
 @admin_bp.route('/article/new', methods=['GET', 'POST'])
 @login_required
@@ -315,18 +391,8 @@ def article_new():
             flash('Please select a category', 'error')
             return redirect(url_for('admin.article_new'))
         
-        slug = slugify(title)
-        
-        # Ensure unique slug
-        original_slug = slug
-        counter = 1
-        while Article.query.filter_by(slug=slug).first():
-            slug = f"{original_slug}-{counter}"
-            counter += 1
-        
         article = Article(
             title=title,
-            slug=slug,
             content=content,
             summary=summary,
             category_id=category_id,
@@ -342,10 +408,9 @@ def article_new():
             tags = Tag.query.filter(Tag.id.in_(tag_ids)).all()
             article.tags = tags
         
-        article.update_search_vector()
-        
         db.session.add(article)
-        db.session.commit()
+        warm_markdown_cache(content)
+        commit_with_unique_slug(article, slug_base(title, Article.slug, 'article'))
         
         flash(f'Article "{title}" created successfully!', 'success')
         return redirect(url_for('admin.articles'))
@@ -385,19 +450,10 @@ def article_edit(id):
             flash('Please select a category', 'error')
             return redirect(url_for('admin.article_edit', id=id))
         
-        # Update slug if title changed
-        new_slug = slugify(title)
-        if new_slug != article.slug:
-            # Ensure unique slug
-            original_slug = new_slug
-            counter = 1
-            while Article.query.filter_by(slug=new_slug).filter(Article.id != id).first():
-                new_slug = f"{original_slug}-{counter}"
-                counter += 1
-            article.slug = new_slug
-        
         was_published = article.is_published
         
+        warm_markdown_cache(content, previous=article.content)
+        
         article.title = title
         article.content = content
         article.summary = summary
@@ -417,9 +473,8 @@ def article_edit(id):
         if is_published and not was_published:
             article.published_at = datetime.utcnow()
         
-        article.update_search_vector()
-        
-        db.session.commit()
+        # Slug follows the title
+        commit_with_unique_slug(article, slug_base(title, Article.slug, 'article'))
         
         flash(f'Article "{title}" updated successfully!', 'success')
         return redirect(url_for('admin.articles'))
@@ -437,12 +492,64 @@ def article_delete(id):
     article = Article.query.get_or_404(id)
     
     title = article.title
+    discard_markdown_cache(article.content)
     db.session.delete(article)
     db.session.commit()
     
     flash(f'Article "{title}" deleted successfully!', 'success')
     return redirect(url_for('admin.articles'))
 
+@admin_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def article_import():
+    """Import articles from an uploaded NDJSON file, tar of Markdown or .md file"""
+    from app.importer import ArticleImporter, iter_upload, RecordError
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Choose a file to import!', 'error')
+            return redirect(url_for('admin.article_import'))
+
+        importer = ArticleImporter(
+            author_id=current_user.id,
+            create_categories=request.form.get('create_categories') == 'on',
+            skip_existing=request.form.get('skip_existing') == 'on'
+        )
+        try:
+            result = importer.run(iter_upload(upload.stream, upload.filename))
+        except RecordError as error:
+            flash(f'Cannot import {upload.filename}: {error}', 'error')
+            return redirect(url_for('admin.article_import'))
+
+        flash(f'Imported {result.imported} of {result.read} articles '
+              f'({result.skipped} skipped, {result.error_count} errors) '
+              f'in {result.elapsed:.1f}s.', 'success' if not result.error_count else 'warning')
+        for message in result.errors[:10]:
+            flash(message, 'error')
+        return redirect(url_for('admin.articles'))
+
+    return render_template('admin/import.html')
+
+@admin_bp.route('/export')
+@login_required
+def export():
+    """Download the whole knowledge base as NDJSON or a tar of Markdown"""
+    from flask import Response, stream_with_context
+    from app.exporter import EXPORT_FORMATS, export_stream, export_filename
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        flash('Unknown export format', 'error')
+        return redirect(url_for('admin.articles'))
+    
+    # Streamed as it is read, so memory use does not grow with the corpus
+    return Response(
+        stream_with_context(export_stream(export_format)),
+        mimetype='application/x-ndjson' if export_format == 'ndjson' else 'application/gzip',
+        headers={'Content-Disposition': f'attachment; filename={export_filename(export_format)}'}
+    )
+
 @admin_bp.route('/api/subcategories/<int:category_id>')
 @login_required
 def api_subcategories(category_id):
@@ -466,7 +573,9 @@ def api_subcategories(category_id):
 def tags():
     """List all tags"""
     tags = Tag.query.order_by(Tag.name).all()
-    return render_template('admin/tags.html', tags=tags)
+    return render_template('admin/tags.html', 
+                         tags=tags,
+                         article_counts=article_counts_by_tag())
 
 @admin_bp.route('/tag/new', methods=['GET', 'POST'])
 @login_required
@@ -487,16 +596,14 @@ def tag_new():
             flash(f'Tag "{name}" already exists!', 'error')
             return redirect(url_for('admin.tag_new'))
         
-        slug = slugify(name)
         tag = Tag(
             name=name,
-            slug=slug,
             description=description,
             color=color
         )
         
         db.session.add(tag)
-        db.session.commit()
+        commit_with_unique_slug(tag, slug_base(name, Tag.slug, 'tag'))
         
         flash(f'Tag "{name}" created successfully!', 'success')
         return redirect(url_for('admin.tags'))
@@ -525,11 +632,10 @@ def tag_edit(id):
             return redirect(url_for('admin.tag_edit', id=id))
         
         tag.name = name
-        tag.slug = slugify(name)
         tag.description = description
         tag.color = color
         
-        db.session.commit()
+        commit_with_unique_slug(tag, slug_base(name, Tag.slug, 'tag'))
         
         flash(f'Tag "{name}" updated successfully!', 'success')
         return redirect(url_for('admin.tags'))
@@ -548,3 +654,27 @@ def tag_delete(id):
     
     flash(f'Tag "{name}" deleted successfully!', 'success')
     return redirect(url_for('admin.tags'))
+
+# ==========================================
+# Request Metrics
+# ==========================================
+
+@admin_bp.route('/metrics')
+@login_required
+def metrics():
+    """Per-endpoint request timings of this worker (PROFILING_ENABLED)"""
+    profiling = current_app.extensions.get('profiling')
+    return render_template('admin/metrics.html',
+                         profiling=profiling,
+                         started=datetime.fromtimestamp(profiling.started) if profiling else None,
+                         endpoints=profiling.snapshot() if profiling else [])
+
+@admin_bp.route('/metrics/reset', methods=['POST'])
+@login_required
+def metrics_reset():
+    """Clear the collected request timings"""
+    profiling = current_app.extensions.get('profiling')
+    if profiling:
+        profiling.reset()
+        flash('Request metrics reset.', 'success')
+    return redirect(url_for('admin.metrics'))
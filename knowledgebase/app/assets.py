@@ -0,0 +1,176 @@
+"""
+Static asset pipeline
+
+Stylesheets and scripts live as plain files under ``static/css`` and
+``static/js`` (one stylesheet per page under ``css/pages``, next to the
+shared ``style.css``). ``flask build-assets`` minifies each of them, names
+the result after a hash of its content and writes it, plus gzip and
+(when the optional ``brotli`` package is installed) brotli copies, to
+``static/dist`` together with ``manifest.json``.
+
+Templates link assets with ``asset_url('css/style.css')``. With a built
+manifest that points at ``/assets/<hashed name>``, served with a one-year
+immutable Cache-Control and the best precompressed copy the browser
+accepts; without one it falls back to the source file, so development
+needs no build step.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import NotFound
+
+DIST_DIR = 'dist'
+MANIFEST = 'manifest.json'
+
+# Asset sources, relative to the static folder
+SOURCE_DIRS = ('css', 'js')
+SOURCE_EXTENSIONS = ('.css', '.js')
+
+# Precompressed copies, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# Built names change whenever the content does, so browsers may keep them
+MAX_AGE = 365 * 24 * 3600
+
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,])\s*')
+
+
+def minify_css(source):
+    """Drop comments and insignificant whitespace from a stylesheet"""
+    css = _CSS_COMMENT_RE.sub('', source)
+    css = _CSS_SPACE_RE.sub(' ', css)
+    css = _CSS_PUNCTUATION_RE.sub(r'\1', css)
+    css = css.replace(';}', '}')
+    return css.strip() + '\n'
+
+
+def minify_js(source):
+    """
+    Conservatively shrink a script
+
+    Indentation, blank lines and whole-line ``//`` comments are removed;
+    lines inside multi-line template literals are kept verbatim. Statements
+    are never joined, so automatic semicolon insertion is unaffected.
+    """
+    lines = []
+    in_template = False
+    for line in source.splitlines():
+        if in_template:
+            lines.append(line)
+        else:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('//'):
+                lines.append(stripped)
+        if (line.count('`') - line.count('\\`')) % 2:
+            in_template = not in_template
+    return '\n'.join(lines) + '\n'
+
+
+_MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _sources(static_folder):
+    for directory in SOURCE_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, directory)):
+            for name in sorted(files):
+                if name.endswith(SOURCE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield os.path.relpath(path, static_folder).replace(os.sep, '/')
+
+
+def _compressors():
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        pass
+    else:
+        compressors.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def build_assets(static_folder):
+    """
+    Minify, fingerprint and precompress every asset source
+
+    Returns:
+        The manifest, mapping source names to built names under ``dist``
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    compressors = _compressors()
+    manifest = {}
+    for name in _sources(static_folder):
+        base, extension = os.path.splitext(name)
+        with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+            data = _MINIFIERS[extension](f.read()).encode('utf-8')
+
+        built = f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{extension}'
+        path = os.path.join(dist, built)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        for suffix, compress in compressors:
+            with open(path + suffix, 'wb') as f:
+                f.write(compress(data))
+        manifest[name] = built
+
+    with open(os.path.join(dist, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Read the built manifest, or None if assets have not been built"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def asset_url(name):
+    """URL of the built asset for source ``name`` (e.g. ``'css/style.css'``)"""
+    manifest = current_app.extensions.get('assets')
+    if manifest and name in manifest:
+        return url_for('assets', filename=manifest[name])
+    return url_for('static', filename=name)
+
+
+def serve_asset(filename):
+    """Serve a built asset, precompressed if the client accepts it"""
+    directory = os.path.join(current_app.static_folder, DIST_DIR)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    response = None
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding]:
+            try:
+                response = send_from_directory(directory, filename + suffix,
+                                               mimetype=mimetype, max_age=MAX_AGE)
+            except NotFound:
+                continue
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(directory, filename, mimetype=mimetype, max_age=MAX_AGE)
+
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Load the asset manifest and register asset_url() and /assets/"""
+    app.extensions['assets'] = load_manifest(app.static_folder)
+    # Pages link the built names, so their validators must change with them
+    app.extensions['assets_version'] = hashlib.sha1(
+        json.dumps(app.extensions['assets'], sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    app.add_template_global(asset_url)
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
@@ -0,0 +1,233 @@
+"""
+Bulk article operations
+
+Each operation changes any number of articles with a few set-based
+statements (UPDATE/DELETE on articles, INSERT/DELETE on article_tags) in
+the current transaction, instead of loading and flushing every article.
+Article ids go into ``IN (...)`` lists of at most 500 values, one
+statement per chunk, so that "all matching" actions on large lists stay
+within SQLite's limit on bound parameters. Statements like these bypass
+the session hooks, so every operation also
+recounts the published counters of the categories, subcategories and
+tags the articles belonged to before and after, and returns the
+dependency tags to pass to notify_content_changed() after the commit.
+The full-text index is kept current by its triggers.
+
+    tags = move_articles(ids, category_id=3)
+    db.session.commit()
+    notify_content_changed(tags)
+"""
+from datetime import datetime
+from app import db
+from app.counters import recount_published_articles
+from app.markdown_cache import discard_markdown_caches
+from app.models import Article, Tag, article_tags
+from app.signals import article_dependency_tags
+
+_articles = Article.__table__
+
+# Article ids per IN (...) list
+_CHUNK = 500
+
+
+def _chunks(items, size=_CHUNK):
+    items = list(items)
+    for first in range(0, len(items), size):
+        yield items[first:first + size]
+
+
+class _Owners:
+    """Categories, subcategories and tags of a set of articles"""
+
+    def __init__(self):
+        self.category_ids = set()
+        self.subcategory_ids = set()
+        self.tag_ids = set()
+
+    def load(self, article_ids, tags=True):
+        for chunk in _chunks(article_ids):
+            for category_id, subcategory_id in db.session.execute(
+                    db.select(_articles.c.category_id, _articles.c.subcategory_id)
+                    .where(_articles.c.id.in_(chunk))
+                    .distinct()):
+                self.category_ids.add(category_id)
+                if subcategory_id is not None:
+                    self.subcategory_ids.add(subcategory_id)
+            if tags:
+                self.tag_ids.update(db.session.execute(
+                    db.select(article_tags.c.tag_id)
+                    .where(article_tags.c.article_id.in_(chunk))
+                    .distinct()
+                ).scalars())
+        return self
+
+    def tags(self, article_ids):
+        """Dependency tags of a change to ``article_ids``"""
+        return {'articles', 'categories'} | article_dependency_tags(
+            article_ids=article_ids,
+            category_ids=self.category_ids,
+            subcategory_ids=self.subcategory_ids,
+            tag_ids=self.tag_ids
+        )
+
+    def finish(self, article_ids):
+        """Recount the owners; return the dependency tags of the change"""
+        recount_published_articles(self.category_ids, self.subcategory_ids, self.tag_ids)
+        return self.tags(article_ids)
+
+
+def _existing_ids(article_ids):
+    ids = []
+    for chunk in _chunks(sorted(set(article_ids))):
+        ids.extend(db.session.execute(
+            db.select(_articles.c.id).where(_articles.c.id.in_(chunk))
+        ).scalars())
+    return ids
+
+
+def _update(article_ids, *criteria, **values):
+    values.setdefault('updated_at', datetime.utcnow())
+    for chunk in _chunks(article_ids):
+        db.session.execute(
+            _articles.update()
+            .where(_articles.c.id.in_(chunk), *criteria)
+            .values(**values)
+        )
+
+
+def set_published(article_ids, published):
+    """
+    Publish or unpublish articles
+
+    Articles published for the first time get a publication date, as in
+    the article editor; the others keep theirs.
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    if not ids:
+        return set()
+    owners = _Owners().load(ids)
+    if published:
+        _update(ids, _articles.c.is_published == False,
+                is_published=True, published_at=datetime.utcnow())
+    else:
+        _update(ids, _articles.c.is_published == True, is_published=False)
+    return owners.finish(ids)
+
+
+def set_featured(article_ids, featured):
+    """
+    Mark or unmark articles as featured
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    if not ids:
+        return set()
+    owners = _Owners().load(ids)
+    _update(ids, _articles.c.is_featured != featured, is_featured=featured)
+    # Counts do not change, but the pages listing the articles do
+    return owners.tags(ids)
+
+
+def move_articles(article_ids, category_id, subcategory_id=None):
+    """
+    Move articles to a category (and optionally one of its subcategories)
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    if not ids:
+        return set()
+    owners = _Owners().load(ids, tags=False)
+    _update(ids, category_id=category_id, subcategory_id=subcategory_id)
+    owners.category_ids.add(category_id)
+    if subcategory_id is not None:
+        owners.subcategory_ids.add(subcategory_id)
+    return owners.finish(ids)
+
+
+def add_tags(article_ids, tag_ids):
+    """
+    Tag articles, skipping links that already exist
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    tag_ids = set(db.session.execute(
+        db.select(Tag.id).where(Tag.id.in_(set(tag_ids)))
+    ).scalars())
+    if not ids or not tag_ids:
+        return set()
+    existing = set()
+    for chunk in _chunks(ids):
+        existing.update(tuple(row) for row in db.session.execute(
+            db.select(article_tags.c.article_id, article_tags.c.tag_id)
+            .where(article_tags.c.article_id.in_(chunk), article_tags.c.tag_id.in_(tag_ids))
+        ))
+    links = [{'article_id': article_id, 'tag_id': tag_id}
+             for article_id in ids for tag_id in tag_ids
+             if (article_id, tag_id) not in existing]
+    if links:
+        db.session.execute(article_tags.insert(), links)
+        _update(sorted({link['article_id'] for link in links}))
+    recount_published_articles((), (), tag_ids)
+    owners = _Owners().load(ids, tags=False)
+    owners.tag_ids = tag_ids
+    return owners.tags(ids)
+
+
+def remove_tags(article_ids, tag_ids):
+    """
+    Untag articles
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    tag_ids = set(tag_ids)
+    if not ids or not tag_ids:
+        return set()
+    untagged = []
+    for chunk in _chunks(ids):
+        untagged.extend(db.session.execute(
+            db.select(article_tags.c.article_id)
+            .where(article_tags.c.article_id.in_(chunk), article_tags.c.tag_id.in_(tag_ids))
+            .distinct()
+        ).scalars())
+    for chunk in _chunks(untagged):
+        db.session.execute(
+            article_tags.delete()
+            .where(article_tags.c.article_id.in_(chunk), article_tags.c.tag_id.in_(tag_ids))
+        )
+    if untagged:
+        _update(untagged)
+    recount_published_articles((), (), tag_ids)
+    owners = _Owners().load(ids, tags=False)
+    owners.tag_ids = tag_ids
+    return owners.tags(ids)
+
+
+def delete_articles(article_ids):
+    """
+    Delete articles with their tag links and cached renderings
+
+    Returns:
+        Dependency tags of the change
+    """
+    ids = _existing_ids(article_ids)
+    if not ids:
+        return set()
+    owners = _Owners().load(ids)
+    for chunk in _chunks(ids):
+        discard_markdown_caches(db.session.execute(
+            db.select(_articles.c.content).where(_articles.c.id.in_(chunk))
+        ).scalars())
+        db.session.execute(article_tags.delete().where(article_tags.c.article_id.in_(chunk)))
+        db.session.execute(_articles.delete().where(_articles.c.id.in_(chunk)))
+    return owners.finish(ids)
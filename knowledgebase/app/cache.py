@@ -0,0 +1,389 @@
+"""
+Caching primitives: an in-process LRU and pluggable shared backends
+"""
+import contextlib
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import g
+from app.db_routing import replica_lag
+from app.metrics import cache_lookup
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded least-recently-used cache
+
+    Once ``maxsize`` entries are stored, adding a new one evicts the entry
+    that was used least recently.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key``, marking it recently used"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store ``value`` under ``key``, evicting old entries if needed"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove ``key`` if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry"""
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+# ==========================================
+# Shared cache backends
+# ==========================================
+
+class CacheBackend:
+    """
+    Key/value store interface used by the page cache
+
+    ``timeout`` is in seconds; 0 or None means the entry never expires.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, timeout=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class NullBackend(CacheBackend):
+    """Backend that stores nothing (caching disabled)"""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """
+    Per-process LRU backend
+
+    Fastest, but each worker process has its own copy, so invalidations
+    made in one worker are not seen by the others until entries expire.
+    """
+
+    def __init__(self, maxsize=512):
+        self._cache = LRUCache(maxsize)
+
+    def get(self, key):
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires, value = entry
+        if expires and expires < time.time():
+            self._cache.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else 0
+        self._cache.set(key, (expires, value))
+
+    def delete(self, key):
+        self._cache.delete(key)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class FileSystemBackend(CacheBackend):
+    """
+    Backend storing one pickle file per key in a directory
+
+    Shared by all worker processes on the host. Writes go to a temporary
+    file that is renamed into place, so readers never see partial entries.
+    """
+
+    def __init__(self, directory, threshold=5000):
+        self.directory = directory
+        self.threshold = threshold
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires and expires < time.time():
+            self.delete(key)
+            return None
+        return value
+
+    def set(self, key, value, timeout=None):
+        expires = time.time() + timeout if timeout else 0
+        self._prune()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+    def delete(self, key):
+        with contextlib.suppress(OSError):
+            os.remove(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(self.directory, name))
+
+    def _prune(self):
+        """Drop the oldest files once the directory holds too many"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        if len(names) < self.threshold:
+            return
+        paths = [os.path.join(self.directory, name) for name in names]
+        paths.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in paths[:len(paths) - self.threshold // 2]:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+class RedisBackend(CacheBackend):
+    """
+    Backend for Redis or any client exposing get/mget/set/delete
+
+    Args:
+        client: Redis client (or compatible stand-in)
+        prefix: Prefix for every key, to share a Redis database safely
+    """
+
+    def __init__(self, client, prefix='kb:'):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """Connect with redis-py (optional dependency)"""
+        import redis
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def get(self, key):
+        return self._load(self.client.get(self.prefix + key))
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [self._load(data) for data in self.client.mget([self.prefix + key for key in keys])]
+
+    def set(self, key, value, timeout=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self.client.set(self.prefix + key, data, ex=timeout or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    @staticmethod
+    def _load(data):
+        return pickle.loads(data) if data is not None else None
+
+
+def create_backend(config, prefix):
+    """
+    Build a backend from ``<prefix>_*`` configuration keys
+
+    ``<prefix>_BACKEND`` selects 'memory', 'filesystem', 'redis' or 'null'.
+    """
+    kind = (config.get(f'{prefix}_BACKEND') or 'null').lower()
+    if kind == 'memory':
+        return MemoryBackend(config.get(f'{prefix}_MEMORY_SIZE', 512))
+    if kind == 'filesystem':
+        return FileSystemBackend(config[f'{prefix}_DIR'],
+                                 config.get(f'{prefix}_THRESHOLD', 5000))
+    if kind == 'redis':
+        client = config.get(f'{prefix}_REDIS_CLIENT')
+        if client is not None:
+            return RedisBackend(client)
+        return RedisBackend.from_url(config[f'{prefix}_REDIS_URL'])
+    if kind == 'null':
+        return NullBackend()
+    raise ValueError(f'Unknown {prefix}_BACKEND: {kind!r}')
+
+
+# ==========================================
+# Tag-invalidated entries
+# ==========================================
+
+class TaggedCache:
+    """
+    Entries that depend on dependency tags (see app.signals)
+
+    Each entry records the current version token of every tag it depends
+    on. Invalidating a tag replaces its token, which makes every entry
+    depending on it stale on the next lookup; nothing else is purged.
+
+    Tokens live in the same backend as the entries and may be evicted or
+    pruned before them. A tag without a token gets a new one when an entry
+    depending on it is stored, so stored versions are never None, and an
+    entry whose tag token has gone missing is stale: it may have been
+    invalidated in the meantime.
+
+    The versions are read when the entry is stored, after its value was
+    rendered, so an invalidation in between would be recorded as already
+    included. Callers pass set() the time they started reading the data
+    instead (see render_started()), and nothing is stored if any tag was
+    invalidated after it, or if the time of the latest invalidation has
+    gone missing as well.
+    """
+
+    _TAG_PREFIX = 'tag:'
+
+    # Time of the latest invalidation of any tag
+    _CHANGED_KEY = 'tag:*'
+
+    def __init__(self, backend, prefix, timeout=300):
+        self.backend = backend
+        self.prefix = prefix
+        self.timeout = timeout
+
+    def _tag_versions(self, tags):
+        tags = sorted(tags)
+        return dict(zip(tags, self.backend.get_many([self._TAG_PREFIX + tag for tag in tags])))
+
+    def get(self, key):
+        """Return the value cached under ``key`` if none of its tags changed"""
+        entry = self.backend.get(self.prefix + key)
+        if entry is not None and ('value' not in entry
+                                  or None in entry['tags'].values()
+                                  or self._tag_versions(entry['tags']) != entry['tags']):
+            self.backend.delete(self.prefix + key)
+            entry = None
+        cache_lookup(self.prefix.rstrip(':'), entry is not None)
+        return entry['value'] if entry is not None else None
+
+    def set(self, key, value, tags, timeout=None, since=None):
+        """
+        Store ``value`` under ``key``, depending on ``tags``
+
+        Args:
+            key: Cache key
+            value: Value to store
+            tags: Dependency tags of the value
+            timeout: Seconds to keep it (default: the cache's timeout)
+            since: ``time.time()`` from before the data in ``value`` was
+                read; nothing is stored if any tag was invalidated since
+
+        Returns:
+            Whether ``value`` was stored
+        """
+        # Versions first: invalidate() records the time before replacing
+        # them, so a new version read here comes with a new time below.
+        # Missing tokens are written before the time is read too: an
+        # invalidation after that replaces them, an earlier one is seen.
+        versions = self._tag_versions(tags)
+        for tag, version in versions.items():
+            if version is None:
+                versions[tag] = uuid.uuid4().hex
+                self.backend.set(self._TAG_PREFIX + tag, versions[tag])
+        if since is not None:
+            changed = self.backend.get(self._CHANGED_KEY)
+            if changed is None:
+                # Evicted (or never invalidated): unknown, so assume now
+                self.backend.set(self._CHANGED_KEY, time.time())
+                return False
+            if changed >= since:
+                return False
+        entry = {'value': value, 'tags': versions}
+        self.backend.set(self.prefix + key, entry, timeout or self.timeout)
+        return True
+
+    def invalidate(self, tags):
+        """Make every entry that depends on any of ``tags`` stale"""
+        self.backend.set(self._CHANGED_KEY, time.time())
+        for tag in tags:
+            self.backend.set(self._TAG_PREFIX + tag, uuid.uuid4().hex)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def render_started():
+    """
+    Time from which the data of the response being rendered may date
+
+    The first call in a request records it, so cached_page() calls this
+    before its view runs. Reads from a read replica may be up to
+    REPLICA_STICKY_SECONDS behind the primary, so the time is moved back
+    by that much for them. Pass the result as ``since`` to
+    TaggedCache.set().
+    """
+    started = g.get('render_started')
+    if started is None:
+        started = g.render_started = time.time()
+    return started - replica_lag()
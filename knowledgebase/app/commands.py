@@ -0,0 +1,198 @@
+"""
+Maintenance CLI Commands
+
+Registered on the application by create_app(); run with ``flask <command>``.
+"""
+import click
+from app import db
+from app.models import Article
+from app.exporter import EXPORT_FORMATS
+from app.utils import build_search_document
+
+
+def create_schema():
+    """Create missing tables and the full-text search index"""
+    from app.search import ensure_search_index
+
+    # Only on the primary: read replicas get the schema by replication
+    db.create_all(bind_key=None)
+    ensure_search_index()
+
+
+def register_commands(app):
+    """Attach the maintenance commands to the Flask CLI"""
+
+    @app.cli.command('create-schema')
+    def create_schema_command():
+        """Create missing database tables and the search index"""
+        create_schema()
+        click.echo('Database schema is up to date')
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Minify, fingerprint and precompress static CSS and JS"""
+        from app.assets import build_assets
+
+        manifest = build_assets(app.static_folder)
+        click.echo(f'Built {len(manifest)} assets')
+
+    @app.cli.command('compile-templates')
+    def compile_templates():
+        """Compile every template into the bytecode cache"""
+        if app.jinja_env.bytecode_cache is None:
+            raise click.ClickException('TEMPLATE_BYTECODE_CACHE_DIR is not set')
+        names = app.jinja_env.list_templates(extensions=['html'])
+        for name in names:
+            app.jinja_env.get_template(name)
+        click.echo(f'Compiled {len(names)} templates')
+
+    @app.cli.command('reindex-search')
+    @click.option('--batch-size', default=500, show_default=True,
+                  help='Articles rebuilt per transaction.')
+    def reindex_search(batch_size):
+        """Rebuild Article.search_vector and the full-text index"""
+        from app.search import ensure_search_index, rebuild_search_index
+
+        ensure_search_index()
+
+        columns = (Article.id, Article.title, Article.summary, Article.content)
+        total = 0
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                db.select(*columns)
+                .where(Article.id > last_id)
+                .order_by(Article.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+
+            db.session.execute(db.update(Article), [
+                {'id': row.id,
+                 'search_vector': build_search_document(row.title, row.summary, row.content)}
+                for row in rows
+            ])
+            db.session.commit()
+
+            total += len(rows)
+            last_id = rows[-1].id
+
+        if rebuild_search_index():
+            click.echo('✓ Full-text index rebuilt')
+        click.echo(f'✓ Search documents rebuilt for {total} articles')
+
+    @app.cli.command('warm-markdown-cache')
+    @click.option('--batch-size', default=200, show_default=True,
+                  help='Articles rendered per transaction.')
+    def warm_markdown_cache_command(batch_size):
+        """Store the rendered HTML of every article and prune unused renderings"""
+        from app.markdown_cache import warm_all_markdown_caches
+
+        stored, deleted = warm_all_markdown_caches(batch_size)
+        click.echo(f'✓ Stored {stored} renderings, removed {deleted} unused ones')
+
+    @app.cli.command('recount')
+    def recount():
+        """Repair published article counters on categories, subcategories and tags"""
+        from app.counters import recount_published_articles
+
+        recount_published_articles()
+        db.session.commit()
+        click.echo('✓ Published article counts recomputed')
+
+    @app.cli.command('build-related')
+    def build_related():
+        """Recompute the related articles of every published article"""
+        import time
+        from app.related import build_related_articles
+        from app.signals import notify_content_changed
+
+        started = time.perf_counter()
+        total = build_related_articles()
+        db.session.commit()
+        notify_content_changed({'related'})
+        click.echo(f'✓ Related articles built for {total} articles '
+                   f'in {time.perf_counter() - started:.1f}s')
+
+    @app.cli.command('refresh-related')
+    def refresh_related():
+        """Refresh the related articles of articles changed since the last refresh"""
+        from app.related import refresh_stale_related_articles
+
+        count = refresh_stale_related_articles(rebuild=True)
+        click.echo(f'✓ Related articles refreshed for {count} changed articles')
+
+    @app.cli.command('import-articles')
+    @click.argument('source', type=click.Path(exists=True))
+    @click.option('--batch-size', default=500, show_default=True,
+                  help='Articles inserted per transaction.')
+    @click.option('--author', help='Username recorded as the author.')
+    @click.option('--skip-existing', is_flag=True,
+                  help='Skip articles whose slug already exists instead of suffixing it.')
+    @click.option('--no-create-categories', 'create_categories', flag_value=False, default=True,
+                  help='Reject articles in categories that do not exist.')
+    def import_articles(source, batch_size, author, skip_existing, create_categories):
+        """Import articles from a Markdown directory, a tar archive or an NDJSON file"""
+        from app.importer import ArticleImporter, iter_path
+        from app.related import refresh_stale_related_articles
+        from app.models import User
+
+        author_id = None
+        if author:
+            author_id = db.session.execute(
+                db.select(User.id).where(User.username == author)
+            ).scalar()
+            if author_id is None:
+                raise click.ClickException(f'No user named {author!r}')
+
+        def progress(result):
+            click.echo(f'  batch {result.batches}: {result.imported} imported, '
+                       f'{result.rate:.0f} articles/s')
+
+        importer = ArticleImporter(
+            author_id=author_id,
+            batch_size=batch_size,
+            create_categories=create_categories,
+            skip_existing=skip_existing,
+            progress=progress
+        )
+        result = importer.run(iter_path(source))
+
+        for message in result.errors:
+            click.echo(f'✗ {message}', err=True)
+        if result.error_count > len(result.errors):
+            click.echo(f'✗ ... {result.error_count - len(result.errors)} more errors', err=True)
+        click.echo(f'✓ Imported {result.imported} of {result.read} articles '
+                   f'({result.skipped} skipped, {result.error_count} errors) '
+                   f'in {result.elapsed:.1f}s, {result.rate:.0f} articles/s')
+
+        if refresh_stale_related_articles(rebuild=True):
+            click.echo('✓ Related articles updated')
+
+    @app.cli.command('export')
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+    @click.option('--format', 'export_format', type=click.Choice(EXPORT_FORMATS),
+                  help='Defaults from the file name: .ndjson/.jsonl or .tar.gz.')
+    def export(output, export_format):
+        """Export categories, tags and articles as NDJSON or a tar of Markdown ('-' for stdout)"""
+        import time
+        from app.exporter import export_stream
+
+        if export_format is None:
+            if output == '-' or output.endswith(('.ndjson', '.jsonl')):
+                export_format = 'ndjson'
+            elif output.endswith(('.tar.gz', '.tgz')):
+                export_format = 'markdown'
+            else:
+                raise click.ClickException('Cannot tell the format from the file name; use --format')
+
+        started = time.perf_counter()
+        size = 0
+        with click.open_file(output, 'wb') as f:
+            for chunk in export_stream(export_format):
+                f.write(chunk)
+                size += len(chunk)
+        if output != '-':
+            click.echo(f'✓ Exported {size / 1024 / 1024:.1f} MB to {output} '
+                       f'in {time.perf_counter() - started:.1f}s')
@@ -0,0 +1,125 @@
+"""
+Response compression
+
+Text responses (HTML, JSON, CSS, JS, ...) of at least COMPRESS_MIN_SIZE
+bytes are compressed with brotli (when the optional ``brotli`` package is
+installed) or gzip, whichever the client prefers. Streamed responses and
+responses that already carry a Content-Encoding (such as prebuilt assets)
+are left alone.
+
+A compressed body is a different representation, so its ETag is made
+weak; conditional GETs compare weakly and keep matching. The page cache
+stores bodies precompressed via compress_variants(), so cached pages are
+compressed once per cache fill rather than once per request.
+"""
+import gzip
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Cache fills happen once, so they can afford the slower, denser settings
+_CACHED_LEVELS = {'gzip': 9, 'br': 9}
+
+
+def available_encodings():
+    """Encodings this server can produce, most preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, level=None):
+    """Compress ``data`` with ``encoding`` ('gzip' or 'br')"""
+    config = current_app.config
+    if encoding == 'br':
+        quality = level if level is not None else config.get('COMPRESS_BR_LEVEL', 4)
+        return brotli.compress(data, quality=quality)
+    level = level if level is not None else config.get('COMPRESS_LEVEL', 6)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _enabled():
+    return current_app.config.get('COMPRESS_ENABLED', True)
+
+
+def _compressible_type(response):
+    return response.mimetype in current_app.config.get('COMPRESS_MIMETYPES', ())
+
+
+def is_compressible(response):
+    """Whether ``response`` should be sent compressed, if the client accepts it"""
+    return (
+        _enabled()
+        and response.status_code == 200
+        and not response.direct_passthrough
+        and not response.is_streamed
+        and 'Content-Encoding' not in response.headers
+        and _compressible_type(response)
+        and (response.content_length or 0) >= current_app.config.get('COMPRESS_MIN_SIZE', 500)
+    )
+
+
+def negotiate(encodings):
+    """Pick the client's preferred encoding among ``encodings``, or None"""
+    best, best_quality = None, 0
+    for encoding in encodings:
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress_variants(response):
+    """
+    Compressed copies of a response body, for storing in a cache
+
+    Returns:
+        Dict of encoding to compressed body; empty if the response is not
+        worth compressing
+    """
+    if not is_compressible(response):
+        return {}
+    body = response.get_data()
+    return {encoding: compress(body, encoding, _CACHED_LEVELS[encoding])
+            for encoding in available_encodings()}
+
+
+def mark_encoded(response, encoding, body):
+    """Make ``response`` carry ``body``, compressed with ``encoding``"""
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress_response(response):
+    """after_request hook compressing eligible responses"""
+    if not _enabled():
+        return response
+
+    if response.status_code == 304:
+        # Match the weak validator a compressed 200 would have carried
+        etag, weak = response.get_etag()
+        if etag and not weak and negotiate(available_encodings()):
+            response.set_etag(etag, weak=True)
+        return response
+
+    if not is_compressible(response):
+        if 'Content-Encoding' not in response.headers and _compressible_type(response):
+            response.vary.add('Accept-Encoding')
+        return response
+
+    encoding = negotiate(available_encodings())
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+    return mark_encoded(response, encoding, compress(response.get_data(), encoding))
+
+
+def init_compression(app):
+    """Compress responses of ``app``"""
+    app.after_request(compress_response)
@@ -0,0 +1,75 @@
+"""
+Conditional GET support for public pages
+
+Views compute a strong ETag from the versions (ids and ``updated_at``
+timestamps) of the entities a page shows, and Last-Modified from the
+newest of those timestamps. render_conditional() answers If-None-Match /
+If-Modified-Since with 304 Not Modified before any template is rendered.
+"""
+import hashlib
+from flask import current_app, request, session, render_template
+from flask_login import current_user
+
+
+def version_etag(*parts):
+    """
+    Build a strong ETag from entity versions
+
+    The application and asset versions and the viewing user are mixed in,
+    since templates, asset URLs and the admin navigation also change the
+    page.
+
+    Args:
+        *parts: Hashable descriptions of what the page shows, e.g.
+            ``('article', article.id, article.updated_at)``
+    """
+    digest = hashlib.sha1(repr((
+        current_app.config.get('APP_VERSION'),
+        current_app.extensions.get('assets_version'),
+        current_user.get_id(),
+        parts,
+    )).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def article_versions(articles):
+    """Version parts for listed articles and the category names they show"""
+    return [
+        (article.id, article.updated_at,
+         article.category.updated_at if article.category else None,
+         article.subcategory.updated_at if article.subcategory else None)
+        for article in articles
+    ]
+
+
+def latest(*timestamps):
+    """Return the newest non-empty timestamp, for Last-Modified"""
+    timestamps = [timestamp for timestamp in timestamps if timestamp]
+    return max(timestamps) if timestamps else None
+
+
+def render_conditional(etag, last_modified, template, **context):
+    """
+    Render ``template`` unless the client already has this version
+
+    Returns:
+        A 304 response if the request's validators match, otherwise the
+        rendered page carrying ETag and Last-Modified headers
+    """
+    response = current_app.response_class()
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Let caches keep the page, but make them revalidate before reuse
+    response.cache_control.no_cache = True
+    if current_user.is_authenticated:
+        response.cache_control.private = True
+
+    # Pages showing flashed messages are one-offs and never match
+    if not session.get('_flashes'):
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    response.set_data(render_template(template, **context))
+    return response
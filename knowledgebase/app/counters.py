@@ -0,0 +1,145 @@
+"""
+Denormalized published-article counters
+
+Category, SubCategory and Tag each store ``published_article_count`` so the
+public pages read a plain column instead of aggregating. Session hooks keep
+the counters correct: before a flush they note which categories,
+subcategories and tags the changed articles belonged to, and after the
+flush they recount exactly those rows (old and new owners) in the same
+transaction. Recounting rather than applying +1/-1 deltas means a missed
+update can never accumulate drift; ``flask recount`` repairs rows changed
+outside the ORM.
+"""
+from sqlalchemy import event
+from app import db
+from app.models import Category, SubCategory, Article, Tag, article_tags
+
+_PENDING_KEY = 'published_counts_pending'
+
+# Article attributes whose changes can move a published count
+_COUNTED_ATTRS = ('is_published', 'category_id', 'subcategory_id',
+                  'category', 'subcategory', 'tags')
+
+_articles = Article.__table__
+
+
+def _published_count(*criteria):
+    return db.select(db.func.count()).where(
+        _articles.c.is_published == True, *criteria
+    ).scalar_subquery()
+
+
+def _recount_statements(category_ids, subcategory_ids, tag_ids):
+    """Yield UPDATEs recounting the given ids (None means every row)"""
+    targets = (
+        (Category.__table__, category_ids,
+         lambda table: _published_count(_articles.c.category_id == table.c.id)),
+        (SubCategory.__table__, subcategory_ids,
+         lambda table: _published_count(_articles.c.subcategory_id == table.c.id)),
+        (Tag.__table__, tag_ids,
+         lambda table: db.select(db.func.count())
+            .select_from(article_tags.join(_articles, _articles.c.id == article_tags.c.article_id))
+            .where(article_tags.c.tag_id == table.c.id, _articles.c.is_published == True)
+            .scalar_subquery()),
+    )
+    for table, ids, count in targets:
+        if ids is not None and not ids:
+            continue
+        values = {'published_article_count': count(table)}
+        if 'updated_at' in table.c:
+            # A count changing is not an edit of the row itself
+            values['updated_at'] = table.c.updated_at
+        statement = table.update().values(**values)
+        if ids is not None:
+            statement = statement.where(table.c.id.in_(ids))
+        yield statement
+
+
+def recount_published_articles(category_ids=None, subcategory_ids=None, tag_ids=None,
+                               connection=None):
+    """
+    Recompute published_article_count from the articles table
+
+    Args:
+        category_ids: Category ids to recount (None recounts all)
+        subcategory_ids: SubCategory ids to recount (None recounts all)
+        tag_ids: Tag ids to recount (None recounts all)
+        connection: Connection to use (defaults to the session's)
+    """
+    if connection is None:
+        connection = db.session.connection()
+    for statement in _recount_statements(category_ids, subcategory_ids, tag_ids):
+        connection.execute(statement)
+
+
+def _tag_ids_for(session, article_ids):
+    """Return the tag ids currently linked to ``article_ids`` in the database"""
+    if not article_ids:
+        return set()
+    return set(session.execute(
+        db.select(article_tags.c.tag_id)
+        .where(article_tags.c.article_id.in_(article_ids))
+        .distinct()
+    ).scalars())
+
+
+def _counts_may_change(article):
+    state = db.inspect(article)
+    return any(state.attrs[name].history.has_changes() for name in _COUNTED_ATTRS)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_affected_rows(session, flush_context, instances):
+    """Remember the counters the pending article changes may affect"""
+    changed = [obj for obj in session.new if isinstance(obj, Article)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, Article) and _counts_may_change(obj)]
+    deleted = [obj for obj in session.deleted if isinstance(obj, Article)]
+    if not changed and not deleted:
+        return
+
+    pending = session.info.setdefault(_PENDING_KEY, {
+        'categories': set(), 'subcategories': set(), 'tags': set(), 'articles': [],
+    })
+
+    # Owners before the flush, as still stored in the database
+    stored_ids = [obj.id for obj in changed + deleted if db.inspect(obj).persistent]
+    if stored_ids:
+        for category_id, subcategory_id in session.execute(
+            db.select(_articles.c.category_id, _articles.c.subcategory_id)
+            .where(_articles.c.id.in_(stored_ids))
+        ):
+            pending['categories'].add(category_id)
+            pending['subcategories'].add(subcategory_id)
+        pending['tags'] |= _tag_ids_for(session, stored_ids)
+
+    # Owners after the flush are read once ids and foreign keys are assigned
+    pending['articles'].extend(changed)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _recount_affected_rows(session, flush_context):
+    """Recount the old and new owners of the flushed articles"""
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+
+    articles = [article for article in pending['articles']
+                if not db.inspect(article).deleted and article.id is not None]
+    for article in articles:
+        pending['categories'].add(article.category_id)
+        pending['subcategories'].add(article.subcategory_id)
+    pending['tags'] |= _tag_ids_for(session, [article.id for article in articles])
+
+    recount_published_articles(
+        category_ids=pending['categories'] - {None},
+        subcategory_ids=pending['subcategories'] - {None},
+        tag_ids=pending['tags'],
+        connection=session.connection()
+    )
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_affected_rows(session, previous_transaction):
+    """Forget rows collected for a flush that was rolled back"""
+    session.info.pop(_PENDING_KEY, None)
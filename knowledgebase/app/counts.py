@@ -0,0 +1,30 @@
+"""
+Grouped count queries for listing pages
+
+Each helper returns the counts for every listed row from a single
+GROUP BY query, as a dict keyed by row id, instead of the templates
+running one COUNT query per row. Rows without matches are absent from
+the dict, so templates should read them with ``counts.get(id, 0)``.
+"""
+from app import db
+from app.models import SubCategory, article_tags
+
+
+def _grouped_count(key_column, *criteria, ids=None):
+    """Count rows grouped by ``key_column``, optionally limited to ``ids``"""
+    query = db.session.query(key_column, db.func.count()).filter(*criteria)
+    if ids is not None:
+        if not ids:
+            return {}
+        query = query.filter(key_column.in_(ids))
+    return dict(query.group_by(key_column).all())
+
+
+def subcategory_counts_by_category(ids=None):
+    """Subcategory count per category id"""
+    return _grouped_count(SubCategory.category_id, ids=ids)
+
+
+def article_counts_by_tag(ids=None):
+    """Article count (published or not) per tag id"""
+    return _grouped_count(article_tags.c.tag_id, ids=ids)
@@ -0,0 +1,109 @@
+"""
+Read-replica routing
+
+Larger installs can point ``DATABASE_REPLICA_URLS`` at one or more read
+replicas of the primary database. Each replica becomes a Flask-SQLAlchemy
+bind (``replica_0``, ``replica_1``, ...) and RoutingSession sends plain
+SELECTs there while the request allows it:
+
+- public (``main`` blueprint) GET and HEAD requests, including the search
+  suggestion API, read from a replica picked once per request
+- everything else (admin, auth, CLI) and every flush or write statement
+  uses the primary
+
+After a user commits a change, their browser session is pinned to the
+primary for ``REPLICA_STICKY_SECONDS`` so they read their own writes even
+if the replicas lag behind.
+"""
+import random
+import time
+from contextlib import contextmanager
+from flask import current_app, g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+_STICKY_KEY = 'db_primary_until'
+_WROTE_KEY = 'db_wrote'
+
+
+def _replica_reads_allowed():
+    return has_request_context() and g.get('db_read_replica', False)
+
+
+def replica_lag():
+    """Seconds this request's reads may lag behind the primary (0 if none)"""
+    if _replica_reads_allowed():
+        return current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+    return 0
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside this block, e.g. to refresh a cache"""
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('db_read_replica', False)
+    g.db_read_replica = False
+    try:
+        yield
+    finally:
+        g.db_read_replica = previous
+
+
+class RoutingSession(Session):
+    """Session that sends reads to a replica when the request allows it"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and isinstance(clause, Select) \
+                and _replica_reads_allowed():
+            engine = self._replica_engine()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_engine(self):
+        if 'replica' not in self.info:
+            keys = [key for key in self._db.engines
+                    if key and key.startswith(REPLICA_BIND_PREFIX)]
+            self.info['replica'] = random.choice(keys) if keys else None
+        key = self.info['replica']
+        return self._db.engines[key] if key else None
+
+
+def _choose_database():
+    """Decide whether this request may read from a replica"""
+    g.db_read_replica = (
+        request.blueprint == 'main'
+        and request.method in ('GET', 'HEAD')
+        and session.get(_STICKY_KEY, 0) < time.time()
+    )
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _note_write(db_session, flush_context):
+    db_session.info[_WROTE_KEY] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _stick_to_primary(db_session):
+    if db_session.info.pop(_WROTE_KEY, False) and has_request_context() \
+            and current_app.extensions.get('db_routing'):
+        session[_STICKY_KEY] = time.time() + current_app.config.get('REPLICA_STICKY_SECONDS', 10)
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(db_session):
+    db_session.info.pop(_WROTE_KEY, None)
+
+
+def init_db_routing(app):
+    """Route reads for ``app`` when replicas are configured"""
+    enabled = any(key and key.startswith(REPLICA_BIND_PREFIX)
+                  for key in app.config.get('SQLALCHEMY_BINDS') or {})
+    app.extensions['db_routing'] = enabled
+    if enabled:
+        app.before_request(_choose_database)
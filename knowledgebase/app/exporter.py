@@ -0,0 +1,222 @@
+"""
+Knowledge base export
+
+Writes every category, subcategory, tag and article as a stream, in
+either of the formats app.importer reads back:
+
+- ``ndjson``: one JSON object per line with a ``type`` of ``category``,
+  ``subcategory``, ``tag`` or ``article``; taxonomy lines come first
+- ``markdown``: a gzipped tar of ``<category>/<subcategory>/<slug>.md``
+  files with front matter, plus ``taxonomy.ndjson`` for the category and
+  tag details that front matter does not carry
+
+Articles are read with a server-side cursor in chunks of _YIELD_PER rows
+(their tags with one query per chunk) and every chunk is written out
+before the next is fetched, so memory use does not depend on the number
+of articles. The generators are meant to be passed to a streamed Flask
+response or written to a file as they go.
+"""
+import calendar
+import io
+import json
+import tarfile
+from datetime import datetime
+from app import db
+from app.models import Category, SubCategory, Article, Tag, article_tags
+
+EXPORT_FORMATS = ('ndjson', 'markdown')
+
+# Articles fetched and written per round trip
+_YIELD_PER = 500
+
+TAXONOMY_MEMBER = 'taxonomy.ndjson'
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+# ==========================================
+# Records
+# ==========================================
+
+def taxonomy_records():
+    """Yield a record per category, subcategory and tag"""
+    categories = {}
+    for category in db.session.execute(
+            db.select(Category).order_by(Category.order, Category.name)).scalars():
+        categories[category.id] = category.name
+        yield {
+            'type': 'category',
+            'name': category.name,
+            'slug': category.slug,
+            'description': category.description,
+            'icon': category.icon,
+            'order': category.order,
+        }
+    for subcategory in db.session.execute(
+            db.select(SubCategory).order_by(SubCategory.category_id, SubCategory.order,
+                                            SubCategory.name)).scalars():
+        yield {
+            'type': 'subcategory',
+            'name': subcategory.name,
+            'slug': subcategory.slug,
+            'category': categories[subcategory.category_id],
+            'description': subcategory.description,
+            'order': subcategory.order,
+        }
+    for tag in db.session.execute(db.select(Tag).order_by(Tag.name)).scalars():
+        yield {
+            'type': 'tag',
+            'name': tag.name,
+            'slug': tag.slug,
+            'description': tag.description,
+            'color': tag.color,
+        }
+
+
+def article_records():
+    """Yield a record per article, in id order"""
+    categories = dict(db.session.execute(db.select(Category.id, Category.name)).all())
+    subcategories = dict(db.session.execute(db.select(SubCategory.id, SubCategory.name)).all())
+    tags = dict(db.session.execute(db.select(Tag.id, Tag.name)).all())
+
+    table = Article.__table__
+    result = db.session.execute(
+        db.select(table.c.id, table.c.title, table.c.slug, table.c.summary, table.c.content,
+                  table.c.category_id, table.c.subcategory_id, table.c.is_published,
+                  table.c.is_featured, table.c.created_at, table.c.updated_at,
+                  table.c.published_at)
+        .order_by(table.c.id)
+        .execution_options(yield_per=_YIELD_PER)
+    )
+    for rows in result.partitions():
+        article_tag_names = {}
+        for article_id, tag_id in db.session.execute(
+                db.select(article_tags.c.article_id, article_tags.c.tag_id)
+                .where(article_tags.c.article_id.in_([row.id for row in rows]))):
+            article_tag_names.setdefault(article_id, []).append(tags[tag_id])
+        for row in rows:
+            yield {
+                'type': 'article',
+                'title': row.title,
+                'slug': row.slug,
+                'category': categories[row.category_id],
+                'subcategory': subcategories.get(row.subcategory_id),
+                'tags': sorted(article_tag_names.get(row.id, [])),
+                'summary': row.summary,
+                'published': row.is_published,
+                'featured': row.is_featured,
+                'date': _isoformat(row.created_at),
+                'updated_at': _isoformat(row.updated_at),
+                'published_at': _isoformat(row.published_at),
+                'content': row.content,
+            }
+
+
+# ==========================================
+# Formats
+# ==========================================
+
+def _ndjson_line(record):
+    return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def export_ndjson():
+    """Yield the knowledge base as NDJSON, a chunk of bytes per batch of articles"""
+    yield b''.join(_ndjson_line(record) for record in taxonomy_records())
+    chunk = []
+    for record in article_records():
+        chunk.append(_ndjson_line(record))
+        if len(chunk) >= _YIELD_PER:
+            yield b''.join(chunk)
+            chunk = []
+    if chunk:
+        yield b''.join(chunk)
+
+
+def markdown_document(record):
+    """Markdown with front matter for an article record"""
+    lines = ['---']
+    for key, value in record.items():
+        if key in ('type', 'content') or value is None:
+            continue
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        else:
+            # JSON strings and lists are valid front matter values
+            value = json.dumps(value, ensure_ascii=False)
+        lines.append(f'{key}: {value}')
+    lines.append('---')
+    return '\n'.join(lines) + '\n\n' + record['content']
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file collecting bytes until they are taken"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _add_member(archive, name, data, modified=None):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = calendar.timegm((modified or datetime.utcnow()).timetuple())
+    archive.addfile(info, io.BytesIO(data))
+
+
+def export_markdown_tar():
+    """Yield the knowledge base as a gzipped tar of Markdown files"""
+    category_slugs = dict(db.session.execute(db.select(Category.name, Category.slug)).all())
+    subcategory_slugs = {
+        (category, name): slug for category, name, slug in db.session.execute(
+            db.select(Category.name, SubCategory.name, SubCategory.slug)
+            .select_from(SubCategory)
+            .join(SubCategory.category))
+    }
+
+    output = _Chunks()
+    with tarfile.open(fileobj=output, mode='w|gz') as archive:
+        taxonomy = b''.join(_ndjson_line(record) for record in taxonomy_records())
+        _add_member(archive, TAXONOMY_MEMBER, taxonomy)
+        yield output.take()
+
+        for count, record in enumerate(article_records(), start=1):
+            folders = [category_slugs[record['category']]]
+            subcategory_slug = subcategory_slugs.get((record['category'], record['subcategory']))
+            if subcategory_slug:
+                folders.append(subcategory_slug)
+            modified = datetime.fromisoformat(record['updated_at']) if record['updated_at'] else None
+            _add_member(archive, '/'.join(folders + [record['slug'] + '.md']),
+                        markdown_document(record).encode('utf-8'), modified)
+            if count % _YIELD_PER == 0:
+                yield output.take()
+    yield output.take()
+
+
+def export_stream(format):
+    """Chunks of the export in ``format`` (one of EXPORT_FORMATS)"""
+    if format == 'ndjson':
+        return export_ndjson()
+    if format == 'markdown':
+        return export_markdown_tar()
+    raise ValueError(f'unknown export format {format!r}')
+
+
+def export_filename(format, now=None):
+    """Download name for an export made at ``now``"""
+    stamp = (now or datetime.utcnow()).strftime('%Y%m%d-%H%M%S')
+    extension = 'ndjson' if format == 'ndjson' else 'tar.gz'
+    return f'knowledgebase-{stamp}.{extension}'
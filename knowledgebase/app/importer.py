@@ -0,0 +1,694 @@
+"""
+Bulk article import
+
+Articles are read as a stream from a directory of Markdown files, a tar
+archive of them, or an NDJSON file (one JSON object per line), and
+inserted in batches: each batch resolves its slugs, categories and tags
+with a few set-based queries, inserts articles and tag links with
+executemany and commits. Memory use depends on the batch size, not on the
+size of the import.
+
+Markdown files may start with front matter::
+
+    ---
+    title: Rotating API tokens
+    category: Security
+    subcategory: Access
+    tags: [tokens, api]
+    summary: How and when to rotate tokens
+    published: true
+    ---
+
+Without it, the category and subcategory come from the directories the
+file is in (``Security/Access/rotating-tokens.md``) and the title from the
+first ``#`` heading or the file name. NDJSON records use the same field
+names, with the Markdown in ``content``.
+
+Records with a ``type`` of ``category``, ``subcategory`` or ``tag`` (as
+written by app.exporter, in NDJSON or a ``.ndjson`` member of a tar)
+create that row with its description, order and color if it does not
+exist yet, so an export imported into an empty knowledge base restores
+its taxonomy as well as its articles. They are batched like articles and
+created before the articles that follow them.
+
+Rows inserted here bypass the ORM, so the importer itself rebuilds the
+published counters of the rows it touched and sends content_changed; the
+full-text index is kept current by its triggers.
+"""
+import json
+import os
+import tarfile
+import time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.counters import recount_published_articles
+from app.models import Category, SubCategory, Article, Tag, article_tags
+from app.signals import article_dependency_tags, notify_content_changed
+from app.slugs import allocate_slugs, slug_base, slugify, taken_suffixes
+from app.utils import build_search_document
+
+MARKDOWN_EXTENSIONS = ('.md', '.markdown')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
+# Record types that describe taxonomy rows rather than articles
+TAXONOMY_TYPES = ('category', 'subcategory', 'tag')
+
+# Front matter keys and the record fields they set
+_ALIASES = {
+    'published': 'is_published',
+    'featured': 'is_featured',
+    'date': 'created_at',
+}
+
+_BOOLEANS = {'true': True, 'yes': True, 'on': True, '1': True,
+             'false': False, 'no': False, 'off': False, '0': False}
+
+# Column sizes (see app.models)
+_TITLE_LENGTH = 200
+_TAG_LENGTH = 50
+_CATEGORY_LENGTH = 100
+
+# Batches rolled back by a concurrent save taking one of their slugs
+_SLUG_RETRIES = 3
+
+
+class RecordError(ValueError):
+    """A record that cannot be imported"""
+
+
+# ==========================================
+# Reading sources
+# ==========================================
+
+def _parse_value(value):
+    value = value.strip()
+    if not value:
+        return ''
+    if value[0] in '"[{':
+        try:
+            return json.loads(value)
+        except ValueError:
+            if value[0] == '[' and value.endswith(']'):
+                return [item.strip().strip('"\'') for item in value[1:-1].split(',') if item.strip()]
+    if value[0] == "'" and value.endswith("'") and len(value) > 1:
+        return value[1:-1]
+    return value
+
+
+def parse_front_matter(text):
+    """
+    Split Markdown into its front matter and body
+
+    Supports ``key: value`` lines, JSON or ``[a, b]`` style lists and
+    quoted strings, and ``- item`` list continuation lines.
+
+    Returns:
+        (dict of front matter, body text)
+    """
+    if not text.startswith('---'):
+        return {}, text
+    lines = text.split('\n')
+    if lines[0].strip() != '---':
+        return {}, text
+
+    meta, key = {}, None
+    for index, line in enumerate(lines[1:], start=1):
+        stripped = line.strip()
+        if stripped in ('---', '...'):
+            return meta, '\n'.join(lines[index + 1:]).lstrip('\n')
+        if not stripped or stripped.startswith('#'):
+            continue
+        if stripped.startswith('- ') and key is not None:
+            if not isinstance(meta.get(key), list):
+                meta[key] = []
+            meta[key].append(_parse_value(stripped[2:]))
+        elif ':' in line:
+            key, value = line.split(':', 1)
+            key = key.strip()
+            meta[key] = _parse_value(value)
+    # No closing marker: not front matter after all
+    return {}, text
+
+
+def _title_from(body, filename):
+    for line in body.split('\n'):
+        if line.startswith('# '):
+            return line[2:].strip()
+        if line.strip():
+            break
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return stem.replace('-', ' ').replace('_', ' ').strip().capitalize()
+
+
+def markdown_record(text, path):
+    """
+    Build a record from a Markdown document
+
+    Args:
+        text: File content
+        path: Path relative to the import root, '/'-separated; its
+            directories give the default category and subcategory
+    """
+    meta, body = parse_front_matter(text)
+    record = dict(meta)
+    record['content'] = body
+    folders = [part for part in path.split('/')[:-1] if part]
+    if folders:
+        record.setdefault('category', folders[0])
+    if len(folders) > 1:
+        record.setdefault('subcategory', folders[1])
+    record.setdefault('title', _title_from(body, path))
+    record['source'] = path
+    return record
+
+
+def iter_directory(root):
+    """Yield a record per Markdown file under ``root``, in path order"""
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        for name in sorted(files):
+            if not name.lower().endswith(MARKDOWN_EXTENSIONS):
+                continue
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            yield _markdown_member(data, os.path.relpath(path, root).replace(os.sep, '/'))
+
+
+def iter_tar(fileobj):
+    """Yield a record per Markdown member (and NDJSON line) of a tar stream"""
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                name = member.name
+                while name.startswith('./'):
+                    name = name[2:]
+                if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                    yield _markdown_member(archive.extractfile(member).read(), name)
+                elif name.lower().endswith(NDJSON_EXTENSIONS):
+                    for record in iter_ndjson(archive.extractfile(member)):
+                        record['source'] = f'{name}:{record["source"]}'
+                        yield record
+    except tarfile.TarError as error:
+        raise RecordError(f'unreadable tar archive: {error}') from error
+
+
+def _markdown_member(data, path):
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'error': 'not UTF-8 text', 'source': path}
+    return markdown_record(text, path)
+
+
+def iter_ndjson(lines):
+    """Yield a record per non-blank line of NDJSON"""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except UnicodeDecodeError:
+            record = {'error': 'not UTF-8 text'}
+        except ValueError as error:
+            record = {'error': f'invalid JSON: {error}'}
+        if not isinstance(record, dict):
+            record = {'error': 'not a JSON object'}
+        record.setdefault('source', f'line {number}')
+        yield record
+
+
+def iter_path(path):
+    """Records from a directory, a tar archive or an NDJSON file"""
+    if os.path.isdir(path):
+        return iter_directory(path)
+    if tarfile.is_tarfile(path):
+        return _iter_file(path, iter_tar)
+    if path.lower().endswith(MARKDOWN_EXTENSIONS):
+        return _iter_file(path, lambda f: [_markdown_member(f.read(), os.path.basename(path))])
+    return _iter_file(path, iter_ndjson)
+
+
+def _iter_file(path, reader):
+    with open(path, 'rb') as f:
+        yield from reader(f)
+
+
+def iter_upload(stream, filename):
+    """Records from an uploaded file, chosen by its name"""
+    name = filename.lower()
+    if name.endswith(('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')):
+        return iter_tar(stream)
+    if name.endswith(MARKDOWN_EXTENSIONS):
+        return [_markdown_member(stream.read(), os.path.basename(filename))]
+    return iter_ndjson(stream)
+
+
+# ==========================================
+# Importing
+# ==========================================
+
+def _as_bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return _BOOLEANS.get(str(value).strip().lower(), default)
+
+
+def _as_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise RecordError(f'invalid date: {value!r}')
+    # Stored naive, in UTC like datetime.utcnow()
+    if parsed.tzinfo is not None:
+        parsed = parsed.replace(tzinfo=None) - parsed.utcoffset()
+    return parsed
+
+
+def _as_tags(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    names = []
+    for name in value:
+        name = str(name).strip()[:_TAG_LENGTH]
+        if name and name.lower() not in (known.lower() for known in names):
+            names.append(name)
+    return names
+
+
+def normalize_record(record):
+    """
+    Validate a raw record and convert it to article fields
+
+    Raises:
+        RecordError: If the record cannot be imported
+    """
+    if record.get('error'):
+        raise RecordError(record['error'])
+    record = {_ALIASES.get(key, key): value for key, value in record.items()}
+
+    title = str(record.get('title') or '').strip()
+    content = str(record.get('content') or '').strip()
+    category = str(record.get('category') or '').strip()
+    if not title:
+        raise RecordError('title is required')
+    if not content:
+        raise RecordError('content is required')
+    if not category:
+        raise RecordError('category is required')
+
+    created_at = _as_datetime(record.get('created_at'))
+    is_published = _as_bool(record.get('is_published'), True)
+    base = slug_base(str(record.get('slug') or title), Article.slug, 'article')
+    return {
+        'title': title[:_TITLE_LENGTH],
+        'slug_base': base,
+        'content': content,
+        'summary': str(record.get('summary') or '').strip(),
+        'category': category[:_CATEGORY_LENGTH],
+        'subcategory': str(record.get('subcategory') or '').strip()[:_CATEGORY_LENGTH] or None,
+        'tags': _as_tags(record.get('tags')),
+        'is_published': is_published,
+        'is_featured': _as_bool(record.get('is_featured'), False),
+        'created_at': created_at,
+        'published_at': (_as_datetime(record.get('published_at')) or created_at) if is_published else None,
+    }
+
+
+def _slug_text(record, name):
+    """Text to take a slug from: the record's own slug, if it has one"""
+    return str(record.get('slug') or name) if record else name
+
+
+def _values(record, **defaults):
+    """Column values for ``defaults``' keys: the ones ``record`` sets, else the defaults"""
+    return {key: record[key] if record and record.get(key) is not None else default
+            for key, default in defaults.items()}
+
+
+class ImportResult:
+    """Counts and timing of an import"""
+
+    # Error messages kept for the report; the count covers all of them
+    MAX_ERRORS = 50
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.error_count = 0
+        self.batches = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def error(self, source, message):
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(f'{source}: {message}' if source else message)
+
+    @property
+    def rate(self):
+        """Articles imported per second"""
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+
+class ArticleImporter:
+    """
+    Insert articles from records in batches
+
+    Args:
+        author_id: User recorded as the author of every article
+        batch_size: Articles per transaction
+        create_categories: Create categories and subcategories that do not
+            exist yet (otherwise such records are rejected)
+        skip_existing: Skip records whose slug already exists instead of
+            importing them under a suffixed slug
+        progress: Called with the ImportResult after every batch
+    """
+
+    def __init__(self, author_id=None, batch_size=500, create_categories=True,
+                 skip_existing=False, progress=None):
+        self.author_id = author_id
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.skip_existing = skip_existing
+        self.progress = progress
+        self._categories = None
+        self._subcategories = None
+        self._tags = None
+
+    def run(self, records):
+        """Import ``records`` (any iterable of dicts); return an ImportResult"""
+        result = ImportResult()
+        self._load_lookups()
+        batch, taxonomy = [], []
+        for record in records:
+            if record.get('type') in TAXONOMY_TYPES:
+                taxonomy.append(record)
+                if len(taxonomy) >= self.batch_size:
+                    self._flush_taxonomy(taxonomy, result)
+                    taxonomy = []
+                continue
+            if taxonomy:
+                # Before the articles that may be in these categories
+                self._flush_taxonomy(taxonomy, result)
+                taxonomy = []
+            result.read += 1
+            try:
+                batch.append((record.get('source'), normalize_record(record)))
+            except RecordError as error:
+                result.error(record.get('source'), str(error))
+                continue
+            if len(batch) >= self.batch_size:
+                self._flush(batch, result)
+                batch = []
+        if taxonomy:
+            self._flush_taxonomy(taxonomy, result)
+        if batch:
+            self._flush(batch, result)
+        result.elapsed = time.perf_counter() - result.started
+        return result
+
+    def _commit(self, import_batch, batch, result):
+        """Run ``import_batch`` and commit; return the changed tags"""
+        counts = (result.imported, result.skipped, result.error_count, len(result.errors))
+        for attempt in range(_SLUG_RETRIES):
+            try:
+                changed = import_batch(batch, result)
+                db.session.commit()
+                return changed
+            except IntegrityError:
+                # A concurrent save took one of the slugs (or created one of
+                # the categories or tags); resolve the batch again
+                db.session.rollback()
+                result.imported, result.skipped, result.error_count = counts[:3]
+                del result.errors[counts[3]:]
+                self._load_lookups()
+                if attempt == _SLUG_RETRIES - 1:
+                    raise
+
+    def _flush_taxonomy(self, records, result):
+        notify_content_changed(self._commit(self._import_taxonomy, records, result))
+
+    def _flush(self, batch, result):
+        notify_content_changed(self._commit(self._import_batch, batch, result))
+        result.batches += 1
+        result.elapsed = time.perf_counter() - result.started
+        if self.progress is not None:
+            self.progress(result)
+
+    # Lookups are small tables, loaded once and kept current
+
+    def _load_lookups(self):
+        self._categories = {}
+        for id, name, slug in db.session.execute(
+                db.select(Category.id, Category.name, Category.slug)):
+            self._categories[name.lower()] = id
+            self._categories.setdefault(slug, id)
+        self._subcategories = {}
+        for id, category_id, name, slug in db.session.execute(
+                db.select(SubCategory.id, SubCategory.category_id, SubCategory.name, SubCategory.slug)):
+            self._subcategories[(category_id, name.lower())] = id
+            self._subcategories.setdefault((category_id, slug), id)
+        self._tags = {name.lower(): id for id, name in db.session.execute(db.select(Tag.id, Tag.name))}
+
+    def _category_id(self, name):
+        return self._categories.get(name.lower()) or self._categories.get(slugify(name))
+
+    def _subcategory_id(self, category_id, name):
+        return self._subcategories.get((category_id, name.lower())) or \
+            self._subcategories.get((category_id, slugify(name)))
+
+    # Missing rows are created with one executemany per table, their slugs
+    # allocated together
+
+    def _create_categories(self, categories):
+        """
+        Create the categories that do not exist yet, unless create_categories is off
+
+        Args:
+            categories: Dict of name to the record describing the category, or None
+
+        Returns:
+            Ids of the categories created
+        """
+        missing = {}
+        for name, details in categories.items():
+            if self._category_id(name) is None:
+                missing.setdefault(name.lower(), (name, details))
+        if not missing or not self.create_categories:
+            return []
+        missing = list(missing.values())
+        slugs = allocate_slugs(Category.slug, [
+            slug_base(_slug_text(details, name), Category.slug, 'category') for name, details in missing
+        ])
+        db.session.execute(Category.__table__.insert(), [
+            dict(_values(details, description=None, icon=None, order=0), name=name, slug=slug)
+            for (name, details), slug in zip(missing, slugs)
+        ])
+        created = db.session.execute(db.select(Category.id, Category.name).where(
+            Category.name.in_([name for name, _ in missing]))).all()
+        for id, name in created:
+            self._categories[name.lower()] = id
+        return [id for id, _ in created]
+
+    def _create_subcategories(self, subcategories):
+        """
+        Create the subcategories that do not exist yet, unless create_categories is off
+
+        Slugs are allocated with one query per category.
+
+        Args:
+            subcategories: Dict of (category id, name) to the record
+                describing the subcategory, or None
+
+        Returns:
+            Ids of the subcategories created
+        """
+        missing = {}
+        for (category_id, name), details in subcategories.items():
+            if self._subcategory_id(category_id, name) is None:
+                missing.setdefault((category_id, name.lower()), (category_id, name, details))
+        if not missing or not self.create_categories:
+            return []
+        by_category = {}
+        for category_id, name, details in missing.values():
+            by_category.setdefault(category_id, []).append((name, details))
+        rows = []
+        for category_id, entries in by_category.items():
+            slugs = allocate_slugs(SubCategory.slug, [
+                slug_base(_slug_text(details, name), SubCategory.slug, 'subcategory')
+                for name, details in entries
+            ], where=SubCategory.category_id == category_id)
+            rows += [dict(_values(details, description=None, order=0),
+                          name=name, slug=slug, category_id=category_id)
+                     for (name, details), slug in zip(entries, slugs)]
+        db.session.execute(SubCategory.__table__.insert(), rows)
+        created = []
+        for id, category_id, name in db.session.execute(
+                db.select(SubCategory.id, SubCategory.category_id, SubCategory.name).where(
+                    SubCategory.category_id.in_(by_category),
+                    SubCategory.name.in_({row['name'] for row in rows}))):
+            if (category_id, name.lower()) in missing:
+                self._subcategories[(category_id, name.lower())] = id
+                created.append(id)
+        return created
+
+    def _create_tags(self, tags):
+        """
+        Create the tags that do not exist yet
+
+        Args:
+            tags: Dict of name to the record describing the tag, or None
+
+        Returns:
+            Ids of the tags created
+        """
+        missing = {}
+        for name, details in tags.items():
+            if name.lower() not in self._tags:
+                missing.setdefault(name.lower(), (name, details))
+        if not missing:
+            return []
+        missing = list(missing.values())
+        slugs = allocate_slugs(Tag.slug, [
+            slug_base(_slug_text(details, name), Tag.slug, 'tag') for name, details in missing
+        ])
+        now = datetime.utcnow()
+        db.session.execute(Tag.__table__.insert(), [
+            dict(_values(details, description=None, color='#2563eb'),
+                 name=name, slug=slug, created_at=now)
+            for (name, details), slug in zip(missing, slugs)
+        ])
+        created = db.session.execute(db.select(Tag.id, Tag.name).where(
+            Tag.name.in_([name for name, _ in missing]))).all()
+        for id, name in created:
+            self._tags[name.lower()] = id
+        return [id for id, _ in created]
+
+    def _import_taxonomy(self, records, result):
+        """Create the categories, subcategories and tags ``records`` describe; return the changed tags"""
+        categories, subcategories, tags = {}, [], {}
+        for record in records:
+            kind, source = record['type'], record.get('source')
+            name = str(record.get('name') or '').strip()
+            if not name:
+                result.error(source, f'{kind} name is required')
+            elif kind == 'category':
+                name = name[:_CATEGORY_LENGTH]
+                if categories.get(name) is None:
+                    categories[name] = record
+            elif kind == 'subcategory':
+                parent = str(record.get('category') or '').strip()[:_CATEGORY_LENGTH]
+                if parent:
+                    categories.setdefault(parent, None)
+                subcategories.append((source, parent, name[:_CATEGORY_LENGTH], record))
+            else:
+                tags.setdefault(name[:_TAG_LENGTH], record)
+
+        category_ids = self._create_categories(categories)
+        known = {}
+        for source, parent, name, record in subcategories:
+            category_id = self._category_id(parent) if parent else None
+            if category_id is None:
+                result.error(source, f'unknown category {record.get("category")!r}')
+                continue
+            known.setdefault((category_id, name), record)
+        subcategory_ids = self._create_subcategories(known)
+        tag_ids = self._create_tags(tags)
+
+        changed = article_dependency_tags(category_ids=category_ids, subcategory_ids=subcategory_ids,
+                                          tag_ids=tag_ids)
+        if category_ids or subcategory_ids:
+            changed.add('categories')
+        return changed
+
+    def _tag_ids(self, names):
+        """Ids for tag ``names``, creating the missing tags"""
+        self._create_tags(dict.fromkeys(names))
+        return self._tags
+
+    def _import_batch(self, batch, result):
+        """Insert one batch in the current transaction; return the changed tags"""
+        self._create_categories(dict.fromkeys(fields['category'] for _, fields in batch))
+        self._create_subcategories(dict.fromkeys(
+            (self._category_id(fields['category']), fields['subcategory']) for _, fields in batch
+            if fields['subcategory'] and self._category_id(fields['category']) is not None
+        ))
+
+        rows, sources = [], []
+        for source, fields in batch:
+            category_id = self._category_id(fields['category'])
+            if category_id is None:
+                result.error(source, f'unknown category {fields["category"]!r}')
+                continue
+            subcategory_id = None
+            if fields['subcategory']:
+                subcategory_id = self._subcategory_id(category_id, fields['subcategory'])
+                if subcategory_id is None:
+                    result.error(source, f'unknown subcategory {fields["subcategory"]!r}')
+                    continue
+            rows.append(dict(fields, category_id=category_id, subcategory_id=subcategory_id))
+            sources.append(source)
+
+        bases = [row['slug_base'] for row in rows]
+        taken = taken_suffixes(Article.slug, bases)
+        if self.skip_existing:
+            kept = [row for row in rows if 0 not in taken[row['slug_base']]]
+            result.skipped += len(rows) - len(kept)
+            rows = kept
+        if not rows:
+            return set()
+        slugs = allocate_slugs(Article.slug, [row['slug_base'] for row in rows], taken=taken)
+
+        tag_ids = self._tag_ids({name for row in rows for name in row['tags']})
+        now = datetime.utcnow()
+        db.session.execute(Article.__table__.insert(), [{
+            'title': row['title'],
+            'slug': slug,
+            'content': row['content'],
+            'summary': row['summary'],
+            'category_id': row['category_id'],
+            'subcategory_id': row['subcategory_id'],
+            'is_published': row['is_published'],
+            'is_featured': row['is_featured'],
+            'author_id': self.author_id,
+            'created_at': row['created_at'] or now,
+            'updated_at': row['created_at'] or now,
+            'published_at': (row['published_at'] or now) if row['is_published'] else None,
+            'search_vector': build_search_document(row['title'], row['summary'], row['content']),
+        } for row, slug in zip(rows, slugs)])
+
+        article_ids = dict(db.session.execute(
+            db.select(Article.slug, Article.id).where(Article.slug.in_(slugs))
+        ).all())
+        links = [{'article_id': article_ids[slug], 'tag_id': tag_ids[name.lower()]}
+                 for row, slug in zip(rows, slugs) for name in row['tags']]
+        if links:
+            db.session.execute(article_tags.insert(), links)
+
+        category_ids = {row['category_id'] for row in rows}
+        subcategory_ids = {row['subcategory_id'] for row in rows} - {None}
+        linked_tag_ids = {link['tag_id'] for link in links}
+        recount_published_articles(category_ids, subcategory_ids, linked_tag_ids)
+
+        result.imported += len(rows)
+        # Category listings show the published counts
+        return {'articles', 'categories'} | article_dependency_tags(
+            article_ids=article_ids.values(),
+            category_ids=category_ids,
+            subcategory_ids=subcategory_ids,
+            tag_ids=linked_tag_ids
+        )
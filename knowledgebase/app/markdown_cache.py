@@ -0,0 +1,234 @@
+"""
+Rendered Markdown Cache
+
+Rendering an article (markdown extensions, Pygments highlighting and bleach
+sanitizing) is the most expensive part of an article view, while the output
+only changes when the content does. Rendered HTML is cached under a hash of
+the content and the renderer configuration in two tiers:
+
+- a bounded in-process LRU, per worker
+- optionally, the ``rendered_markdown`` table shared by all workers
+
+Readers only read the table: a reader's miss is rendered into the
+in-process tier alone, so article views never wait on a write lock. The
+table is filled by admin saves, which render eagerly through
+warm_markdown_cache(), and by `flask warm-markdown-cache`
+(warm_all_markdown_caches()), which also prunes renderings of replaced
+content and of other renderer configurations.
+"""
+import functools
+import hashlib
+import json
+import time
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.cache import LRUCache
+from app.models import Article, RenderedMarkdown
+from app.metrics import MARKDOWN_RENDER_SECONDS, cache_lookup
+from app.profiling import timed
+from app.utils import render_markdown, ALLOWED_TAGS, ALLOWED_ATTRIBUTES
+
+# Bump whenever render_markdown() changes its extensions or options, so HTML
+# rendered with the old configuration is never served again
+RENDERER_VERSION = 1
+
+# Keys per IN list when warming
+_CHUNK = 500
+
+
+def _chunks(items, size=_CHUNK):
+    items = list(items)
+    for first in range(0, len(items), size):
+        yield items[first:first + size]
+
+
+@functools.lru_cache(maxsize=None)
+def _renderer_signature():
+    """Describe the renderer configuration; computed on first use so the
+    rendering libraries are not imported at boot"""
+    import bleach
+    import markdown
+    import pygments
+
+    return json.dumps([
+        RENDERER_VERSION,
+        markdown.__version__,
+        bleach.__version__,
+        pygments.__version__,
+        sorted(ALLOWED_TAGS),
+        {tag: sorted(attrs) for tag, attrs in ALLOWED_ATTRIBUTES.items()},
+    ], sort_keys=True)
+
+
+@functools.lru_cache(maxsize=None)
+def renderer_signature():
+    """Digest of the renderer configuration, stored with each persistent rendering"""
+    return hashlib.sha256(_renderer_signature().encode('utf-8')).hexdigest()
+
+
+def init_markdown_cache(app):
+    """Create the in-process cache tier for ``app``"""
+    app.extensions['markdown_cache'] = LRUCache(app.config.get('MARKDOWN_CACHE_SIZE', 256))
+
+
+def _memory_cache():
+    return current_app.extensions['markdown_cache']
+
+
+def _persistent():
+    return current_app.config.get('MARKDOWN_CACHE_PERSISTENT', False)
+
+
+def cache_key(text):
+    """Return the cache key for ``text`` under the current renderer config"""
+    digest = hashlib.sha256(_renderer_signature().encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(text.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _render(text):
+    """Render ``text``, recording the time taken"""
+    started = time.perf_counter()
+    with timed('markdown'):
+        html = render_markdown(text)
+    MARKDOWN_RENDER_SECONDS.observe(time.perf_counter() - started)
+    return html
+
+
+def render_markdown_cached(text):
+    """
+    Convert markdown text to safe HTML, reusing a cached rendering
+
+    Args:
+        text: Markdown formatted text
+
+    Returns:
+        Safe HTML string
+    """
+    if not text:
+        return ''
+
+    key = cache_key(text)
+    memory = _memory_cache()
+    html = memory.get(key)
+    cache_lookup('markdown', html is not None)
+    if html is not None:
+        return html
+
+    if _persistent():
+        entry = db.session.get(RenderedMarkdown, key)
+        html = entry.html if entry else None
+        cache_lookup('markdown_db', html is not None)
+
+    if html is None:
+        # Not stored: readers leave that to admin saves and warming
+        html = _render(text)
+
+    memory.set(key, html)
+    return html
+
+
+def warm_markdown_cache(text, previous=None):
+    """
+    Render ``text`` ahead of the first reader
+
+    Called from admin saves; the persistent entry is added to the current
+    session so it is committed together with the article.
+
+    Args:
+        text: New markdown content
+        previous: Content being replaced, whose cached rendering is dropped
+    """
+    if previous and previous != text:
+        discard_markdown_cache(previous)
+    if not text:
+        return
+
+    key = cache_key(text)
+    html = _memory_cache().get(key)
+    if html is None:
+        html = _render(text)
+        _memory_cache().set(key, html)
+    if _persistent():
+        # merge() looks the key up first; flushing then would write the
+        # caller's half-built objects (e.g. a new article without a slug)
+        with db.session.no_autoflush:
+            db.session.merge(RenderedMarkdown(key=key, signature=renderer_signature(), html=html))
+
+
+def discard_markdown_cache(text):
+    """Drop the cached rendering of ``text`` from both tiers"""
+    if not text:
+        return
+
+    key = cache_key(text)
+    _memory_cache().delete(key)
+    if _persistent():
+        RenderedMarkdown.query.filter_by(key=key).delete()
+
+
+def discard_markdown_caches(texts):
+    """Drop the cached renderings of several texts, with one DELETE"""
+    keys = {cache_key(text) for text in texts if text}
+    for key in keys:
+        _memory_cache().delete(key)
+    if keys and _persistent():
+        RenderedMarkdown.query.filter(RenderedMarkdown.key.in_(keys)).delete()
+
+
+def warm_all_markdown_caches(batch_size=200):
+    """
+    Store the rendering of every article and prune the ones no longer used
+
+    Renders the articles whose content has no stored rendering under the
+    current renderer configuration, committing every ``batch_size``
+    renderings, then deletes the rows of other configurations and of
+    content no article has any more.
+
+    Returns:
+        Tuple of the number of renderings stored and rows deleted
+    """
+    if not _persistent():
+        return 0, 0
+
+    table = RenderedMarkdown.__table__
+    signature = renderer_signature()
+    started = datetime.utcnow()
+    used = set()
+    stored = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Article.id, Article.content)
+            .where(Article.id > last_id, Article.content != '')
+            .order_by(Article.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        texts = {cache_key(row.content): row.content for row in rows}
+        texts = {key: text for key, text in texts.items() if key not in used}
+        used.update(texts)
+        for chunk in _chunks(texts):
+            for key in db.session.execute(db.select(table.c.key).where(table.c.key.in_(chunk))).scalars():
+                del texts[key]
+        if texts:
+            db.session.execute(table.insert(), [
+                {'key': key, 'signature': signature, 'html': _render(text), 'created_at': started}
+                for key, text in texts.items()
+            ])
+            db.session.commit()
+            stored += len(texts)
+
+    deleted = db.session.execute(table.delete().where(table.c.signature != signature)).rowcount
+    # Rows added since warming started belong to articles saved meanwhile
+    unused = set(db.session.execute(
+        db.select(table.c.key).where(table.c.created_at < started)
+    ).scalars()) - used
+    for chunk in _chunks(unused):
+        deleted += db.session.execute(table.delete().where(table.c.key.in_(chunk))).rowcount
+    db.session.commit()
+    return stored, deleted
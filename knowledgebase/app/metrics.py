@@ -0,0 +1,156 @@
+"""
+Prometheus metrics (``/metrics``)
+
+Request latency per endpoint, requests in flight, waits for a pooled
+database connection, cache hits and misses, and markdown render times,
+collected with prometheus_client.
+
+Under gunicorn every worker process counts on its own. Set
+PROMETHEUS_MULTIPROC_DIR in the environment before the app is imported
+(gunicorn.conf.py does) and prometheus_client's multiprocess mode keeps
+each worker's values in files in that directory, which ``/metrics`` adds
+up whichever worker answers the scrape. The directory must be emptied
+before the server starts and dead workers marked in gunicorn's
+``child_exit`` hook, both of which gunicorn.conf.py does.
+
+With METRICS_TOKEN set, ``/metrics`` requires it as a bearer token.
+"""
+import hmac
+import os
+import time
+from flask import Response, current_app, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Latency buckets in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CHECKOUT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+RENDER_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+REQUEST_SECONDS = Histogram('kb_http_request_duration_seconds',
+                            'Time to handle a request, by endpoint',
+                            ('endpoint', 'method'), buckets=REQUEST_BUCKETS)
+REQUESTS = Counter('kb_http_requests', 'Requests handled, by endpoint and status',
+                   ('endpoint', 'method', 'status'))
+# Summed over the live workers only, as a dead one has nothing in flight
+IN_FLIGHT = Gauge('kb_http_requests_in_flight', 'Requests being handled',
+                  multiprocess_mode='livesum')
+POOL_CHECKOUT_SECONDS = Histogram('kb_db_pool_checkout_seconds',
+                                  'Time waiting for a pooled database connection',
+                                  ('bind',), buckets=CHECKOUT_BUCKETS)
+POOL_TIMEOUTS = Counter('kb_db_pool_timeouts',
+                        'Connection checkouts that gave up after DB_POOL_TIMEOUT', ('bind',))
+CACHE_LOOKUPS = Counter('kb_cache_lookups', 'Cache lookups, by cache and result',
+                        ('cache', 'result'))
+MARKDOWN_RENDER_SECONDS = Histogram('kb_markdown_render_seconds',
+                                    'Time to render an article from markdown',
+                                    buckets=RENDER_BUCKETS)
+
+
+def cache_lookup(cache, hit):
+    """Count a lookup in ``cache`` ('page', 'fragment', 'markdown', ...)"""
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def _multiprocess_dir():
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def clear_metrics_dir(directory):
+    """Delete the metric files in ``directory``; do it before starting the server"""
+    if not os.path.isdir(directory):
+        return 0
+    names = [name for name in os.listdir(directory) if name.endswith('.db')]
+    for name in names:
+        os.remove(os.path.join(directory, name))
+    return len(names)
+
+
+# ==========================================
+# Exposition
+# ==========================================
+
+def _registry():
+    """The registry to expose: this process's, or the sum of all workers'"""
+    if not _multiprocess_dir():
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def metrics_view():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                         f'Bearer {token}'):
+        return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'},
+                        content_type='text/plain; charset=utf-8')
+    return Response(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
+
+
+# ==========================================
+# Instrumentation
+# ==========================================
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long checkouts wait for a connection"""
+
+    bind_name = 'default'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.labels(self.bind_name).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(self.bind_name).observe(time.perf_counter() - started)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.bind_name = self.bind_name
+        return pool
+
+
+def configure_pool_metrics(app):
+    """Time connection checkouts; call after configure_engine_options()"""
+    options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+    if app.config.get('METRICS_ENABLED') and 'pool_size' in options:
+        options.setdefault('poolclass', InstrumentedQueuePool)
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _record_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+    return response
+
+
+def _finish_request(exc):
+    if g.pop('metrics_started', None) is not None:
+        IN_FLIGHT.dec()
+
+
+def init_metrics(app, db):
+    """Collect metrics for ``app`` and serve them at /metrics (METRICS_ENABLED)"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            if isinstance(engine.pool, InstrumentedQueuePool):
+                engine.pool.bind_name = bind or 'default'
+    app.before_request(_start_request)
+    app.after_request(_record_request)
+    app.teardown_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -5,6 +5,7 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from app import db
+from app.utils import build_search_document
 
 # Association table for many-to-many relationship between articles and tags
 article_tags = db.Table('article_tags',
@@ -47,6 +48,9 @@ class Category(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Maintained by app.counters; repair with `flask recount`
+    published_article_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     subcategories = db.relationship('SubCategory', backref='category', lazy='dynamic', 
                                    cascade='all, delete-orphan')
@@ -69,6 +73,9 @@ class SubCategory(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Maintained by app.counters; repair with `flask recount`
+    published_article_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     articles = db.relationship('Article', backref='subcategory', lazy='dynamic')
     
@@ -110,14 +117,47 @@ class Article(db.Model):
     published_at = db.Column(db.DateTime, index=True)
     
     # Search index (for FTS - Full Text Search)
-    search_vector = db.Column(db.Text)  # Combined title + content for searching
+    # Normalized, de-duplicated terms of title + summary + content. Deferred
+    # so listing queries never load it.
+    search_vector = db.deferred(db.Column(db.Text))
     
     def __repr__(self):
         return f'<Article {self.title}>'
     
     def update_search_vector(self):
         """Update search vector for full-text search"""
-        self.search_vector = f"{self.title} {self.content}"
+        self.search_vector = build_search_document(self.title, self.summary, self.content)
+    
+    @staticmethod
+    def listing_options(with_tags=False):
+        """
+        Eager-loading options for queries that render lists of articles
+        
+        Category and subcategory are joined into the article query; tags
+        (when the page shows them) are fetched for all rows in one extra
+        query. Use as ``Article.query.options(*Article.listing_options())``.
+        """
+        options = [
+            db.joinedload(Article.category),
+            db.joinedload(Article.subcategory),
+        ]
+        if with_tags:
+            options.append(db.selectinload(Article.tags))
+        return options
+
+
+@db.event.listens_for(Article, 'before_insert')
+def _article_before_insert(mapper, connection, target):
+    """Build the search document for new articles"""
+    target.update_search_vector()
+
+
+@db.event.listens_for(Article, 'before_update')
+def _article_before_update(mapper, connection, target):
+    """Rebuild the search document when searchable text changes"""
+    state = db.inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('title', 'summary', 'content')):
+        target.update_search_vector()
 
 
 class Tag(db.Model):
@@ -131,8 +171,91 @@ class Tag(db.Model):
     color = db.Column(db.String(7), default='#2563eb')  # Hex color code
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Maintained by app.counters; repair with `flask recount`
+    published_article_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Many-to-many relationship with articles
-    articles = db.relationship('Article', secondary=article_tags, backref=db.backref('tags', lazy='dynamic'))
+    articles = db.relationship('Article', secondary=article_tags, backref='tags')
     
     def __repr__(self):
         return f'<Tag {self.name}>'
+
+
+class RenderedMarkdown(db.Model):
+    """Persistent cache of rendered markdown HTML, keyed by content hash"""
+    __tablename__ = 'rendered_markdown'
+    
+    key = db.Column(db.String(64), primary_key=True)  # See markdown_cache.cache_key()
+    # markdown_cache.renderer_signature() when rendered; rows from other
+    # renderer versions are pruned by `flask warm-markdown-cache`
+    signature = db.Column(db.String(64), nullable=False, index=True)
+    html = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<RenderedMarkdown {self.key[:12]}>'
+
+
+class RelatedArticle(db.Model):
+    """Precomputed most similar articles of an article (see app.related)"""
+    __tablename__ = 'related_articles'
+    
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)  # 0 = most similar
+    related_id = db.Column(db.Integer, db.ForeignKey('articles.id', ondelete='CASCADE'),
+                           nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+    
+    def __repr__(self):
+        return f'<RelatedArticle {self.article_id} #{self.rank}: {self.related_id}>'
+
+
+class StaleRelatedArticle(db.Model):
+    """Article whose related articles are due for a refresh (see app.related)"""
+    __tablename__ = 'related_articles_stale'
+    
+    # No foreign key: deleted articles are refreshed out of the lists too
+    article_id = db.Column(db.Integer, primary_key=True)
+    marked_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<StaleRelatedArticle {self.article_id}>'
+
+
+class SuggestionChange(db.Model):
+    """Article, category or subcategory changed since the suggestion indexes were built (see app.suggestions)"""
+    __tablename__ = 'suggestion_changes'
+    # AUTOINCREMENT: ids are the sequence workers sync from and must never
+    # be reused once the newest rows have been pruned
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)  # article, category or subcategory
+    entity_id = db.Column(db.Integer, nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<SuggestionChange #{self.id} {self.kind}:{self.entity_id}>'
+
+
+class ArticleTerm(db.Model):
+    """Strongest TF-IDF terms of a published article, the index related articles are found with"""
+    __tablename__ = 'article_terms'
+    
+    article_id = db.Column(db.Integer, db.ForeignKey('articles.id', ondelete='CASCADE'), primary_key=True)
+    term = db.Column(db.String(64), primary_key=True, index=True)
+    weight = db.Column(db.Float, nullable=False)  # Unit-length vector per article
+    
+    def __repr__(self):
+        return f'<ArticleTerm {self.article_id} {self.term}>'
+
+
+class DocumentFrequency(db.Model):
+    """Number of published articles using a term, as of the last related articles build"""
+    __tablename__ = 'document_frequencies'
+    
+    term = db.Column(db.String(64), primary_key=True)
+    document_count = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<DocumentFrequency {self.term}: {self.document_count}>'
@@ -0,0 +1,137 @@
+"""
+Full-page response cache for anonymous readers
+
+Public pages look the same to every anonymous visitor until content is
+edited, so their rendered responses are cached whole. Each entry records
+the dependency tags of the entities it shows (see app.signals) together
+with each tag's current version token. Invalidating a tag replaces its
+token, which makes every entry depending on it stale on the next lookup;
+nothing else is purged.
+
+Only GET requests from anonymous users with no pending flash messages are
+served from or stored in the cache. Pages are keyed on their path and the
+query arguments the view declares, so other arguments (tracking
+parameters, cache busters) neither miss the cache nor fill it.
+"""
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, g, request, session, make_response
+from flask_login import current_user
+from app.cache import TaggedCache, create_backend, render_started
+from app.compression import compress_variants, mark_encoded, negotiate
+from app.signals import content_changed
+
+_PAGE_PREFIX = 'page:'
+
+# Response headers stored with a cached page
+_STORED_HEADERS = ('Content-Type', 'Content-Language', 'ETag', 'Last-Modified', 'Cache-Control')
+
+
+class PageCache(TaggedCache):
+    """Tag-invalidated page store on top of a cache backend"""
+
+    def __init__(self, backend, timeout=300):
+        super().__init__(backend, _PAGE_PREFIX, timeout)
+
+    def set(self, key, response, tags, since=None):
+        """
+        Store ``response`` under ``key``, depending on ``tags``
+
+        The body is also stored compressed, once per supported encoding.
+        ``since`` is as for TaggedCache.set().
+
+        Returns:
+            The stored entry, or None if it was not stored
+        """
+        entry = {
+            'status': response.status_code,
+            'headers': [(name, response.headers[name])
+                        for name in _STORED_HEADERS if name in response.headers],
+            'body': response.get_data(),
+            'encoded': compress_variants(response),
+        }
+        return entry if super().set(key, entry, tags, since=since) else None
+
+
+def _use_encoded_body(response, entry):
+    """Send the entry's precompressed body the client accepts, if any"""
+    encoded = entry.get('encoded') or {}
+    encoding = negotiate(encoded)
+    if encoding is not None:
+        mark_encoded(response, encoding, encoded[encoding])
+    return response
+
+
+def init_page_cache(app):
+    """Create the page cache configured for ``app``"""
+    backend = create_backend(app.config, 'PAGE_CACHE')
+    app.extensions['page_cache'] = PageCache(backend, app.config.get('PAGE_CACHE_TIMEOUT', 300))
+
+
+@content_changed.connect
+def _invalidate_pages(sender, tags, **extra):
+    page_cache = sender.extensions.get('page_cache') if sender else None
+    if page_cache is not None:
+        page_cache.invalidate(tags)
+
+
+def add_cache_tags(*tags):
+    """Declare entities the page being rendered depends on"""
+    cache_tags = g.get('cache_tags')
+    if cache_tags is not None:
+        cache_tags.update(tag for tag in tags if tag)
+
+
+def _request_is_cacheable():
+    if request.method != 'GET':
+        return False
+    if current_user.is_authenticated:
+        return False
+    # base.html renders flashed messages, which are per visitor
+    return not session.get('_flashes')
+
+
+def _page_key(query_args):
+    """``request.path`` plus the values of ``query_args``, in a fixed order"""
+    values = [(name, value) for name in sorted(query_args)
+              for value in request.args.getlist(name)]
+    return request.path + ('?' + urlencode(values) if values else '')
+
+
+def cached_page(view=None, query_args=()):
+    """
+    Serve the view from the page cache for anonymous readers
+
+    Use as ``@cached_page``, or as ``@cached_page(query_args=['page'])``
+    for a view that reads query arguments: only those are part of the key.
+    """
+    if view is None:
+        return lambda view: cached_page(view, query_args)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Before the view reads anything, for its fragments as well
+        since = render_started()
+        page_cache = current_app.extensions.get('page_cache')
+        if page_cache is None or not _request_is_cacheable():
+            return view(*args, **kwargs)
+
+        key = _page_key(query_args)
+        entry = page_cache.get(key)
+        if entry is not None:
+            response = current_app.response_class(
+                entry['body'], status=entry['status'], headers=entry['headers']
+            )
+            response.headers['X-Cache'] = 'HIT'
+            return _use_encoded_body(response, entry).make_conditional(request)
+
+        g.cache_tags = set()
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.direct_passthrough \
+                and _request_is_cacheable():
+            entry = page_cache.set(key, response, g.cache_tags, since=since)
+            if entry is not None:
+                _use_encoded_body(response, entry)
+        response.headers['X-Cache'] = 'MISS'
+        return response
+    return wrapper
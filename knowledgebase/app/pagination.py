@@ -0,0 +1,160 @@
+"""
+Keyset (cursor) pagination
+
+Instead of ``OFFSET``, each page remembers the sort key of its first and
+last row and the next page asks for rows strictly after that key, so a
+deep page costs the same as the first one. Cursors are opaque URL-safe
+tokens; a token that cannot be decoded simply yields the first page.
+
+The total is counted once, on the first page, and carried along in the
+cursors, so browsing further pages never runs ``COUNT(*)`` again.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from app import db
+
+
+def order_clauses(keys):
+    """ORDER BY clauses for ``keys``, a list of ``(expression, descending)``"""
+    return [expression.desc() if descending else expression.asc()
+            for expression, descending in keys]
+
+
+def _beyond(keys, values):
+    """Rows that sort strictly after ``values`` in ``keys`` order"""
+    clauses = []
+    for position, (expression, descending) in enumerate(keys):
+        value = values[position]
+        clauses.append(db.and_(
+            *[key == previous for (key, _), previous in zip(keys[:position], values[:position])],
+            expression < value if descending else expression > value
+        ))
+    return db.or_(*clauses)
+
+
+def _is_datetime(expression):
+    return isinstance(expression.type, db.DateTime)
+
+
+def encode_cursor(keys, values, direction, page, total):
+    """Pack a position into an opaque token"""
+    payload = {
+        'k': [value.isoformat() if isinstance(value, datetime) else value for value in values],
+        'd': direction,
+        'p': page,
+        't': total,
+    }
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(keys, token):
+    """
+    Unpack a token made by encode_cursor
+
+    Returns:
+        ``(values, direction, page, total)``, or None if the token is
+        missing or malformed
+    """
+    if not token:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(data)
+        values = payload['k']
+        if len(values) != len(keys) or payload['d'] not in ('next', 'prev'):
+            return None
+        values = [datetime.fromisoformat(value) if _is_datetime(expression) and value else value
+                  for (expression, _), value in zip(keys, values)]
+        return values, payload['d'], int(payload['p']), payload.get('t')
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError):
+        return None
+
+
+class KeysetPage:
+    """
+    One page of results
+
+    Mirrors the parts of Flask-SQLAlchemy's Pagination the templates use
+    (``items``, ``page``, ``pages``, ``total``, ``has_prev``, ``has_next``),
+    with ``prev_cursor`` / ``next_cursor`` tokens in place of page numbers.
+    """
+
+    def __init__(self, items, page, per_page, total, prev_cursor, next_cursor):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_paginate(query, keys, cursor=None, per_page=20, count=True, count_query=None):
+    """
+    Fetch one page of ``query`` using keyset pagination
+
+    Args:
+        query: ORM query for the rows to page through; its own ordering
+            is replaced
+        keys: List of ``(expression, descending)`` giving a total order;
+            the last key must be unique (e.g. the primary key)
+        cursor: Token from a previous page's ``prev_cursor``/``next_cursor``
+        per_page: Rows per page
+        count: Count the total on the first page
+        count_query: Query counted instead of ``query``, when an
+            equivalent one is cheaper to count (e.g. without its joins)
+
+    Returns:
+        KeysetPage
+    """
+    position = decode_cursor(keys, cursor)
+    if position is None:
+        values, direction, page = None, 'next', 1
+        total = (count_query or query).order_by(None).count() if count else None
+    else:
+        values, direction, page, total = position
+
+    backwards = direction == 'prev'
+    scan_keys = [(expression, descending != backwards) for expression, descending in keys]
+
+    labelled = [expression.label(f'_key{number}') for number, (expression, _) in enumerate(keys)]
+    scan = query.order_by(None).add_columns(*labelled).order_by(*order_clauses(scan_keys))
+    if values is not None:
+        scan = scan.filter(_beyond(scan_keys, values))
+    rows = scan.limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    items = [row[0] for row in rows]
+    first = list(rows[0][1:]) if rows else None
+    last = list(rows[-1][1:]) if rows else None
+
+    # Going forwards there is a previous page unless this is the first;
+    # going backwards, whether one exists is what the extra row told us
+    has_prev = more if backwards else values is not None
+    has_next = (values is not None) if backwards else more
+
+    prev_cursor = encode_cursor(keys, first, 'prev', page - 1, total) \
+        if has_prev and first is not None else None
+    next_cursor = encode_cursor(keys, last, 'next', page + 1, total) \
+        if has_next and last is not None else None
+    return KeysetPage(items, page, per_page, total, prev_cursor, next_cursor)
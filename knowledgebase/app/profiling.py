@@ -0,0 +1,244 @@
+"""
+Request profiling (opt-in, PROFILING_ENABLED)
+
+For every request this records wall time, the number and total time of
+SQL statements (through the engines' cursor events), time spent rendering
+markdown and time spent rendering templates. The numbers are sent back in
+a ``Server-Timing`` header, so browser dev tools show them per request,
+and aggregated into per-endpoint histograms shown at ``/admin/metrics``.
+Histograms are kept per worker process.
+
+A sampled fraction of requests (PROFILING_SAMPLE_RATE) is also run under
+cProfile, or pyinstrument when PROFILING_PROFILER is 'pyinstrument' and it
+is installed, and the profile is written to PROFILING_DIR.
+"""
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in milliseconds"""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def label(self, bound):
+        """Human readable upper bound of a bucket"""
+        if bound == float('inf'):
+            return '> {:g} ms'.format(self.buckets[-2])
+        return '≤ {:g} ms'.format(bound)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class EndpointStats:
+    """Aggregated measurements for one endpoint"""
+
+    def __init__(self):
+        self.wall = Histogram()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.markdown_ms = 0.0
+        self.template_ms = 0.0
+
+    def add(self, timing):
+        self.wall.observe(timing['app'])
+        self.sql_count += timing['sql_count']
+        self.sql_ms += timing['db']
+        self.markdown_ms += timing['markdown']
+        self.template_ms += timing['template']
+
+    def per_request(self, total):
+        return total / self.wall.count if self.wall.count else 0.0
+
+
+class RequestMetrics:
+    """Per-endpoint statistics of one worker process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self.started = time.time()
+
+    def record(self, endpoint, timing):
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(timing)
+
+    def snapshot(self):
+        """Endpoint stats, slowest total time first"""
+        with self._lock:
+            return sorted(self.endpoints.items(), key=lambda item: -item[1].wall.total)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+            self.started = time.time()
+
+
+def _timing():
+    return g.get('profiling_timing') if has_request_context() else None
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to the current request's ``name`` timer"""
+    timing = _timing()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing[name] += (time.perf_counter() - started) * 1000
+
+
+# ==========================================
+# SQL and template hooks
+# ==========================================
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timing() is not None:
+        conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _timing()
+    started = conn.info.get('profiling_started')
+    if timing is not None and started:
+        timing['db'] += (time.perf_counter() - started.pop()) * 1000
+        timing['sql_count'] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        g.profiling_templates.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and g.profiling_templates:
+        started = g.profiling_templates.pop()
+        if not g.profiling_templates:
+            # Only the outermost render counts; nested ones are inside it
+            timing['template'] += (time.perf_counter() - started) * 1000
+
+
+# ==========================================
+# Request hooks
+# ==========================================
+
+def _start_request():
+    g.profiling_timing = {'app': 0.0, 'db': 0.0, 'sql_count': 0, 'markdown': 0.0, 'template': 0.0}
+    g.profiling_templates = []
+    g.profiling_started = time.perf_counter()
+
+    rate = current_app.config.get('PROFILING_SAMPLE_RATE', 0.0)
+    if rate and random.random() < rate:
+        g.profiler = _start_profiler()
+
+
+def _start_profiler():
+    if current_app.config.get('PROFILING_PROFILER') == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            pass
+        else:
+            profiler = Profiler()
+            profiler.start()
+            return profiler
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _dump_profile(profiler, endpoint):
+    directory = current_app.config.get('PROFILING_DIR')
+    os.makedirs(directory, exist_ok=True)
+    name = '{}-{:03d}-{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), int(time.time() * 1000) % 1000,
+                                    os.getpid(), re.sub(r'\W+', '_', endpoint))
+
+    if hasattr(profiler, 'output_html'):
+        profiler.stop()
+        with open(os.path.join(directory, name + '.html'), 'w') as f:
+            f.write(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(directory, name + '.prof'))
+
+
+def _finish_request(response):
+    timing = g.pop('profiling_timing', None)
+    if timing is None:
+        return response
+    timing['app'] = (time.perf_counter() - g.profiling_started) * 1000
+    endpoint = request.endpoint or 'unmatched'
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        _dump_profile(profiler, endpoint)
+
+    current_app.extensions['profiling'].record(endpoint, timing)
+
+    if current_app.config.get('PROFILING_SERVER_TIMING', True):
+        response.headers.add('Server-Timing', ', '.join([
+            'app;dur={:.1f}'.format(timing['app']),
+            'db;dur={:.1f};desc="{} queries"'.format(timing['db'], timing['sql_count']),
+            'markdown;dur={:.1f}'.format(timing['markdown']),
+            'template;dur={:.1f}'.format(timing['template']),
+        ]))
+    return response
+
+
+def init_profiling(app, db):
+    """Instrument ``app`` when PROFILING_ENABLED is set"""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    app.extensions['profiling'] = RequestMetrics()
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
@@ -0,0 +1,588 @@
+"""
+Related articles
+
+Every published article gets a TF-IDF vector over its text (title words
+count three times, summary words twice), pruned to its _VECTOR_TERMS
+strongest terms and scaled to unit length. Two articles are as similar
+as the cosine of their vectors blended with the overlap of their tags:
+
+    score = (1 - w) * cosine + w * shared tags / tags of either
+
+where w is RELATED_ARTICLES_TAG_WEIGHT. The RELATED_ARTICLES_COUNT best
+matches of every article are stored in related_articles, so an article
+page reads its related articles with one indexed lookup.
+
+The vectors are stored in article_terms, which doubles as an inverted
+index: the articles sharing a term with a given one are found through
+that term's postings instead of comparing every pair, and only the
+_MAX_POSTINGS strongest postings of a term are followed. Terms used by
+one article only, or by more than half of them, cannot tell articles
+apart and are left out.
+
+build_related_articles() recomputes everything (`flask build-related`).
+Similarities are computed in pure Python, or a batch of articles at a
+time with array operations when numpy is installed; both give the same
+lists. Saving articles refreshes only those: content_changed marks them
+stale in related_articles_stale, and once the response has been sent (or
+at the end of `flask import-articles`, or by `flask refresh-related`)
+their lists are recomputed and merged into the lists of the articles they
+are now, or were, similar to. Document frequencies are only recounted by
+full builds, so run one now and then.
+"""
+import heapq
+import math
+from array import array
+from collections import Counter
+from datetime import datetime
+from flask import current_app, g, has_request_context
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.db_routing import primary_reads
+from app.models import (Article, ArticleTerm, DocumentFrequency, RelatedArticle,
+                        StaleRelatedArticle, article_tags)
+from app.signals import content_changed, entity_tag, notify_content_changed
+from app.utils import search_words
+
+_articles = Article.__table__
+_terms = ArticleTerm.__table__
+_related = RelatedArticle.__table__
+_document_frequencies = DocumentFrequency.__table__
+_stale = StaleRelatedArticle.__table__
+
+# Words counted once in the content count this many times in the title
+# and summary
+_TITLE_BOOST = 3
+_SUMMARY_BOOST = 2
+
+# Terms kept in each article's vector
+_VECTOR_TERMS = 32
+
+# Terms used by more than this share of the articles are ignored
+_MAX_DOCUMENT_SHARE = 0.5
+
+# Postings followed per term, strongest first; bounds the work for
+# terms that many articles share
+_MAX_POSTINGS = 200
+
+# Best text matches of an article that tags are weighed in for
+_CANDIDATES = 50
+
+# Scores held in memory at once with numpy (16 MB): the articles of a
+# batch times all articles
+_BATCH_CELLS = 1 << 21
+
+# Rows per INSERT and ids per IN list
+_CHUNK = 500
+
+# Beyond this many stale articles a full build is cheaper than
+# refreshing them one by one
+_MAX_INCREMENTAL = 200
+
+
+def _numpy():
+    """The numpy module, or None when it is not installed"""
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _chunks(items, size=_CHUNK):
+    items = list(items)
+    for first in range(0, len(items), size):
+        yield items[first:first + size]
+
+
+def _insert(table, rows):
+    for chunk in _chunks(rows):
+        db.session.execute(table.insert(), chunk)
+
+
+# ==========================================
+# Vectors
+# ==========================================
+
+def _term_counts(title, summary, content):
+    """Boosted number of uses of each term in an article's text"""
+    counts = Counter()
+    for text, boost in ((title, _TITLE_BOOST), (summary, _SUMMARY_BOOST), (content, 1)):
+        if not text:
+            continue
+        for word, count in Counter(search_words(text)).items():
+            if len(word) > 1 and not word.isdigit():
+                counts[word] += boost * count
+    return counts
+
+
+def _vector(counts, document_counts, total):
+    """
+    Pruned, unit-length TF-IDF vector of an article
+
+    Args:
+        counts: Result of _term_counts()
+        document_counts: Dict of term to the number of published articles
+            using it; terms used by a single article are missing
+        total: Number of published articles
+
+    Returns:
+        Dict of term to weight, strongest first
+    """
+    most = total * _MAX_DOCUMENT_SHARE
+    weights = []
+    for term, count in counts.items():
+        document_count = document_counts.get(term)
+        if document_count is None or document_count > most:
+            continue
+        weights.append((term, (1 + math.log(count)) * math.log(total / document_count)))
+    weights = heapq.nlargest(_VECTOR_TERMS, weights, key=lambda item: item[1])
+    norm = math.sqrt(sum(weight * weight for _, weight in weights))
+    if not norm:
+        return {}
+    return {term: weight / norm for term, weight in weights}
+
+
+class _Postings:
+    """Article vectors by term: the positions of the articles using it and their weights"""
+
+    def __init__(self):
+        self.ids = []
+        self.positions = {}
+        self.terms = {}
+
+    def add(self, article_id, term, weight):
+        position = self.positions.get(article_id)
+        if position is None:
+            position = self.positions[article_id] = len(self.ids)
+            self.ids.append(article_id)
+        entry = self.terms.get(term)
+        if entry is None:
+            entry = self.terms[term] = (array('q'), array('d'))
+        entry[0].append(position)
+        entry[1].append(weight)
+
+    def prune(self, limit=_MAX_POSTINGS):
+        """Keep the ``limit`` strongest postings of each term"""
+        for term, (positions, weights) in self.terms.items():
+            if len(positions) > limit:
+                strongest = heapq.nlargest(limit, zip(weights, positions))
+                self.terms[term] = (array('q', [position for _, position in strongest]),
+                                    array('d', [weight for weight, _ in strongest]))
+
+
+# ==========================================
+# Similarity
+# ==========================================
+
+def _python_candidates(postings, vectors):
+    """Best matches of each article through the postings, one article at a time"""
+    for article_id, vector in vectors:
+        scores = {}
+        for term, weight in vector.items():
+            entry = postings.terms.get(term)
+            if entry is None:
+                continue
+            for position, other in zip(*entry):
+                scores[position] = scores.get(position, 0.0) + weight * other
+        scores.pop(postings.positions.get(article_id), None)
+        yield [postings.ids[position]
+               for position in heapq.nlargest(_CANDIDATES, scores, key=scores.get)]
+
+
+def _numpy_candidates(np, postings, vectors):
+    """Best matches of each article through the postings, a batch of articles at a time"""
+    terms = {
+        term: (np.frombuffer(positions, dtype=np.int64), np.frombuffer(weights, dtype=np.float64))
+        for term, (positions, weights) in postings.terms.items()
+    }
+    ids = np.array(postings.ids, dtype=np.int64)
+    size = len(postings.ids)
+    batch_size = max(1, _BATCH_CELLS // max(size, 1))
+    candidates = min(_CANDIDATES, size)
+
+    for first in range(0, len(vectors), batch_size):
+        batch = vectors[first:first + batch_size]
+        rows, factors, positions, weights = [], [], [], []
+        for row, (_, vector) in enumerate(batch):
+            for term, weight in vector.items():
+                entry = terms.get(term)
+                if entry is not None:
+                    rows.append(row)
+                    factors.append(weight)
+                    positions.append(entry[0])
+                    weights.append(entry[1])
+        if not positions:
+            for _ in batch:
+                yield []
+            continue
+
+        # Sum the products of every posting into a row of scores per article
+        lengths = [len(entry) for entry in positions]
+        cells = np.repeat(np.array(rows, dtype=np.int64) * size, lengths) + np.concatenate(positions)
+        products = np.concatenate(weights) * np.repeat(np.array(factors), lengths)
+        scores = np.bincount(cells, weights=products, minlength=len(batch) * size)
+        scores = scores.reshape(len(batch), size)
+        for row, (article_id, _) in enumerate(batch):
+            own = postings.positions.get(article_id)
+            if own is not None:
+                scores[row, own] = 0.0
+
+        # The best _CANDIDATES of each row
+        best = np.argpartition(scores, size - candidates, axis=1)[:, size - candidates:]
+        found = np.take_along_axis(scores, best, axis=1) > 0
+        others = ids[best].tolist()
+        found = found.tolist()
+        for row in range(len(batch)):
+            yield [other_id for other_id, keep in zip(others[row], found[row]) if keep]
+
+
+def _cosine(vector, other):
+    return sum(vector[term] * other[term] for term in vector.keys() & other.keys())
+
+
+def _matches(postings, vectors, weights):
+    """
+    Best text matches of articles
+
+    Candidates are found through the strongest postings of each term, then
+    scored with the whole vectors, so that a pair scores the same from
+    either side.
+
+    Args:
+        postings: _Postings of every article to match against
+        vectors: List of (article id, vector)
+        weights: Dict of article id to its vector, or at least the part of
+            it on the terms of ``vectors``
+
+    Returns:
+        Iterator of (article id, list of (other article id, cosine))
+    """
+    postings.prune()
+    np = _numpy()
+    if np is None:
+        found = _python_candidates(postings, vectors)
+    else:
+        found = _numpy_candidates(np, postings, vectors)
+    for (article_id, vector), others in zip(vectors, found):
+        yield article_id, [(other_id, _cosine(vector, weights[other_id])) for other_id in others]
+
+
+def _tag_sets(article_ids=None):
+    """Tag ids of articles, or of every published article when ``article_ids`` is None"""
+    query = db.select(article_tags.c.article_id, article_tags.c.tag_id)
+    if article_ids is None:
+        queries = [query.join(_articles, _articles.c.id == article_tags.c.article_id)
+                   .where(_articles.c.is_published == True)]
+    else:
+        queries = [query.where(article_tags.c.article_id.in_(chunk))
+                   for chunk in _chunks(article_ids)]
+    tags = {}
+    for query in queries:
+        for article_id, tag_id in db.session.execute(query):
+            tags.setdefault(article_id, set()).add(tag_id)
+    return tags
+
+
+def _blend(cosine, tags, other_tags, tag_weight):
+    shared = len(tags & other_tags)
+    overlap = shared / (len(tags) + len(other_tags) - shared) if shared else 0.0
+    return (1 - tag_weight) * cosine + tag_weight * overlap
+
+
+class _Ranking:
+    """Turns text matches into stored related articles"""
+
+    def __init__(self, tags):
+        self.tags = tags
+        self.count = current_app.config.get('RELATED_ARTICLES_COUNT', 10)
+        self.tag_weight = current_app.config.get('RELATED_ARTICLES_TAG_WEIGHT', 0.25)
+
+    def score(self, article_id, other_id, cosine):
+        return _blend(cosine, self.tags.get(article_id, set()), self.tags.get(other_id, set()),
+                      self.tag_weight)
+
+    def best(self, entries):
+        """The RELATED_ARTICLES_COUNT best of (score, other article id) entries"""
+        return heapq.nlargest(self.count, entries)
+
+    def rank(self, article_id, matches):
+        """Related articles of an article, as (score, other article id)"""
+        return self.best((self.score(article_id, other_id, cosine), other_id)
+                         for other_id, cosine in matches)
+
+
+def _related_rows(article_id, entries):
+    return [{'article_id': article_id, 'rank': rank, 'related_id': other_id, 'score': score}
+            for rank, (score, other_id) in enumerate(entries)]
+
+
+# ==========================================
+# Building and refreshing
+# ==========================================
+
+def build_related_articles():
+    """
+    Recompute the vectors and related articles of every published article
+
+    Document frequencies are counted from Article.search_vector, which
+    already holds the distinct terms of each article. Everything is
+    replaced in the current transaction, and articles marked stale before
+    it started are done; commit it afterwards.
+
+    Returns:
+        Number of published articles indexed
+    """
+    started = datetime.utcnow()
+    published = _articles.c.is_published == True
+    total = 0
+    document_counts = Counter()
+    for search_vector in db.session.execute(
+            db.select(_articles.c.search_vector).where(published)
+            .execution_options(yield_per=_CHUNK)).scalars():
+        total += 1
+        document_counts.update((search_vector or '').split())
+    document_counts = {term: count for term, count in document_counts.items()
+                       if count > 1 and len(term) <= ArticleTerm.term.type.length}
+
+    postings = _Postings()
+    vectors = []
+    for row in db.session.execute(
+            db.select(_articles.c.id, _articles.c.title, _articles.c.summary, _articles.c.content)
+            .where(published)
+            .order_by(_articles.c.id)
+            .execution_options(yield_per=_CHUNK)):
+        vector = _vector(_term_counts(row.title, row.summary, row.content), document_counts, total)
+        vectors.append((row.id, vector))
+        for term, weight in vector.items():
+            postings.add(row.id, term, weight)
+
+    db.session.execute(_related.delete())
+    db.session.execute(_terms.delete())
+    db.session.execute(_document_frequencies.delete())
+    db.session.execute(_stale.delete().where(_stale.c.marked_at <= started))
+    _insert(_document_frequencies, [{'term': term, 'document_count': count}
+                                    for term, count in document_counts.items()])
+    _insert(_terms, [{'article_id': article_id, 'term': term, 'weight': weight}
+                     for article_id, vector in vectors for term, weight in vector.items()])
+
+    ranking = _Ranking(_tag_sets())
+    rows = []
+    for article_id, matches in _matches(postings, vectors, dict(vectors)):
+        rows += _related_rows(article_id, ranking.rank(article_id, matches))
+        if len(rows) >= _CHUNK:
+            _insert(_related, rows)
+            rows = []
+    _insert(_related, rows)
+    return total
+
+
+def refresh_related_articles(article_ids):
+    """
+    Recompute the vectors and related articles of changed articles
+
+    Articles that are no longer published, or no longer exist, leave the
+    index and the lists they were in. The lists of other articles are
+    updated where a changed article now belongs in them or no longer does;
+    a list that loses an article is only filled up again by the next full
+    build. Changes are made in the current transaction.
+
+    Args:
+        article_ids: Ids of the changed articles
+
+    Returns:
+        Ids of the articles whose related articles changed
+    """
+    article_ids = set(article_ids)
+    if not article_ids:
+        return set()
+
+    rows = []
+    for chunk in _chunks(article_ids):
+        rows += db.session.execute(
+            db.select(_articles.c.id, _articles.c.title, _articles.c.summary, _articles.c.content)
+            .where(_articles.c.id.in_(chunk), _articles.c.is_published == True)
+        ).all()
+        db.session.execute(_terms.delete().where(_terms.c.article_id.in_(chunk)))
+
+    total = db.session.execute(
+        db.select(db.func.count()).select_from(_articles).where(_articles.c.is_published == True)
+    ).scalar()
+    counts = {row.id: _term_counts(row.title, row.summary, row.content) for row in rows}
+    document_counts = {}
+    for chunk in _chunks(set().union(*counts.values())):
+        document_counts.update(db.session.execute(
+            db.select(_document_frequencies.c.term, _document_frequencies.c.document_count)
+            .where(_document_frequencies.c.term.in_(chunk))
+        ).all())
+    vectors = [(article_id, _vector(article_counts, document_counts, total))
+               for article_id, article_counts in counts.items()]
+    _insert(_terms, [{'article_id': article_id, 'term': term, 'weight': weight}
+                     for article_id, vector in vectors for term, weight in vector.items()])
+
+    # Postings of the terms of the changed articles, their own included
+    postings = _Postings()
+    weights = {}
+    for chunk in _chunks({term for _, vector in vectors for term in vector}):
+        for article_id, term, weight in db.session.execute(
+                db.select(_terms.c.article_id, _terms.c.term, _terms.c.weight)
+                .where(_terms.c.term.in_(chunk))):
+            postings.add(article_id, term, weight)
+            weights.setdefault(article_id, {})[term] = weight
+    matches = dict(_matches(postings, vectors, weights))
+
+    # Lists that may change: those holding a changed article, and those of
+    # the articles a changed article is now similar to
+    neighbours = set()
+    for chunk in _chunks(article_ids):
+        neighbours.update(db.session.execute(
+            db.select(_related.c.article_id).where(_related.c.related_id.in_(chunk))
+        ).scalars())
+    found = set()
+    for article_id, article_matches in matches.items():
+        for other_id, _ in article_matches:
+            neighbours.add(other_id)
+            found.add((other_id, article_id))
+    neighbours -= article_ids
+
+    ranking = _Ranking(_tag_sets(neighbours | set(matches)))
+    lists = {article_id: ranking.rank(article_id, article_matches)
+             for article_id, article_matches in matches.items()}
+
+    current = {}
+    for chunk in _chunks(neighbours):
+        for row in db.session.execute(
+                db.select(_related.c.article_id, _related.c.related_id, _related.c.score)
+                .where(_related.c.article_id.in_(chunk))
+                .order_by(_related.c.article_id, _related.c.rank)):
+            current.setdefault(row.article_id, []).append((row.score, row.related_id))
+    for neighbour in neighbours:
+        before = current.get(neighbour, [])
+        listed = {other_id for _, other_id in before}
+        entries = [entry for entry in before if entry[1] not in article_ids]
+        for article_id, vector in vectors:
+            if article_id in listed or (neighbour, article_id) in found:
+                cosine = _cosine(vector, weights.get(neighbour, {}))
+                if cosine > 0:
+                    entries.append((ranking.score(neighbour, article_id, cosine), article_id))
+        after = ranking.best(entries)
+        if [other_id for _, other_id in after] != [other_id for _, other_id in before]:
+            lists[neighbour] = after
+
+    for chunk in _chunks(article_ids | set(lists)):
+        db.session.execute(_related.delete().where(_related.c.article_id.in_(chunk)))
+    _insert(_related, [row for article_id, entries in lists.items()
+                       for row in _related_rows(article_id, entries)])
+    return article_ids | set(lists)
+
+
+def mark_related_stale(article_ids):
+    """
+    Record that the related articles of ``article_ids`` need a refresh
+
+    Written in a transaction of its own, as content_changed is sent once
+    the session has committed and can no longer be used.
+    """
+    article_ids = sorted(set(article_ids))
+    marked_at = datetime.utcnow()
+    with db.engine.begin() as connection:
+        for chunk in _chunks(article_ids):
+            connection.execute(_stale.delete().where(_stale.c.article_id.in_(chunk)))
+            connection.execute(_stale.insert(), [{'article_id': article_id, 'marked_at': marked_at}
+                                                 for article_id in chunk])
+
+
+def refresh_stale_related_articles(rebuild=False):
+    """
+    Refresh the related articles of the articles marked stale
+
+    Commits, then sends content_changed for the pages showing the changed
+    lists (``related:<id>``, or ``related`` after a full build). Articles
+    marked again while this runs stay stale for the next call.
+
+    Args:
+        rebuild: Rebuild everything when too many articles are stale for
+            an incremental refresh, instead of leaving them to
+            `flask refresh-related` or `flask build-related`
+
+    Returns:
+        Number of stale articles handled
+    """
+    started = datetime.utcnow()
+    try:
+        with primary_reads():
+            article_ids = set(db.session.execute(db.select(_stale.c.article_id)).scalars())
+            if not article_ids:
+                return 0
+            if len(article_ids) > _MAX_INCREMENTAL and not rebuild:
+                current_app.logger.warning(
+                    '%d articles have stale related articles; run `flask refresh-related` '
+                    'to rebuild them', len(article_ids))
+                return 0
+            if len(article_ids) > _MAX_INCREMENTAL:
+                build_related_articles()
+                tags = {'related'}
+            else:
+                tags = {entity_tag('related', article_id)
+                        for article_id in refresh_related_articles(article_ids)}
+                db.session.execute(_stale.delete().where(_stale.c.marked_at <= started))
+        db.session.commit()
+    except SQLAlchemyError:
+        # The content itself is saved and the articles stay marked; the
+        # lists catch up on the next refresh or full build
+        db.session.rollback()
+        current_app.logger.exception('Refreshing related articles failed')
+        return 0
+    notify_content_changed(tags)
+    return len(article_ids)
+
+
+# ==========================================
+# Reading
+# ==========================================
+
+def find_related_articles(article, limit=5):
+    """
+    Published related articles of ``article``, most similar first
+
+    Returns:
+        List of Article, empty when the article has not been indexed or
+        has no similar articles
+    """
+    return Article.query\
+        .join(RelatedArticle, RelatedArticle.related_id == Article.id)\
+        .filter(RelatedArticle.article_id == article.id, Article.is_published == True)\
+        .order_by(RelatedArticle.rank)\
+        .limit(limit).all()
+
+
+def init_related_articles(app):
+    """Refresh the related articles of articles saved in a request once its response is sent"""
+    app.extensions['related_articles'] = True
+
+    def refresh():
+        with app.app_context():
+            refresh_stale_related_articles()
+
+    @app.after_request
+    def _refresh_related(response):
+        # After the response has gone out, so the save does not wait for it
+        if g.pop('related_stale', False):
+            response.call_on_close(refresh)
+        return response
+
+
+@content_changed.connect
+def _mark_related_stale(sender, tags, **extra):
+    if sender is None or not sender.extensions.get('related_articles'):
+        return
+    prefix = 'article:'
+    article_ids = {int(tag[len(prefix):]) for tag in tags if tag.startswith(prefix)}
+    if not article_ids:
+        return
+    try:
+        mark_related_stale(article_ids)
+    except SQLAlchemyError:
+        sender.logger.exception('Marking related articles stale failed')
+        return
+    if has_request_context():
+        g.related_stale = True
@@ -1,23 +1,45 @@
 """
 Main Application Routes
 """
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, current_app, render_template, request, jsonify
 from flask_login import current_user
 from app.models import Category, SubCategory, Article
+from app.search import search_page, suggest_articles
+from app.suggestions import get_suggestion_index
+from app.related import find_related_articles
+from app.page_cache import cached_page, add_cache_tags
+from app.signals import article_dependency_tags, entity_tag
+from app.conditional import version_etag, article_versions, latest, render_conditional
 from app import db
 
 main_bp = Blueprint('main', __name__)
 
 @main_bp.route('/')
+@cached_page
 def index():
     """Home page - show categories and featured articles"""
     categories = Category.query.order_by(Category.order, Category.name).all()
-    featured_articles = Article.query.filter_by(is_published=True, is_featured=True)\
+    featured_articles = Article.query.options(*Article.listing_options())\
+        .filter_by(is_published=True, is_featured=True)\
         .order_by(Article.created_at.desc()).limit(6).all()
-    recent_articles = Article.query.filter_by(is_published=True)\
+    recent_articles = Article.query.options(*Article.listing_options())\
+        .filter_by(is_published=True)\
         .order_by(Article.created_at.desc()).limit(10).all()
     
-    return render_template('index.html', 
+    add_cache_tags('categories', 'articles')
+    
+    etag = version_etag(
+        'index',
+        [(c.id, c.updated_at, c.published_article_count) for c in categories],
+        article_versions(featured_articles),
+        article_versions(recent_articles)
+    )
+    last_modified = latest(
+        *[c.updated_at for c in categories],
+        *[a.updated_at for a in featured_articles + recent_articles]
+    )
+    
+    return render_conditional(etag, last_modified, 'index.html', 
                          categories=categories,
                          featured_articles=featured_articles,
                          recent_articles=recent_articles)
@@ -28,19 +50,35 @@ def health():
     return jsonify({'status': 'healthy'}), 200
 
 @main_bp.route('/category/<slug>')
+@cached_page
 def category(slug):
     """View category and its subcategories"""
     category = Category.query.filter_by(slug=slug).first_or_404()
     subcategories = category.subcategories.order_by(SubCategory.order, SubCategory.name).all()
-    articles = category.articles.filter_by(is_published=True)\
+    articles = category.articles.options(*Article.listing_options())\
+        .filter_by(is_published=True)\
         .order_by(Article.created_at.desc()).all()
     
-    return render_template('category.html', 
+    add_cache_tags(entity_tag('category', category.id))
+    
+    etag = version_etag(
+        'category', category.id, category.updated_at,
+        [(sc.id, sc.updated_at, sc.published_article_count) for sc in subcategories],
+        article_versions(articles)
+    )
+    last_modified = latest(
+        category.updated_at,
+        *[sc.updated_at for sc in subcategories],
+        *[a.updated_at for a in articles]
+    )
+    
+    return render_conditional(etag, last_modified, 'category.html', 
                          category=category,
                          subcategories=subcategories,
                          articles=articles)
 
 @main_bp.route('/category/<category_slug>/<subcategory_slug>')
+@cached_page
 def subcategory(category_slug, subcategory_slug):
     """View subcategory and its articles"""
     category = Category.query.filter_by(slug=category_slug).first_or_404()
@@ -52,30 +90,71 @@ def subcategory(category_slug, subcategory_slug):
     articles = subcategory.articles.filter_by(is_published=True)\
         .order_by(Article.created_at.desc()).all()
     
-    return render_template('subcategory.html',
+    add_cache_tags(*article_dependency_tags(
+        category_ids=[category.id], subcategory_ids=[subcategory.id]
+    ))
+    
+    etag = version_etag(
+        'subcategory', category.id, category.updated_at,
+        subcategory.id, subcategory.updated_at,
+        [(a.id, a.updated_at) for a in articles]
+    )
+    last_modified = latest(
+        category.updated_at, subcategory.updated_at,
+        *[a.updated_at for a in articles]
+    )
+    
+    return render_conditional(etag, last_modified, 'subcategory.html',
                          category=category,
                          subcategory=subcategory,
                          articles=articles)
 
 @main_bp.route('/article/<slug>')
+@cached_page
 def article(slug):
     """View individual article"""
-    article = Article.query.filter_by(slug=slug, is_published=True).first_or_404()
-    
-    # Get related articles from the same subcategory or category
-    related_articles = Article.query.filter(
-        Article.id != article.id,
-        Article.is_published == True
+    article = Article.query.options(*Article.listing_options(with_tags=True))\
+        .filter_by(slug=slug, is_published=True).first_or_404()
+    
+    # Precomputed most similar articles; until the article is indexed (or
+    # when nothing is similar), others from the same subcategory or category
+    related_articles = find_related_articles(article, limit=5)
+    if not related_articles:
+        related_articles = Article.query.filter(
+            Article.id != article.id,
+            Article.is_published == True
+        )
+        
+        if article.subcategory_id:
+            related_articles = related_articles.filter_by(subcategory_id=article.subcategory_id)
+        else:
+            related_articles = related_articles.filter_by(category_id=article.category_id)
+        
+        related_articles = related_articles.limit(5).all()
+    
+    add_cache_tags('related', entity_tag('related', article.id))
+    add_cache_tags(*article_dependency_tags(
+        article_ids=[article.id] + [related.id for related in related_articles],
+        category_ids=[article.category_id],
+        subcategory_ids=[article.subcategory_id],
+        tag_ids=[tag.id for tag in article.tags]
+    ))
+    
+    # Tags have no timestamp, so their displayed fields are hashed instead
+    etag = version_etag(
+        'article',
+        article_versions([article]),
+        [(t.id, t.name, t.slug, t.color, t.description) for t in article.tags],
+        [(r.id, r.updated_at) for r in related_articles]
+    )
+    last_modified = latest(
+        article.updated_at,
+        article.category.updated_at,
+        article.subcategory.updated_at if article.subcategory else None,
+        *[r.updated_at for r in related_articles]
     )
     
-    if article.subcategory_id:
-        related_articles = related_articles.filter_by(subcategory_id=article.subcategory_id)
-    else:
-        related_articles = related_articles.filter_by(category_id=article.category_id)
-    
-    related_articles = related_articles.limit(5).all()
-    
-    return render_template('article.html', 
+    return render_conditional(etag, last_modified, 'article.html', 
                          article=article,
                          related_articles=related_articles)
 
@@ -83,32 +162,12 @@ def article(slug):
 def search():
     """Search articles"""
     query = request.args.get('q', '').strip()
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor')
     
     if not query:
         return render_template('search.html', articles=[], query='')
     
-    # Enhanced search using LIKE with multiple conditions
-    search_term = f"%{query}%"
-    
-    # Search in title, content, and summary with weighting
-    articles = Article.query.filter(
-        Article.is_published == True,
-        db.or_(
-            Article.title.ilike(search_term),
-            Article.content.ilike(search_term),
-            Article.summary.ilike(search_term)
-        )
-    ).order_by(
-        # Prioritize title matches
-        db.case(
-            (Article.title.ilike(search_term), 1),
-            else_=2
-        ),
-        Article.created_at.desc()
-    ).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    articles = search_page(query, cursor=cursor, per_page=20)
     
     return render_template('search.html', 
                          articles=articles,
@@ -120,18 +179,34 @@ def about():
     return render_template('about.html')
 
 @main_bp.route('/tag/<slug>')
+@cached_page
 def tag(slug):
     """View articles by tag"""
     from app.models import Tag
     tag = Tag.query.filter_by(slug=slug).first_or_404()
     
     # Get all published articles with this tag
-    articles = Article.query.join(Article.tags).filter(
+    articles = Article.query.options(*Article.listing_options(with_tags=True))\
+        .join(Article.tags).filter(
         Tag.id == tag.id,
         Article.is_published == True
     ).order_by(Article.created_at.desc()).all()
     
-    return render_template('tag.html', tag=tag, articles=articles)
+    add_cache_tags(*article_dependency_tags(
+        article_ids=[article.id for article in articles],
+        category_ids=[article.category_id for article in articles],
+        subcategory_ids=[article.subcategory_id for article in articles],
+        tag_ids=[tag.id] + [t.id for article in articles for t in article.tags]
+    ))
+    
+    etag = version_etag(
+        'tag', tag.id, tag.name, tag.slug, tag.color, tag.description,
+        article_versions(articles),
+        [(t.id, t.name, t.slug, t.color) for article in articles for t in article.tags]
+    )
+    last_modified = latest(*[a.updated_at for a in articles])
+    
+    return render_conditional(etag, last_modified, 'tag.html', tag=tag, articles=articles)
 
 @main_bp.route('/api/search/suggestions')
 def search_suggestions():
@@ -143,22 +218,21 @@ def search_suggestions():
     if not query or len(query) < 2:
         return jsonify([])
     
+    if current_app.config.get('SUGGESTION_INDEX_ENABLED', True):
+        # Precomputed payloads; no database access once the index is built
+        suggestions = [
+            {
+                'title': payload['title'],
+                'url': url_for('main.article', slug=payload['slug']),
+                'category': payload['category'],
+                'subcategory': payload['subcategory']
+            }
+            for payload in get_suggestion_index().search(query, limit=8)
+        ]
+        return jsonify(suggestions)
+    
     # Search for matching articles (limit to 8 results)
-    search_term = f"%{query}%"
-    articles = Article.query.filter(
-        Article.is_published == True,
-        db.or_(
-            Article.title.ilike(search_term),
-            Article.summary.ilike(search_term)
-        )
-    ).order_by(
-        # Prioritize title matches
-        db.case(
-            (Article.title.ilike(search_term), 1),
-            else_=2
-        ),
-        Article.created_at.desc()
-    ).limit(8).all()
+    articles = suggest_articles(query, limit=8)
     
     suggestions = [
         {
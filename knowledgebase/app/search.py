@@ -0,0 +1,279 @@
+"""
+Full-text search for articles
+
+On SQLite the articles are indexed in an FTS5 virtual table that database
+triggers keep in sync with the ``articles`` table, and results are ranked
+by BM25. The article body is indexed through ``Article.search_vector``, the
+normalized term document built by ``utils.build_search_document``. Backends
+without FTS5 fall back to LIKE matching against the same document.
+"""
+import re
+import weakref
+from sqlalchemy import event, literal_column, table, column, text
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import Article
+from app.pagination import keyset_paginate, order_clauses
+
+FTS_TABLE = 'articles_fts'
+
+# Indexed articles columns, and their bm25() weights in the same order
+FTS_COLUMNS = ('title', 'summary', 'search_vector')
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Lightweight handle on the virtual table (not part of the model metadata,
+# so create_all() never tries to create it as a regular table)
+articles_fts = table(FTS_TABLE, column('rowid'))
+
+_COLS = ', '.join(FTS_COLUMNS)
+_NEW = ', '.join(f'new.{name}' for name in FTS_COLUMNS)
+_OLD = ', '.join(f'old.{name}' for name in FTS_COLUMNS)
+
+_FTS_TRIGGERS = (f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au')
+
+_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_COLS},
+        content='articles', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON articles BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON articles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_COLS} ON articles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD});
+        INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW});
+    END""",
+]
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Engine -> whether the FTS5 index is usable on it
+_fts_enabled = weakref.WeakKeyDictionary()
+
+
+def _create_fts(connection):
+    """Create the FTS table and triggers; return True if FTS5 is available"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    try:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}
+        ).first() is not None
+        if exists and _indexed_columns(connection) != FTS_COLUMNS:
+            # Index built for an older column layout: start over
+            for trigger in _FTS_TRIGGERS:
+                connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {trigger}')
+            connection.exec_driver_sql(f'DROP TABLE {FTS_TABLE}')
+            exists = False
+        for statement in _FTS_DDL:
+            connection.exec_driver_sql(statement)
+        if not exists:
+            connection.exec_driver_sql(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+    except OperationalError:
+        # SQLite was built without FTS5
+        return False
+    return True
+
+
+def _indexed_columns(connection):
+    """Return the column names of the existing FTS table"""
+    result = connection.exec_driver_sql(f'SELECT * FROM {FTS_TABLE} LIMIT 0')
+    return tuple(result.keys())
+
+
+@event.listens_for(Article.__table__, 'after_create')
+def _articles_created(target, connection, **kw):
+    """Create the search index alongside the articles table"""
+    _fts_enabled[connection.engine] = _create_fts(connection)
+
+
+def ensure_search_index():
+    """
+    Make sure the full-text index exists for the current database
+
+    Safe to call on every start-up; an index created for an existing
+    database is populated from the articles already stored.
+
+    Returns:
+        True if the FTS5 index is in use, False if LIKE search is used
+    """
+    engine = db.engine
+    with engine.begin() as connection:
+        enabled = _create_fts(connection)
+    _fts_enabled[engine] = enabled
+    return enabled
+
+
+def rebuild_search_index():
+    """Repopulate the full-text index from the articles table"""
+    if not fts_enabled():
+        return False
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+    return True
+
+
+def fts_enabled():
+    """Return True if searches on the current database can use FTS5"""
+    engine = db.engine
+    if engine not in _fts_enabled:
+        enabled = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as connection:
+                enabled = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                    {'name': FTS_TABLE}
+                ).first() is not None
+        _fts_enabled[engine] = enabled
+    return _fts_enabled[engine]
+
+
+def _match_expression(tokens, columns=None):
+    """
+    Build an FTS5 MATCH expression from query tokens
+
+    Every token is quoted (so user input can never inject FTS syntax) and
+    prefix-matched, and all tokens must match.
+    """
+    expression = ' '.join(f'"{token}"*' for token in tokens)
+    if columns:
+        expression = f"{{{' '.join(columns)}}} : ({expression})"
+    return expression
+
+
+def _fts_query(tokens, columns=None, weights=BM25_WEIGHTS):
+    """
+    Published articles matching all tokens, ordered by BM25 rank
+
+    The MATCH runs in a subquery on the FTS table so that the index drives
+    the query. Joining the table itself and filtering on ``is_published``
+    lets SQLite scan the published articles instead and run the MATCH once
+    per row, which is what the count would do: it is made on the matching
+    rowids instead (``id IN (SELECT rowid ...)``).
+
+    Returns:
+        ``(query, keys, count_query)``: the article query, its sort keys
+        (BM25 rank, lower is better, then newest first) and a cheaper
+        query for the number of matches
+    """
+    fts = literal_column(FTS_TABLE)
+    match = fts.op('MATCH')(_match_expression(tokens, columns))
+    ranked = db.select(
+        articles_fts.c.rowid.label('article_id'),
+        db.func.bm25(fts, *weights).label('rank')
+    ).where(match).subquery('fts_ranked')
+    keys = [
+        (ranked.c.rank, False),
+        (Article.created_at, True),
+        (Article.id, True),
+    ]
+    query = Article.query.join(
+        ranked, ranked.c.article_id == Article.id
+    ).filter(
+        Article.is_published == True
+    ).order_by(*order_clauses(keys))
+    count_query = Article.query.filter(
+        Article.is_published == True,
+        Article.id.in_(db.select(articles_fts.c.rowid).where(match))
+    )
+    return query, keys, count_query
+
+
+def _like_keys(query):
+    """Sort keys for LIKE results: title matches first, then newest first"""
+    search_term = f"%{query}%"
+    return [
+        # Prioritize title matches
+        (db.case((Article.title.ilike(search_term), 1), else_=2), False),
+        (Article.created_at, True),
+        (Article.id, True),
+    ]
+
+
+def _like_query(query, condition):
+    """Published articles matching ``condition``, title matches first"""
+    return Article.query.filter(
+        Article.is_published == True,
+        condition
+    ).order_by(*order_clauses(_like_keys(query)))
+
+
+def _search_query(query):
+    """The matching query for search text, its sort keys and its count query"""
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return Article.query.filter(db.false()), [(Article.id, True)], None
+
+    if not fts_enabled():
+        # search_vector is case-folded, so every term can use a plain LIKE
+        return _like_query(query, db.and_(*[
+            Article.search_vector.like(f"%{token.casefold()}%") for token in tokens
+        ])), _like_keys(query), None
+    return _fts_query(tokens)
+
+
+def search_articles(query):
+    """
+    Search published articles
+
+    Args:
+        query: Search text as typed by the user
+
+    Returns:
+        Article query, best matches first
+    """
+    return _search_query(query)[0]
+
+
+def search_page(query, cursor=None, per_page=20):
+    """
+    One page of search results, best matches first
+
+    Args:
+        query: Search text as typed by the user
+        cursor: Token from a previous page (see app.pagination)
+        per_page: Results per page
+
+    Returns:
+        KeysetPage of articles with category and subcategory loaded
+    """
+    articles, keys, count_query = _search_query(query)
+    return keyset_paginate(articles.options(*Article.listing_options()), keys,
+                           cursor=cursor, per_page=per_page, count_query=count_query)
+
+
+def suggest_articles(query, limit=8):
+    """
+    Find published articles for live search suggestions
+
+    Only titles and summaries are matched.
+
+    Args:
+        query: Partial search text
+        limit: Maximum number of articles to return
+
+    Returns:
+        List of articles, best matches first, with category and
+        subcategory loaded
+    """
+    if not fts_enabled():
+        search_term = f"%{query}%"
+        return _like_query(query, db.or_(
+            Article.title.ilike(search_term),
+            Article.summary.ilike(search_term)
+        )).options(*Article.listing_options()).limit(limit).all()
+
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return []
+    return _fts_query(tokens, columns=['title', 'summary'])[0]\
+        .options(*Article.listing_options()).limit(limit).all()
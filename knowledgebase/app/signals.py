@@ -0,0 +1,128 @@
+"""
+Content change notifications
+
+Session hooks record which entities a transaction touched and, once it
+commits, send ``content_changed`` with a set of dependency tags:
+
+- ``article:<id>``, ``category:<id>``, ``subcategory:<id>``, ``tag:<id>``
+  for each changed row, plus the categories, subcategories and tags an
+  article belonged to before and after the change
+- ``articles`` and ``categories`` whenever any article or any category
+  (or subcategory) changed, for pages that list them all
+
+Caches subscribe to drop whatever depends on those tags. Code that
+changes rows without going through the ORM session (bulk UPDATE/DELETE)
+must call notify_content_changed() itself.
+"""
+from blinker import Namespace
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from app import db
+from app.models import Category, SubCategory, Article, Tag, article_tags
+
+_signals = Namespace()
+
+content_changed = _signals.signal('content-changed')
+
+_PENDING_KEY = 'content_changed_tags'
+
+
+def entity_tag(kind, id):
+    """Return the dependency tag for one row, e.g. ``article:3``"""
+    return f'{kind}:{id}'
+
+
+def notify_content_changed(tags):
+    """Send content_changed for ``tags`` right away"""
+    tags = set(tags)
+    if not tags:
+        return
+    sender = current_app._get_current_object() if has_app_context() else None
+    content_changed.send(sender, tags=tags)
+
+
+def article_dependency_tags(article_ids=(), category_ids=(), subcategory_ids=(), tag_ids=()):
+    """Return the entity tags for articles and the rows they belong to"""
+    tags = set()
+    tags.update(entity_tag('article', id) for id in article_ids if id is not None)
+    tags.update(entity_tag('category', id) for id in category_ids if id is not None)
+    tags.update(entity_tag('subcategory', id) for id in subcategory_ids if id is not None)
+    tags.update(entity_tag('tag', id) for id in tag_ids if id is not None)
+    return tags
+
+
+def _stored_owner_tags(session, articles, subcategories):
+    """Tags for the owners rows had before this flush, read from the database"""
+    article_ids = [obj.id for obj in articles if db.inspect(obj).persistent]
+    subcategory_ids = [obj.id for obj in subcategories if db.inspect(obj).persistent]
+    tags = set()
+    if article_ids:
+        table = Article.__table__
+        rows = session.execute(
+            db.select(table.c.category_id, table.c.subcategory_id)
+            .where(table.c.id.in_(article_ids))
+        ).all()
+        tag_ids = session.execute(
+            db.select(article_tags.c.tag_id)
+            .where(article_tags.c.article_id.in_(article_ids))
+        ).scalars()
+        tags.add('articles')
+        tags |= article_dependency_tags(
+            category_ids=[row.category_id for row in rows],
+            subcategory_ids=[row.subcategory_id for row in rows],
+            tag_ids=tag_ids
+        )
+    if subcategory_ids:
+        table = SubCategory.__table__
+        tags.update(entity_tag('category', id) for id in session.execute(
+            db.select(table.c.category_id).where(table.c.id.in_(subcategory_ids))
+        ).scalars())
+    return tags
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_old_owners(session, flush_context, instances):
+    """Tag the pages that showed rows as they were before the flush"""
+    changed = session.dirty | session.deleted
+    articles = [obj for obj in changed if isinstance(obj, Article)]
+    subcategories = [obj for obj in changed if isinstance(obj, SubCategory)]
+    if articles or subcategories:
+        session.info.setdefault(_PENDING_KEY, set()).update(
+            _stored_owner_tags(session, articles, subcategories)
+        )
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_new_owners(session, flush_context):
+    """Tag the pages that show rows as they are after the flush"""
+    tags = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Article):
+            tags.add('articles')
+            tags |= article_dependency_tags(
+                article_ids=[obj.id],
+                category_ids=[obj.category_id],
+                subcategory_ids=[obj.subcategory_id],
+                tag_ids=[tag.id for tag in obj.tags] if not db.inspect(obj).deleted else ()
+            )
+        elif isinstance(obj, Category):
+            tags |= {'categories', entity_tag('category', obj.id)}
+        elif isinstance(obj, SubCategory):
+            tags |= {'categories', entity_tag('subcategory', obj.id),
+                     entity_tag('category', obj.category_id)}
+        elif isinstance(obj, Tag):
+            tags.add(entity_tag('tag', obj.id))
+    if tags:
+        session.info.setdefault(_PENDING_KEY, set()).update(tags)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _send_content_changed(session):
+    tags = session.info.pop(_PENDING_KEY, None)
+    if tags:
+        notify_content_changed(tags)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_content_changed(session):
+    session.info.pop(_PENDING_KEY, None)
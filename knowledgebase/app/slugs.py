@@ -0,0 +1,201 @@
+"""
+URL slugs
+
+slugify() turns a title or name into a slug. allocate_slugs() makes slugs
+unique against a slug column the way the admin always has (``title``,
+then ``title-1``, ``title-2``, ...), for many titles at once: the
+existing collisions of every base are read in one query and the next
+free suffixes are picked in memory. commit_with_unique_slug() does the
+same for one admin save and retries when a concurrent save commits the
+chosen slug first.
+"""
+import re
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+_SUFFIXED_RE = re.compile(r'^(.+)-([1-9]\d*)$')
+
+# SQLite nests OR terms one level each and allows 1000 levels
+_BASES_PER_QUERY = 200
+
+# Characters kept free in the column for a -N suffix
+_SUFFIX_ROOM = 10
+
+# Saves rolled back by a concurrent save taking their slug
+_SLUG_RETRIES = 3
+
+
+def slugify(text):
+    """Convert text to URL-friendly slug"""
+    text = text.lower().strip()
+    text = re.sub(r'[^\w\s-]', '', text)
+    text = re.sub(r'[-\s]+', '-', text)
+    return text
+
+
+def slug_base(text, column, fallback):
+    """
+    Base slug for ``text`` that fits ``column`` with a suffix
+
+    Args:
+        text: Title or name
+        column: Slug column, e.g. ``Article.slug``
+        fallback: Slug used when ``text`` has no slug characters
+    """
+    length = column.type.length - _SUFFIX_ROOM
+    return slugify(text)[:length].strip('-') or fallback
+
+
+def _starts_with(column, prefix):
+    """Criterion for values of ``column`` starting with ``prefix``"""
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    condition = column.like(escaped + '%', escape='\\')
+    if db.session.get_bind().dialect.name == 'sqlite':
+        # SQLite's LIKE ignores case and so cannot use the index; the same
+        # range on the (binary collated) column can
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        condition = db.and_(column >= prefix, column < upper, condition)
+    return condition
+
+
+def taken_suffixes(column, bases, where=None):
+    """
+    Suffixes already used for each of ``bases`` in ``column``
+
+    Args:
+        column: Slug column, e.g. ``Article.slug``
+        bases: Base slugs
+        where: Optional SQL criterion for the rows that count, e.g. all
+            but the row being renamed, or the subcategories of one category
+
+    Returns:
+        Dict of base slug to a set of used suffixes (0 for the bare base)
+    """
+    taken = {base: set() for base in bases}
+    ordered = sorted(taken)
+    for first in range(0, len(ordered), _BASES_PER_QUERY):
+        chunk = ordered[first:first + _BASES_PER_QUERY]
+        criteria = [column.in_(chunk)]
+        criteria += [_starts_with(column, base + '-') for base in chunk]
+        query = db.select(column).where(db.or_(*criteria))
+        if where is not None:
+            query = query.where(where)
+        for slug in db.session.execute(query).scalars():
+            if slug in taken:
+                taken[slug].add(0)
+            match = _SUFFIXED_RE.match(slug)
+            if match and match.group(1) in taken:
+                taken[match.group(1)].add(int(match.group(2)))
+    return taken
+
+
+def allocate_slugs(column, bases, where=None, taken=None):
+    """
+    Unique slugs for ``bases`` in order, also unique among themselves
+
+    One query per 200 bases, whatever the number of collisions. The
+    result is only guaranteed unique until another transaction takes one
+    of the slugs; the unique constraint on the column catches that.
+
+    Args:
+        column: Slug column, e.g. ``Article.slug``
+        bases: Base slugs, possibly repeated
+        where: Optional SQL criterion for the rows that count
+        taken: Result of taken_suffixes() for ``bases``, if already known
+
+    Returns:
+        List of slugs, one per base
+    """
+    if taken is None:
+        taken = taken_suffixes(column, bases, where)
+    slugs, assigned = [], set()
+    for base in bases:
+        used = taken[base]
+        suffix = 0
+        # 'post-1' may be both a suffixed 'post' and a base of its own
+        while suffix in used or _with_suffix(base, suffix) in assigned:
+            suffix += 1
+        used.add(suffix)
+        slug = _with_suffix(base, suffix)
+        assigned.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def _with_suffix(base, suffix):
+    return f'{base}-{suffix}' if suffix else base
+
+
+def _suffix_of(slug, base):
+    """Suffix of ``slug`` as a variant of ``base`` (0 for ``base``), or None"""
+    if slug == base:
+        return 0
+    match = _SUFFIXED_RE.match(slug or '')
+    if match and match.group(1) == base:
+        return int(match.group(2))
+    return None
+
+
+def _loaded_state(state):
+    """Loaded columns and collections of an object, to set again later"""
+    values = {}
+    for column in state.mapper.column_attrs:
+        if column.key in state.dict and column.key not in ('id', 'slug'):
+            values[column.key] = state.dict[column.key]
+    # Many-to-one relationships are left out: the loaded object can be
+    # older than a foreign key column set since
+    for relationship in state.mapper.relationships:
+        if relationship.uselist and relationship.key in state.dict:
+            values[relationship.key] = list(state.dict[relationship.key])
+    return values
+
+
+def is_slug_conflict(error):
+    """Whether an IntegrityError comes from a unique slug constraint"""
+    return 'slug' in str(error.orig).lower()
+
+
+def commit_with_unique_slug(obj, base, where=None):
+    """
+    Give ``obj`` a unique slug for ``base`` and commit the session
+
+    A slug the row already has is kept while it is still ``base`` or one
+    of its numbered variants, so editing an article without renaming it
+    does not move its URL. If another save commits the chosen slug first,
+    the unique constraint rejects this commit; the transaction is rolled
+    back, the changes to ``obj`` are applied again and the next free slug
+    is used.
+
+    Args:
+        obj: New or changed Article, Category, SubCategory or Tag
+        base: Base slug, see slug_base()
+        where: Optional SQL criterion for the rows the slug must differ
+            from, e.g. ``SubCategory.category_id == 3``
+    """
+    model = type(obj)
+    state = db.inspect(obj)
+    if state.persistent:
+        condition = model.id != obj.id
+        where = condition if where is None else db.and_(where, condition)
+        # A rollback expires the object, losing changes that were already
+        # autoflushed as well as pending ones; keep its loaded state here
+        changes = _loaded_state(state)
+
+    for attempt in range(_SLUG_RETRIES):
+        with db.session.no_autoflush:
+            taken = taken_suffixes(model.slug, [base], where)
+        suffix = _suffix_of(obj.slug, base) if attempt == 0 else None
+        if suffix is None or suffix in taken[base]:
+            obj.slug = allocate_slugs(model.slug, [base], taken=taken)[0]
+        try:
+            db.session.commit()
+            return
+        except IntegrityError as error:
+            db.session.rollback()
+            if attempt == _SLUG_RETRIES - 1 or not is_slug_conflict(error):
+                raise
+            if state.persistent:
+                for key, value in changes.items():
+                    setattr(obj, key, value)
+            else:
+                db.session.add(obj)
@@ -0,0 +1,79 @@
+"""
+SQLite connection tuning
+
+SQLite's defaults suit a single process: rollback journaling makes readers
+wait for writers, and a busy database fails at once with "database is
+locked". Every pooled connection to an SQLite engine is set up with the
+pragmas in ``SQLITE_PRAGMAS``; the defaults switch to WAL (readers no
+longer block behind admin writes), let writers wait for the lock, and give
+each connection a larger page cache and memory map.
+
+The connection pool is sized from ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW`` and
+``DB_POOL_TIMEOUT`` so threaded workers do not queue for connections.
+"""
+import re
+from sqlalchemy import event
+
+# Pragma values are interpolated into SQL, so only plain words and numbers
+_PRAGMA_VALUE_RE = re.compile(r'-?\w+')
+
+
+def _is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def _is_memory(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def _pragma_statements(pragmas):
+    """Validate ``pragmas`` and return the statements that apply them"""
+    statements = []
+    for name, value in pragmas.items():
+        if value is None or value == '':
+            continue
+        if not name.isidentifier() or not _PRAGMA_VALUE_RE.fullmatch(str(value)):
+            raise ValueError(f'Invalid SQLite pragma setting: {name}={value!r}')
+        statements.append(f'PRAGMA {name}={value}')
+    return statements
+
+
+def configure_engine_options(app):
+    """
+    Add connection pool settings to SQLALCHEMY_ENGINE_OPTIONS
+
+    Must run before ``db.init_app(app)``. In-memory SQLite databases keep
+    Flask-SQLAlchemy's single shared connection.
+    """
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or ''
+    if _is_sqlite(uri) and _is_memory(uri):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('pool_size', app.config.get('DB_POOL_SIZE', 5))
+    options.setdefault('max_overflow', app.config.get('DB_MAX_OVERFLOW', 10))
+    options.setdefault('pool_timeout', app.config.get('DB_POOL_TIMEOUT', 30))
+
+
+def apply_pragmas(engine, pragmas):
+    """Run ``pragmas`` on every new connection made by ``engine``"""
+    statements = _pragma_statements(pragmas)
+    if not statements:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def init_sqlite_tuning(app, db):
+    """Apply the configured pragmas to every SQLite engine of ``app``"""
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                apply_pragmas(engine, pragmas)
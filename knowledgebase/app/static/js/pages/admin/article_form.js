@@ -0,0 +1,64 @@
+// Load subcategories when category changes
+const categorySelect = document.getElementById('category_id');
+
+categorySelect.addEventListener('change', function() {
+    const categoryId = this.value;
+    const subcategorySelect = document.getElementById('subcategory_id');
+    
+    // Clear existing options
+    subcategorySelect.innerHTML = '<option value="">-- Optional --</option>';
+    
+    if (categoryId) {
+        // Fetch subcategories via API
+        fetch(`/admin/api/subcategories/${categoryId}`)
+            .then(response => response.json())
+            .then(data => {
+                data.forEach(subcategory => {
+                    const option = document.createElement('option');
+                    option.value = subcategory.id;
+                    option.textContent = subcategory.name;
+                    subcategorySelect.appendChild(option);
+                });
+                
+                // Restore selected subcategory if editing
+                if (subcategorySelect.dataset.selected) {
+                    subcategorySelect.value = subcategorySelect.dataset.selected;
+                }
+            })
+            .catch(error => console.error('Error loading subcategories:', error));
+    }
+});
+
+// Trigger on page load if editing
+if (categorySelect.dataset.editing) {
+    categorySelect.dispatchEvent(new Event('change'));
+}
+
+// Markdown insertion helper
+function insertMarkdown(before, after) {
+    const textarea = document.getElementById('content');
+    const start = textarea.selectionStart;
+    const end = textarea.selectionEnd;
+    const selectedText = textarea.value.substring(start, end);
+    const replacement = before + selectedText + after;
+    
+    textarea.value = textarea.value.substring(0, start) + replacement + textarea.value.substring(end);
+    
+    // Set cursor position
+    const newCursorPos = start + before.length + selectedText.length;
+    textarea.setSelectionRange(newCursorPos, newCursorPos);
+    textarea.focus();
+}
+
+// Keyboard shortcuts
+document.getElementById('content').addEventListener('keydown', function(e) {
+    if (e.ctrlKey || e.metaKey) {
+        if (e.key === 'b') {
+            e.preventDefault();
+            insertMarkdown('**', '**');
+        } else if (e.key === 'i') {
+            e.preventDefault();
+            insertMarkdown('*', '*');
+        }
+    }
+});
@@ -0,0 +1,67 @@
+// Bulk actions on the article list
+const bulkForm = document.getElementById('bulk-form');
+
+if (bulkForm) {
+    const selectAll = document.getElementById('bulk-select-all');
+    const allMatching = document.getElementById('bulk-all-matching');
+    const countLabel = document.getElementById('bulk-count');
+    const actionSelect = document.getElementById('bulk-action');
+    const checkboxes = document.querySelectorAll('.bulk-checkbox');
+
+    function updateCount() {
+        const checked = document.querySelectorAll('.bulk-checkbox:checked').length;
+        countLabel.textContent = checked ? `${checked} selected` : 'Select all';
+        selectAll.checked = checked === checkboxes.length;
+        selectAll.indeterminate = checked > 0 && checked < checkboxes.length;
+    }
+
+    selectAll.addEventListener('change', function() {
+        checkboxes.forEach(checkbox => { checkbox.checked = this.checked; });
+        updateCount();
+    });
+    checkboxes.forEach(checkbox => checkbox.addEventListener('change', updateCount));
+
+    // Show only the inputs the chosen action needs
+    actionSelect.addEventListener('change', function() {
+        document.querySelectorAll('.bulk-param').forEach(input => {
+            const used = input.dataset.actions.split(' ').includes(this.value);
+            input.hidden = !used;
+            input.required = used && input.name !== 'subcategory_id';
+        });
+    });
+
+    // Subcategories of the target category
+    document.getElementById('bulk-category').addEventListener('change', function() {
+        const subcategorySelect = document.getElementById('bulk-subcategory');
+        subcategorySelect.innerHTML = '<option value="">-- No subcategory --</option>';
+        if (!this.value) {
+            return;
+        }
+        fetch(`/admin/api/subcategories/${this.value}`)
+            .then(response => response.json())
+            .then(data => {
+                data.forEach(subcategory => {
+                    const option = document.createElement('option');
+                    option.value = subcategory.id;
+                    option.textContent = subcategory.name;
+                    subcategorySelect.appendChild(option);
+                });
+            })
+            .catch(error => console.error('Error loading subcategories:', error));
+    });
+
+    bulkForm.addEventListener('submit', function(e) {
+        const count = allMatching && allMatching.checked
+            ? 'all matching'
+            : document.querySelectorAll('.bulk-checkbox:checked').length;
+        if (!count) {
+            e.preventDefault();
+            alert('Select at least one article.');
+            return;
+        }
+        const action = actionSelect.options[actionSelect.selectedIndex].text.toLowerCase();
+        if (!confirm(`Apply "${action}" to ${count} article(s)?`)) {
+            e.preventDefault();
+        }
+    });
+}
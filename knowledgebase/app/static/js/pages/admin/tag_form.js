@@ -0,0 +1,12 @@
+// Live preview of tag color and name
+const colorInput = document.getElementById('color');
+const nameInput = document.getElementById('name');
+const tagPreview = document.getElementById('tagPreview');
+
+colorInput.addEventListener('input', function() {
+    tagPreview.style.backgroundColor = this.value;
+});
+
+nameInput.addEventListener('input', function() {
+    tagPreview.textContent = this.value || 'Preview';
+});
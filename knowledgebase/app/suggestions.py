@@ -0,0 +1,288 @@
+"""
+In-memory index for live search suggestions
+
+The live search box asks for suggestions on nearly every keystroke, so
+instead of querying the database each worker keeps a sorted array of
+``(word, article_id)`` pairs built from the words of published titles and
+summaries, plus a ready-made payload per article. A prefix lookup is two
+binary searches.
+
+The index is built on first use and then kept up to date from the
+suggestion_changes table, which every worker shares through the database
+whatever the cache backends are: content_changed appends a row for each
+changed article (or renamed category or subcategory) under an increasing
+id, and each worker reads the rows after the last id it has applied (at
+most once per SUGGESTION_INDEX_CHECK_INTERVAL seconds, right away after
+its own changes) and re-indexes just those articles. Rows older than
+SUGGESTION_CHANGES_RETENTION seconds are pruned, so a worker that has not
+synced for that long rebuilds instead.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.db_routing import primary_reads
+from app.metrics import cache_lookup
+from app.models import Article, Category, SubCategory, SuggestionChange
+from app.signals import content_changed
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_changes = SuggestionChange.__table__
+
+# Beyond this many changed articles (a bulk import) rebuilding is cheaper
+# than re-indexing them one by one
+_MAX_INCREMENTAL = 1000
+
+
+def _words(text):
+    return set(_WORD_RE.findall(text.casefold())) if text else set()
+
+
+class SuggestionIndex:
+    """Sorted prefix array over published article titles and summaries"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pairs = []       # sorted (word, article_id)
+        self._articles = {}    # article_id -> entry
+        self.built = False
+
+    def build(self, articles):
+        """Replace the whole index with ``articles``"""
+        entries = {article.id: self._entry(article) for article in articles}
+        pairs = sorted((word, id) for id, entry in entries.items() for word in entry['words'])
+        with self._lock:
+            self._articles = entries
+            self._pairs = pairs
+            self.built = True
+
+    def update(self, article_ids, articles):
+        """Re-index ``article_ids``; those missing from ``articles`` are removed"""
+        fresh = {article.id: article for article in articles}
+        with self._lock:
+            for id in article_ids:
+                old = self._articles.pop(id, None)
+                if old is not None:
+                    for word in old['words']:
+                        position = bisect_left(self._pairs, (word, id))
+                        if position < len(self._pairs) and self._pairs[position] == (word, id):
+                            del self._pairs[position]
+                if id in fresh:
+                    entry = self._entry(fresh[id])
+                    self._articles[id] = entry
+                    for word in entry['words']:
+                        insort(self._pairs, (word, id))
+
+    @staticmethod
+    def _entry(article):
+        title_words = _words(article.title)
+        return {
+            'payload': {
+                'title': article.title,
+                'slug': article.slug,
+                'category': article.category,
+                'subcategory': article.subcategory,
+            },
+            'title_words': title_words,
+            'words': title_words | _words(article.summary),
+            'created_at': article.created_at.timestamp() if article.created_at else 0,
+        }
+
+    def _prefix_ids(self, prefix):
+        """Ids of articles having a word that starts with ``prefix``"""
+        ids = set()
+        position = bisect_left(self._pairs, (prefix,))
+        while position < len(self._pairs):
+            word, id = self._pairs[position]
+            if not word.startswith(prefix):
+                break
+            ids.add(id)
+            position += 1
+        return ids
+
+    def search(self, query, limit=8):
+        """
+        Find articles whose title/summary words start with every query word
+
+        Returns:
+            Up to ``limit`` payloads, title matches first, then newest first
+        """
+        tokens = _WORD_RE.findall(query.casefold())
+        if not tokens:
+            return []
+        with self._lock:
+            ids = None
+            for token in tokens:
+                matches = self._prefix_ids(token)
+                ids = matches if ids is None else ids & matches
+                if not ids:
+                    return []
+            entries = [self._articles[id] for id in ids]
+
+        def rank(entry):
+            in_title = all(any(word.startswith(token) for word in entry['title_words'])
+                           for token in tokens)
+            return (not in_title, -entry['created_at'])
+
+        return [entry['payload'] for entry in sorted(entries, key=rank)[:limit]]
+
+
+def _published_articles(*criteria):
+    """Rows of the published articles with just the columns _entry() uses"""
+    return db.session.execute(
+        db.select(Article.id, Article.title, Article.slug, Article.summary, Article.created_at,
+                  Category.name.label('category'), SubCategory.name.label('subcategory'))
+        .join(Category, Article.category_id == Category.id)
+        .outerjoin(SubCategory, Article.subcategory_id == SubCategory.id)
+        .where(Article.is_published == True, *criteria)
+    ).all()
+
+
+def _stale_ids(tags, kind):
+    prefix = kind + ':'
+    return {int(tag[len(prefix):]) for tag in tags if tag.startswith(prefix)}
+
+
+def init_suggestion_index(app):
+    """Attach an empty suggestion index to ``app``; it is built on first use"""
+    if not app.config.get('SUGGESTION_INDEX_ENABLED', True):
+        return
+    app.extensions['suggestion_index'] = {
+        'index': SuggestionIndex(),
+        'lock': threading.Lock(),
+        'sequence': 0,       # id of the last suggestion_changes row applied
+        'synced_at': 0,      # wall clock time of the last read of them
+        'checked_at': 0,
+    }
+
+
+# ==========================================
+# Change log
+# ==========================================
+
+def record_suggestion_changes(changes):
+    """
+    Append ``changes`` to the log the suggestion indexes sync from
+
+    Written in a transaction of its own, as content_changed is sent once
+    the session has committed and can no longer be used. Rows past
+    SUGGESTION_CHANGES_RETENTION are pruned on the way.
+
+    Args:
+        changes: Iterable of ``(kind, id)`` pairs, kind being ``article``,
+            ``category`` or ``subcategory``
+    """
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=current_app.config.get('SUGGESTION_CHANGES_RETENTION', 3600))
+    with db.engine.begin() as connection:
+        connection.execute(_changes.delete().where(_changes.c.changed_at < cutoff))
+        connection.execute(_changes.insert(), [
+            {'kind': kind, 'entity_id': id, 'changed_at': now} for kind, id in sorted(changes)
+        ])
+
+
+def _changes_since(sequence):
+    """
+    Read the changes logged after ``sequence``
+
+    Returns:
+        Tuple of the last id read and the sets of changed article,
+        category and subcategory ids
+    """
+    changed = {'article': set(), 'category': set(), 'subcategory': set()}
+    rows = db.session.execute(
+        db.select(_changes.c.id, _changes.c.kind, _changes.c.entity_id)
+        .where(_changes.c.id > sequence).order_by(_changes.c.id)
+    ).all()
+    for id, kind, entity_id in rows:
+        sequence = id
+        changed[kind].add(entity_id)
+    return sequence, changed['article'], changed['category'], changed['subcategory']
+
+
+def _apply_changes(index, article_ids, category_ids, subcategory_ids):
+    """Re-index the changed articles and those showing a renamed (sub)category"""
+    article_ids = set(article_ids)
+    if category_ids or subcategory_ids:
+        article_ids.update(db.session.execute(db.select(Article.id).where(db.or_(
+            Article.category_id.in_(category_ids),
+            Article.subcategory_id.in_(subcategory_ids)
+        ))).scalars())
+    if article_ids:
+        index.update(article_ids, _published_articles(Article.id.in_(article_ids)))
+
+
+def _sync(state):
+    """Apply the logged changes; False when a rebuild is due instead"""
+    config = current_app.config
+    now = time.time()
+    if now - state['synced_at'] >= config.get('SUGGESTION_CHANGES_RETENTION', 3600):
+        # Changes this worker has not read may have been pruned
+        return False
+    sequence, article_ids, category_ids, subcategory_ids = _changes_since(state['sequence'])
+    if len(article_ids) > _MAX_INCREMENTAL:
+        return False
+    _apply_changes(state['index'], article_ids, category_ids, subcategory_ids)
+    state['sequence'] = sequence
+    state['synced_at'] = now
+    return True
+
+
+def _build(state):
+    # Take the last id before reading the articles: changes committed
+    # meanwhile are applied again on the next sync, which is harmless
+    state['synced_at'] = time.time()
+    state['sequence'] = db.session.execute(db.select(db.func.max(_changes.c.id))).scalar() or 0
+    state['index'].build(_published_articles())
+
+
+def get_suggestion_index():
+    """Return the current app's index, building or syncing it if needed"""
+    app = current_app._get_current_object()
+    state = app.extensions['suggestion_index']
+    index = state['index']
+    cache_lookup('suggestions', index.built)
+
+    now = time.monotonic()
+    if index.built and \
+            now - state['checked_at'] < app.config.get('SUGGESTION_INDEX_CHECK_INTERVAL', 1):
+        return index
+
+    # Read from the primary: an index built from a lagging replica would
+    # stay stale until the next change
+    with state['lock'], primary_reads():
+        if not (index.built and _sync(state)):
+            _build(state)
+        state['checked_at'] = now
+    return index
+
+
+@content_changed.connect
+def _record_suggestion_changes(sender, tags, **extra):
+    state = sender.extensions.get('suggestion_index') if sender else None
+    if state is None:
+        return
+
+    changes = {('article', id) for id in _stale_ids(tags, 'article')}
+    if 'categories' in tags:
+        changes.update(('category', id) for id in _stale_ids(tags, 'category'))
+        changes.update(('subcategory', id) for id in _stale_ids(tags, 'subcategory'))
+    if not changes:
+        # Nothing indexed changed, e.g. only related article lists
+        return
+
+    try:
+        record_suggestion_changes(changes)
+    except SQLAlchemyError:
+        # Other workers miss this change until they next rebuild; this
+        # one at least rebuilds on its next lookup
+        sender.logger.exception('Recording suggestion index changes failed')
+        state['index'].built = False
+        return
+    # Pick up our own change on the next lookup
+    state['checked_at'] = 0
@@ -0,0 +1,97 @@
+"""
+Template compilation and fragment caching
+
+Compiled template bytecode is kept in ``TEMPLATE_BYTECODE_CACHE_DIR`` so a
+new worker loads it instead of compiling every template again
+(``flask compile-templates`` fills it ahead of time).
+
+Templates can cache an expensive block with::
+
+    {% cache key, ttl, tags %} ... {% endcache %}
+
+``key`` is any value with a stable repr (combined with the template name
+and APP_VERSION), ``ttl`` is in seconds, and ``tags`` is an optional list
+of dependency tags (see app.signals); the fragment is re-rendered once
+any of them changes. cache_tags('category', categories) builds such tags
+from model objects. A fragment is not stored if one of its tags changed
+while the request was rendering it, as it may show the old data.
+"""
+import hashlib
+import os
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app.cache import TaggedCache, create_backend, render_started
+from app.signals import content_changed, entity_tag
+
+_FRAGMENT_PREFIX = 'fragment:'
+
+
+class FragmentCacheExtension(Extension):
+    """The ``{% cache key, ttl, tags %}`` template tag"""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        if len(args) == 2:
+            args.append(nodes.Const(None))
+        if len(args) != 3:
+            parser.fail('cache expects a key, a timeout and optionally tags', lineno)
+        args.append(nodes.Const(parser.name))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_cache_fragment', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cache_fragment(self, key, timeout, tags, template_name, caller):
+        fragment_cache = current_app.extensions.get('fragment_cache')
+        if fragment_cache is None:
+            return caller()
+
+        digest = hashlib.sha1(repr((
+            current_app.config.get('APP_VERSION'), template_name, key
+        )).encode('utf-8')).hexdigest()
+        html = fragment_cache.get(digest)
+        if html is None:
+            since = render_started()
+            html = caller()
+            fragment_cache.set(digest, str(html), tags or (), timeout, since=since)
+        # The block was rendered (and escaped) by the template already
+        return Markup(html)
+
+
+def cache_tags(kind, objects):
+    """Dependency tags for model objects, e.g. ``cache_tags('article', related)``"""
+    return [entity_tag(kind, obj.id) for obj in objects]
+
+
+def init_templating(app):
+    """Configure the Jinja environment of ``app``; call before it is first used"""
+    options = dict(app.jinja_options)
+    options['extensions'] = list(options.get('extensions', [])) + [FragmentCacheExtension]
+
+    bytecode_dir = app.config.get('TEMPLATE_BYTECODE_CACHE_DIR')
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(bytecode_dir)
+    app.jinja_options = options
+
+    app.extensions['fragment_cache'] = TaggedCache(
+        create_backend(app.config, 'FRAGMENT_CACHE'),
+        _FRAGMENT_PREFIX,
+        app.config.get('FRAGMENT_CACHE_TIMEOUT', 300)
+    )
+    app.add_template_global(cache_tags)
+
+
+@content_changed.connect
+def _invalidate_fragments(sender, tags, **extra):
+    fragment_cache = sender.extensions.get('fragment_cache') if sender else None
+    if fragment_cache is not None:
+        fragment_cache.invalidate(tags)
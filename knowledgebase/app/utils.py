@@ -1,14 +1,11 @@
 """
 Utility functions for the Knowledge Base
 """
-import markdown
-from markdown.extensions.fenced_code import FencedCodeExtension
-from markdown.extensions.codehilite import CodeHiliteExtension
-from markdown.extensions.tables import TableExtension
-from markdown.extensions.toc import TocExtension
-from markdown.extensions.nl2br import Nl2BrExtension
-import bleach
-from pygments.formatters import HtmlFormatter
+import re
+import threading
+
+# markdown, bleach and pygments take tens of milliseconds to import, so
+# they are imported on first render rather than when every worker boots
 
 # Allowed HTML tags for sanitization
 ALLOWED_TAGS = [
@@ -30,21 +27,21 @@ ALLOWED_ATTRIBUTES = {
     'span': ['class'],
 }
 
-def render_markdown(text):
-    """
-    Convert markdown text to HTML with syntax highlighting
-    
-    Args:
-        text: Markdown formatted text
-        
-    Returns:
-        Safe HTML string
-    """
-    if not text:
-        return ''
-    
-    # Configure markdown with extensions
-    md = markdown.Markdown(
+# Markdown and bleach objects are expensive to build (every extension
+# compiles its patterns), so each thread keeps one prebuilt renderer and
+# reuses it. Neither object is safe to share between threads.
+_renderers = threading.local()
+
+def _build_markdown():
+    """Create a Markdown converter with the knowledge base extensions"""
+    import markdown
+    from markdown.extensions.fenced_code import FencedCodeExtension
+    from markdown.extensions.codehilite import CodeHiliteExtension
+    from markdown.extensions.tables import TableExtension
+    from markdown.extensions.toc import TocExtension
+    from markdown.extensions.nl2br import Nl2BrExtension
+    
+    return markdown.Markdown(
         extensions=[
             FencedCodeExtension(),
             CodeHiliteExtension(
@@ -62,19 +59,92 @@ def render_markdown(text):
         ],
         output_format='html5'
     )
+
+def _build_cleaner():
+    """Create the HTML sanitizer applied to rendered markdown"""
+    import bleach.sanitizer
     
-    # Convert markdown to HTML
-    html = md.convert(text)
-    
-    # Sanitize the HTML to prevent XSS
-    clean_html = bleach.clean(
-        html,
+    return bleach.sanitizer.Cleaner(
         tags=ALLOWED_TAGS,
         attributes=ALLOWED_ATTRIBUTES,
         strip=True
     )
+
+def _get_renderer():
+    """Return this thread's (Markdown, Cleaner) pair, building it on first use"""
+    renderer = getattr(_renderers, 'renderer', None)
+    if renderer is None:
+        renderer = _renderers.renderer = (_build_markdown(), _build_cleaner())
+    return renderer
+
+def render_markdown(text):
+    """
+    Convert markdown text to HTML with syntax highlighting
     
-    return clean_html
+    Args:
+        text: Markdown formatted text
+        
+    Returns:
+        Safe HTML string
+    """
+    if not text:
+        return ''
+    
+    md, cleaner = _get_renderer()
+    
+    # Convert markdown to HTML, then reset the converter's per-document
+    # state (TOC ids, stashed code blocks, ...) for the next call
+    try:
+        html = md.convert(text)
+    finally:
+        md.reset()
+    
+    # Sanitize the HTML to prevent XSS
+    return cleaner.clean(html)
+
+# Markdown constructs removed before tokenizing text for the search index
+_FENCE_LINE_RE = re.compile(r'^[ \t]*(```|~~~).*$', re.MULTILINE)
+_LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_URL_RE = re.compile(r'\b\w+://\S+')
+
+# Words, allowing inner underscores (snake_case) but not markdown _emphasis_
+_WORD_RE = re.compile(r'[^\W_]+(?:_[^\W_]+)*')
+
+def build_search_document(*texts):
+    """
+    Build the compact search document stored in Article.search_vector
+    
+    Code fence markers, link targets, URLs and HTML tags are dropped, the
+    remaining text is case-folded and tokenized, and each term is kept only
+    once (in order of first appearance).
+    
+    Args:
+        *texts: Markdown or plain text fragments (None is ignored)
+        
+    Returns:
+        Space separated string of unique terms
+    """
+    terms = {}
+    for text in texts:
+        if not text:
+            continue
+        for word in search_words(text):
+            terms.setdefault(word, None)
+    return ' '.join(terms)
+
+def search_words(text):
+    """
+    Tokenize markdown or plain text the way the search index does
+    
+    Returns:
+        List of case-folded words, repeats included
+    """
+    text = _FENCE_LINE_RE.sub(' ', text)
+    text = _LINK_RE.sub(r' \1 ', text)
+    text = _URL_RE.sub(' ', text)
+    text = _HTML_TAG_RE.sub(' ', text)
+    return _WORD_RE.findall(text.casefold())
 
 def get_pygments_css():
     """
@@ -83,6 +153,8 @@ def get_pygments_css():
     Returns:
         CSS string for syntax highlighting
     """
+    from pygments.formatters import HtmlFormatter
+    
     formatter = HtmlFormatter(style='monokai')
     return formatter.get_style_defs('.highlight')
 
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Synthetic Corpus Generator
+
+Builds a knowledge base database of a given size for benchmarking:
+categories with a varying number of subcategories, tags whose popularity
+follows a long tail, and articles with realistic markdown (headings,
+paragraphs, lists, fenced code in several languages, tables, quotes and
+links). The same size and seed always produce the same corpus.
+
+Rows are inserted in batches with executemany; the full-text index is
+filled by its triggers, and the published article counters and the
+related articles are computed at the end.
+
+Run with: python benchmarks/corpus.py 10000 [--seed N] [--output PATH]
+By default corpora are kept in benchmarks/.corpus/ and reused until the
+generator or the database schema changes.
+"""
+import argparse
+import glob
+import hashlib
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.corpus')
+
+# Bump when the generated content changes, so cached corpora are rebuilt
+CORPUS_VERSION = 2
+
+BATCH_SIZE = 1000
+
+TECHNOLOGIES = [
+    'python', 'flask', 'sqlite', 'postgres', 'redis', 'docker', 'kubernetes',
+    'nginx', 'gunicorn', 'celery', 'react', 'typescript', 'webpack', 'git',
+    'linux', 'systemd', 'terraform', 'ansible', 'prometheus', 'grafana',
+    'kafka', 'elasticsearch', 'rabbitmq', 'jenkins', 'github', 'vault',
+    'django', 'fastapi', 'node', 'graphql', 'mysql', 'mongodb', 'aws', 'azure',
+]
+NOUNS = [
+    'cache', 'index', 'query', 'migration', 'deployment', 'backup', 'pipeline',
+    'worker', 'queue', 'session', 'token', 'certificate', 'container', 'volume',
+    'schema', 'replica', 'cluster', 'endpoint', 'template', 'logging', 'metric',
+    'alert', 'build', 'release', 'proxy', 'firewall', 'permission', 'webhook',
+    'secret', 'namespace', 'transaction', 'connection', 'timeout', 'upload',
+]
+VERBS = [
+    'configure', 'debug', 'optimize', 'deploy', 'monitor', 'migrate', 'secure',
+    'scale', 'test', 'profile', 'upgrade', 'troubleshoot', 'automate', 'rotate',
+    'tune', 'restore', 'validate', 'inspect',
+]
+FILLER = [
+    'the', 'a', 'to', 'and', 'of', 'in', 'is', 'for', 'when', 'with', 'this',
+    'that', 'you', 'can', 'should', 'after', 'before', 'each', 'every', 'new',
+    'existing', 'default', 'production', 'local', 'remote', 'request', 'user',
+    'server', 'service', 'file', 'setting', 'value', 'error', 'change', 'step',
+    'first', 'then', 'also', 'only', 'usually', 'make', 'sure', 'check', 'run',
+]
+AREAS = [
+    'Getting Started', 'Operations', 'Development', 'Security', 'Networking',
+    'Databases', 'Frontend', 'Infrastructure', 'Observability', 'Data',
+    'Testing', 'Releases', 'Support', 'Identity', 'Storage', 'Messaging',
+    'Search', 'Analytics', 'Platform', 'Integrations',
+]
+SECTION_TITLES = [
+    'Overview', 'Requirements', 'Installation', 'Configuration', 'Usage',
+    'Examples', 'Troubleshooting', 'Performance', 'Security Notes',
+    'Known Issues', 'Next Steps', 'Background', 'Verification',
+]
+TAG_COLORS = ['#2563eb', '#16a34a', '#dc2626', '#9333ea', '#ea580c', '#0891b2', '#ca8a04']
+
+CODE_SNIPPETS = {
+    'python': [
+        'def {verb}_{noun}(client, retries=3):',
+        '    for attempt in range(retries):',
+        '        result = client.{verb}("{noun}")',
+        '        if result.ok:',
+        '            return result',
+        '    raise RuntimeError("could not {verb} {noun}")',
+    ],
+    'javascript': [
+        'async function {verb}{Noun}(api) {{',
+        '  const response = await api.get("/{noun}s");',
+        '  if (!response.ok) throw new Error("{verb} failed");',
+        '  return response.json();',
+        '}}',
+    ],
+    'bash': [
+        '#!/bin/sh',
+        'set -e',
+        '{tech} {verb} --{noun} /etc/{tech}/{noun}.conf',
+        'systemctl restart {tech}',
+        'journalctl -u {tech} --since "10 minutes ago"',
+    ],
+    'sql': [
+        'SELECT id, name, updated_at',
+        'FROM {noun}s',
+        "WHERE status = 'active'",
+        'ORDER BY updated_at DESC',
+        'LIMIT 50;',
+    ],
+    'yaml': [
+        '{tech}:',
+        '  {noun}:',
+        '    enabled: true',
+        '    timeout: 30',
+        '    retries: 3',
+    ],
+}
+
+
+def _sentence(rng, topic):
+    words = rng.choices(FILLER, k=rng.randint(6, 14))
+    for _ in range(rng.randint(1, 3)):
+        words.insert(rng.randrange(len(words)), rng.choice(topic))
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f'`{rng.choice(NOUNS)}_{rng.choice(NOUNS)}`')
+    if rng.random() < 0.1:
+        word = rng.choice(topic)
+        words.append(f'[{word}](https://example.com/docs/{word})')
+    return ' '.join(words).capitalize() + '.'
+
+
+def _paragraph(rng, topic):
+    return ' '.join(_sentence(rng, topic) for _ in range(rng.randint(2, 6)))
+
+
+def _code_block(rng, tech):
+    language = rng.choice(list(CODE_SNIPPETS))
+    noun = rng.choice(NOUNS)
+    lines = [line.format(verb=rng.choice(VERBS), noun=noun, Noun=noun.capitalize(), tech=tech)
+             for line in CODE_SNIPPETS[language]]
+    return f'```{language}\n' + '\n'.join(lines) + '\n```'
+
+
+def _table(rng, topic):
+    rows = ['| Setting | Default | Description |', '|---------|---------|-------------|']
+    for _ in range(rng.randint(2, 5)):
+        rows.append(f'| `{rng.choice(NOUNS)}_{rng.choice(NOUNS)}` | {rng.randint(1, 500)} '
+                    f'| {_sentence(rng, topic)} |')
+    return '\n'.join(rows)
+
+
+def article_content(rng, title, techs):
+    """Markdown for one article about ``techs``"""
+    topic = techs + rng.sample(NOUNS, 4)
+    blocks = [_paragraph(rng, topic)]
+    for heading in rng.sample(SECTION_TITLES, rng.randint(2, 6)):
+        blocks.append(f'## {heading}')
+        for _ in range(rng.randint(1, 3)):
+            blocks.append(_paragraph(rng, topic))
+        roll = rng.random()
+        if roll < 0.4:
+            blocks.append(_code_block(rng, techs[0]))
+        elif roll < 0.6:
+            blocks.append('\n'.join(f'- {_sentence(rng, topic)}' for _ in range(rng.randint(3, 6))))
+        elif roll < 0.7:
+            blocks.append(_table(rng, topic))
+        elif roll < 0.8:
+            blocks.append('> ' + _sentence(rng, topic))
+    return '\n\n'.join(blocks) + '\n'
+
+
+def article_title(rng, techs):
+    noun = rng.choice(NOUNS)
+    pattern = rng.choice([
+        'How to {verb} {noun}s in {tech}',
+        '{Tech} {noun} guide',
+        'Troubleshooting {tech} {noun} errors',
+        'Understanding the {tech} {noun}',
+        '{Verb} a {noun} with {tech} and {tech2}',
+        'Best practices for {tech} {noun}s',
+    ])
+    verb = rng.choice(VERBS)
+    return pattern.format(verb=verb, Verb=verb.capitalize(), noun=noun,
+                          tech=techs[0], Tech=techs[0].capitalize(), tech2=techs[-1])
+
+
+def _slug(text):
+    return '-'.join(''.join(ch if ch.isalnum() else ' ' for ch in text.lower()).split())
+
+
+def corpus_shape(size):
+    """Number of categories and tags for a corpus of ``size`` articles"""
+    return max(5, round(size ** 0.5 / 3)), min(1000, max(30, size // 20))
+
+
+def generate(size, seed=0):
+    """
+    Fill the current app's (empty) database with a synthetic corpus
+
+    Args:
+        size: Number of articles
+        seed: Random seed; the same size and seed give the same corpus
+    """
+    from flask import current_app
+    from app import db
+    from app.commands import create_schema
+    from app.counters import recount_published_articles
+    from app.models import User, Category, SubCategory, Article, Tag, article_tags
+    from app.related import build_related_articles
+    from app.utils import build_search_document
+
+    rng = random.Random(f'{seed}:{size}')
+    create_schema()
+
+    admin = User(username=current_app.config['ADMIN_USERNAME'])
+    admin.set_password(current_app.config['ADMIN_PASSWORD'])
+    db.session.add(admin)
+    db.session.flush()
+
+    category_count, tag_count = corpus_shape(size)
+    now = datetime(2025, 1, 1)
+
+    categories, subcategories = [], []
+    for index in range(category_count):
+        name = AREAS[index % len(AREAS)] + (f' {index // len(AREAS) + 1}' if index >= len(AREAS) else '')
+        categories.append({'id': index + 1, 'name': name, 'slug': _slug(name), 'order': index,
+                           'description': f'Articles about {name.lower()}',
+                           'created_at': now, 'updated_at': now})
+        for position in range(rng.randint(0, 8)):
+            name = f'{rng.choice(TECHNOLOGIES).capitalize()} {rng.choice(NOUNS)}s'
+            subcategories.append({'id': len(subcategories) + 1, 'category_id': index + 1,
+                                  'name': name, 'slug': _slug(name) + f'-{len(subcategories) + 1}',
+                                  'order': position, 'created_at': now, 'updated_at': now})
+    subcategories_by_category = {}
+    for row in subcategories:
+        subcategories_by_category.setdefault(row['category_id'], []).append(row['id'])
+
+    tags, seen = [], set()
+    while len(tags) < tag_count:
+        name = rng.choice(TECHNOLOGIES) if len(tags) < len(TECHNOLOGIES) and rng.random() < 0.7 \
+            else f'{rng.choice(TECHNOLOGIES)}-{rng.choice(NOUNS)}'
+        if name in seen:
+            continue
+        seen.add(name)
+        tags.append({'id': len(tags) + 1, 'name': name, 'slug': name,
+                     'color': rng.choice(TAG_COLORS), 'created_at': now})
+    # A few tags are on many articles, most on a handful
+    tag_weights = [1 / (rank + 1) ** 1.1 for rank in range(len(tags))]
+
+    db.session.execute(db.insert(Category), categories)
+    if subcategories:
+        db.session.execute(db.insert(SubCategory), subcategories)
+    db.session.execute(db.insert(Tag), tags)
+    db.session.commit()
+
+    started = now - timedelta(days=3 * 365)
+    step = timedelta(days=3 * 365) / size
+    for first in range(0, size, BATCH_SIZE):
+        articles, links = [], []
+        for article_id in range(first + 1, min(first + BATCH_SIZE, size) + 1):
+            techs = rng.sample(TECHNOLOGIES, rng.randint(1, 3))
+            title = article_title(rng, techs)
+            content = article_content(rng, title, techs)
+            summary = _sentence(rng, techs)
+            category_id = rng.randint(1, category_count)
+            choices = subcategories_by_category.get(category_id)
+            created = started + step * article_id + timedelta(minutes=rng.randint(0, 600))
+            published = rng.random() < 0.9
+            articles.append({
+                'id': article_id, 'title': title[:200],
+                'slug': f'{_slug(title)}-{article_id}', 'content': content, 'summary': summary,
+                'category_id': category_id,
+                'subcategory_id': rng.choice(choices) if choices and rng.random() < 0.85 else None,
+                'is_published': published, 'is_featured': published and rng.random() < 0.05,
+                'author_id': admin.id, 'created_at': created, 'updated_at': created,
+                'published_at': created if published else None,
+                'search_vector': build_search_document(title, summary, content),
+            })
+            tag_ids = set(rng.choices(range(1, len(tags) + 1), weights=tag_weights,
+                                      k=rng.randint(0, 5)))
+            links.extend({'article_id': article_id, 'tag_id': tag_id} for tag_id in tag_ids)
+
+        db.session.execute(db.insert(Article), articles)
+        if links:
+            db.session.execute(article_tags.insert(), links)
+        db.session.commit()
+
+    recount_published_articles()
+    build_related_articles()
+    db.session.commit()
+
+
+def schema_fingerprint():
+    """Short hash of the tables, columns and indexes the models define"""
+    from app import db
+    import app.models  # noqa: F401 (registers the tables)
+
+    parts = []
+    for table in db.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f'{column.name} {column.type!r}' for column in table.columns)
+        parts.extend(sorted(index.name or '' for index in table.indexes))
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()[:8]
+
+
+def corpus_path(size, seed=0):
+    return os.path.join(CORPUS_DIR, f'corpus-{size}-seed{seed}-v{CORPUS_VERSION}'
+                                    f'-{schema_fingerprint()}.db')
+
+
+def ensure_corpus(size, seed=0, path=None, log=print):
+    """
+    Return the path of the corpus database for ``size`` and ``seed``,
+    generating it first if it does not exist yet
+    """
+    from app import create_app, db
+    from app.commands import create_schema
+    from config import Config
+
+    def corpus_config(database):
+        class CorpusConfig(Config):
+            SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+            SQLALCHEMY_BINDS = {}
+            PAGE_CACHE_BACKEND = 'null'
+            FRAGMENT_CACHE_BACKEND = 'null'
+            METRICS_ENABLED = False
+        return CorpusConfig
+
+    if path is None:
+        path = corpus_path(size, seed)
+        # Corpora for an older generator or schema are never used again
+        for stale in glob.glob(os.path.join(CORPUS_DIR, f'corpus-{size}-seed{seed}-*.db')):
+            if stale != path:
+                os.remove(stale)
+    if os.path.exists(path):
+        # An --output file may predate the current schema: add what is missing
+        app = create_app(corpus_config(path))
+        with app.app_context():
+            create_schema()
+            db.session.remove()
+            db.engine.dispose()
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + '.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    log(f'generating {size} articles into {os.path.relpath(path, ROOT)} ...')
+    started = time.perf_counter()
+    app = create_app(corpus_config(partial))
+    with app.app_context():
+        generate(size, seed)
+        # Close every connection so the WAL is checkpointed into the file
+        db.session.remove()
+        db.engine.dispose()
+    os.replace(partial, path)
+    log(f'generated in {time.perf_counter() - started:.1f}s')
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('size', type=int, help='number of articles')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='database file (default: benchmarks/.corpus/...)')
+    args = parser.parse_args()
+    print(ensure_corpus(args.size, args.seed, args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Route Load Benchmark
+
+Drives the public routes and the admin article listing against synthetic
+corpora (see benchmarks/corpus.py) and reports, per corpus size and route,
+throughput, p50/p95/p99 latency and SQL queries per request. Query counts
+come from the Server-Timing header of request profiling, so they cover
+exactly what the app executed.
+
+Requests go through the Flask test client (one thread, no network) or,
+with ``--server``, a local threaded WSGI server hit by ``--concurrency``
+client threads. Page and fragment caches are off by default so every
+request does the full work; ``--cache`` turns them on to measure hits.
+
+Results can be written as JSON and compared with a stored baseline: a
+route regresses when its p95 exceeds the baseline by more than the
+tolerance, or when it runs more queries than before.
+
+Run with: python benchmarks/load_test.py [--sizes 1000,10000,100000]
+          [--requests N] [--server --concurrency N] [--output results.json]
+          [--update-baseline]
+Exits with status 1 on a regression.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import NOUNS, TECHNOLOGIES, ensure_corpus
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+
+_QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+# ==========================================
+# Routes
+# ==========================================
+
+def _sample_corpus(app):
+    """Slugs and search terms to request, drawn from the corpus"""
+    from app import db
+    from app.models import Article, Tag
+
+    with app.app_context():
+        return {
+            'articles': db.session.execute(
+                db.select(Article.slug).where(Article.is_published == True).order_by(Article.id)
+            ).scalars().all(),
+            'tags': db.session.execute(
+                db.select(Tag.slug).where(Tag.published_article_count > 0).order_by(Tag.id)
+            ).scalars().all(),
+        }
+
+
+def _search_query(rng):
+    words = [rng.choice(TECHNOLOGIES)]
+    if rng.random() < 0.5:
+        words.append(rng.choice(NOUNS))
+    return quote(' '.join(words))
+
+
+# Route name -> (needs admin login, url generator)
+ROUTES = {
+    'home': (False, lambda rng, sample: '/'),
+    'article': (False, lambda rng, sample: '/article/' + rng.choice(sample['articles'])),
+    'search': (False, lambda rng, sample: '/search?q=' + _search_query(rng)),
+    'suggestions': (False, lambda rng, sample: '/api/search/suggestions?q='
+                    + rng.choice(TECHNOLOGIES)[:rng.randint(2, 5)]),
+    'tag': (False, lambda rng, sample: '/tag/' + rng.choice(sample['tags'])),
+    'admin_articles': (True, lambda rng, sample: '/admin/articles'),
+}
+
+
+# ==========================================
+# Drivers
+# ==========================================
+
+class ClientDriver:
+    """Requests through the Flask test client, in this thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self.anonymous = app.test_client()
+        self.admin = app.test_client()
+        _login(self.admin.post, app)
+
+    def get(self, url, admin=False):
+        response = (self.admin if admin else self.anonymous).get(url)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+    def run(self, urls, admin):
+        return [self._timed(url, admin) for url in urls]
+
+    def _timed(self, url, admin):
+        started = time.perf_counter()
+        status, timing = self.get(url, admin)
+        return time.perf_counter() - started, status, timing
+
+    def close(self):
+        pass
+
+
+class ServerDriver(ClientDriver):
+    """Requests over HTTP to a local threaded WSGI server"""
+
+    def __init__(self, app, concurrency):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.app = app
+        self.concurrency = concurrency
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.anonymous = urllib.request.build_opener()
+        self.admin = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        _login(lambda url, data: self.admin.open(
+            self.base + url, data=urllib.parse.urlencode(data).encode()), app)
+
+    def get(self, url, admin=False):
+        opener = self.admin if admin else self.anonymous
+        try:
+            with opener.open(self.base + url) as response:
+                response.read()
+                return response.status, response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            return error.code, error.headers.get('Server-Timing', '')
+
+    def run(self, urls, admin):
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            return list(pool.map(lambda url: self._timed(url, admin), urls))
+
+    def close(self):
+        self.server.shutdown()
+
+
+def _login(post, app):
+    post('/auth/login', data={'username': app.config['ADMIN_USERNAME'],
+                              'password': app.config['ADMIN_PASSWORD']})
+
+
+# ==========================================
+# Measurement
+# ==========================================
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def measure(driver, name, sample, requests, warmup, seed):
+    """Request route ``name`` ``requests`` times; return its statistics"""
+    admin, url_for = ROUTES[name]
+    rng = random.Random(f'{seed}:{name}')
+
+    cold_started = time.perf_counter()
+    driver.get(url_for(rng, sample), admin)
+    cold_ms = (time.perf_counter() - cold_started) * 1000
+    for _ in range(warmup):
+        driver.get(url_for(rng, sample), admin)
+
+    urls = [url_for(rng, sample) for _ in range(requests)]
+    started = time.perf_counter()
+    results = driver.run(urls, admin)
+    elapsed = time.perf_counter() - started
+
+    latencies = [seconds * 1000 for seconds, _, _ in results]
+    queries = [int(match.group(1)) for _, _, timing in results
+               for match in [_QUERIES_RE.search(timing)] if match]
+    errors = sum(1 for _, status, _ in results if status >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 1),
+        'cold_ms': round(cold_ms, 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'p50_ms': round(_percentile(latencies, 0.50), 2),
+        'p95_ms': round(_percentile(latencies, 0.95), 2),
+        'p99_ms': round(_percentile(latencies, 0.99), 2),
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries) if queries else None,
+    }
+
+
+def create_bench_app(database, cache):
+    from app import create_app
+    from config import Config
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + database
+        SQLALCHEMY_BINDS = {}
+        PAGE_CACHE_BACKEND = 'memory' if cache else 'null'
+        FRAGMENT_CACHE_BACKEND = 'memory' if cache else 'null'
+        TEMPLATE_BYTECODE_CACHE_DIR = ''
+        METRICS_ENABLED = False
+        # Only for the query counts in Server-Timing
+        PROFILING_ENABLED = True
+        PROFILING_SAMPLE_RATE = 0
+
+    return create_app(BenchConfig)
+
+
+def run_size(size, args):
+    database = ensure_corpus(size, args.seed)
+    app = create_bench_app(database, args.cache)
+    sample = _sample_corpus(app)
+    driver = ServerDriver(app, args.concurrency) if args.server else ClientDriver(app)
+    try:
+        results = {}
+        for name in args.routes:
+            results[name] = measure(driver, name, sample, args.requests, args.warmup, args.seed)
+            _print_row(size, name, results[name])
+        return results
+    finally:
+        driver.close()
+        from app import db
+        with app.app_context():
+            db.engine.dispose()
+
+
+def _print_row(size, name, stats):
+    queries = '-' if stats['queries_mean'] is None else f"{stats['queries_mean']:g}"
+    print(f"{size:>7} {name:<15} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>8.2f} "
+          f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {queries:>8} {stats['errors']:>6}")
+
+
+# ==========================================
+# Baseline
+# ==========================================
+
+def compare(results, baseline, tolerance):
+    """Regressions of ``results`` against ``baseline``, as messages"""
+    failures = []
+    for size, routes in results.items():
+        for name, stats in routes.items():
+            base = baseline.get('results', {}).get(size, {}).get(name)
+            if base is None:
+                continue
+            limit = base['p95_ms'] * (1 + tolerance)
+            if stats['p95_ms'] > limit:
+                failures.append(f'{size} {name}: p95 {stats["p95_ms"]:.2f} ms > {limit:.2f} ms')
+            if base.get('queries_max') is not None and stats['queries_max'] is not None \
+                    and stats['queries_max'] > base['queries_max']:
+                failures.append(f'{size} {name}: {stats["queries_max"]} queries '
+                                f'(baseline {base["queries_max"]})')
+            if stats['errors'] > base.get('errors', 0):
+                failures.append(f'{size} {name}: {stats["errors"]} error responses')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='1000,10000',
+                        help='comma-separated corpus sizes (default: 1000,10000)')
+    parser.add_argument('--routes', default=','.join(ROUTES),
+                        help=f'comma-separated routes (default: all of {", ".join(ROUTES)})')
+    parser.add_argument('--requests', type=int, default=200, help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=20, help='unmeasured requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--cache', action='store_true', help='enable the page and fragment caches')
+    parser.add_argument('--server', action='store_true', help='use a local WSGI server')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads with --server')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='allowed p95 slowdown over the baseline (default: from baseline, or 0.5)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='record this run as the new baseline')
+    args = parser.parse_args()
+    args.routes = [name for name in args.routes.split(',') if name]
+    unknown = sorted(set(args.routes) - set(ROUTES))
+    if unknown:
+        parser.error('unknown routes: ' + ', '.join(unknown))
+
+    print(f"{'size':>7} {'route':<15} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'queries':>8} {'errors':>6}")
+    results = {}
+    for size in (int(value) for value in args.sizes.split(',')):
+        results[str(size)] = run_size(size, args)
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'mode': f'server x{args.concurrency}' if args.server else 'test client',
+            'cache': args.cache,
+            'requests': args.requests,
+            'seed': args.seed,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'results written to {args.output}')
+
+    if args.update_baseline:
+        report['tolerance'] = args.tolerance if args.tolerance is not None else 0.5
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'baseline written to {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('no baseline recorded; run with --update-baseline')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['meta'].get('mode') != report['meta']['mode'] or \
+            baseline['meta'].get('cache') != report['meta']['cache']:
+        print('baseline was recorded with other options; not comparing')
+        return 0
+
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get('tolerance', 0.5)
+    failures = compare(results, baseline, tolerance)
+    for failure in failures:
+        print('FAIL:', failure)
+    if not failures:
+        print(f'no regressions against {os.path.relpath(args.baseline)}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Markdown Rendering Micro-benchmark
+
+Compares building a fresh Markdown converter and bleach cleaner on every
+call (how render_markdown used to work) with the pooled, per-thread
+renderer now used by app.utils.render_markdown.
+
+Run with: python benchmarks/markdown_render.py [--number N]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bleach
+from app.utils import (
+    render_markdown, _build_markdown, ALLOWED_TAGS, ALLOWED_ATTRIBUTES
+)
+
+SAMPLES = {
+    'short': "A short paragraph with **bold** text and a [link](https://example.com).",
+    'article': """# Installing the Service
+
+Follow these steps to get started.
+
+## Requirements
+
+| Package | Version |
+|---------|---------|
+| Python  | 3.11    |
+| SQLite  | 3.40    |
+
+```python
+from app import create_app
+
+app = create_app()
+app.run(port=8888)
+```
+
+## Configuration
+
+1. Copy `config.py`
+2. Set `SECRET_KEY`
+3. Restart the service
+
+> Remember to change the default password.
+""" * 4,
+}
+
+
+def render_unpooled(text):
+    """The previous implementation: new converter and cleaner per call"""
+    md = _build_markdown()
+    html = md.convert(text)
+    return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+
+
+def bench(func, text, number):
+    """Return the best per-call time in microseconds over 3 repeats"""
+    func(text)  # warm up (imports, lexer lookup, per-thread renderer)
+    best = min(timeit.repeat(lambda: func(text), number=number, repeat=3))
+    return best / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--number', type=int, default=200, help='calls per repeat')
+    args = parser.parse_args()
+
+    for name, text in SAMPLES.items():
+        assert render_unpooled(text) == render_markdown(text), f'{name}: output differs'
+
+    print(f"{'sample':<10}{'per call (before)':>20}{'pooled (after)':>18}{'speedup':>10}")
+    for name, text in SAMPLES.items():
+        before = bench(render_unpooled, text, args.number)
+        after = bench(render_markdown, text, args.number)
+        print(f'{name:<10}{before:>17.1f} µs{after:>15.1f} µs{before / after:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
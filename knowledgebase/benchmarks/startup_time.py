@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Worker Startup Benchmark
+
+Boots the application the way a worker does (import ``app`` and call
+create_app()) in fresh interpreters under ``python -X importtime``, and
+fails when boot regresses:
+
+- the median import time exceeds the recorded baseline by more than the
+  allowed tolerance
+- a module that should load lazily (the markdown rendering stack) is
+  imported during boot
+- booting touches the database (schema creation belongs to
+  ``flask init-db``)
+
+Run with: python benchmarks/startup_time.py [--runs N] [--update-baseline]
+Exits with status 1 on a regression.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+
+# Imported on first render, never at boot
+LAZY_MODULES = ('markdown', 'bleach', 'pygments')
+
+BOOT = (
+    'import time; started = time.perf_counter(); '
+    'from app import create_app; create_app(); '
+    'print((time.perf_counter() - started) * 1000)'
+)
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def boot_once(database):
+    """Boot in a fresh interpreter; return (boot ms, import ms, module names)"""
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database, PAGE_CACHE_BACKEND='null')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    import_us = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), match.group(3), match.group(4)
+        modules.add(name)
+        if len(indent) == 1:
+            # Top-level imports; their cumulative times cover everything else
+            import_us += cumulative
+    return float(result.stdout.strip().splitlines()[-1]), import_us / 1000, modules
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE):
+        return None
+    with open(BASELINE) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters to boot')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='allowed slowdown over the baseline (default: from baseline, or 0.25)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='record this run as the new baseline')
+    args = parser.parse_args()
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        database = os.path.join(directory, 'startup.db')
+        runs = [boot_once(database) for _ in range(args.runs)]
+        if os.path.exists(database):
+            failures.append('create_app() touched the database')
+
+    boot_ms = statistics.median(run[0] for run in runs)
+    import_ms = statistics.median(run[1] for run in runs)
+    loaded = set().union(*(run[2] for run in runs))
+    eager = sorted(name for name in loaded if name.split('.')[0] in LAZY_MODULES)
+    if eager:
+        failures.append('imported at boot: ' + ', '.join(eager))
+
+    print(f'boot (create_app):  {boot_ms:8.1f} ms median of {args.runs}')
+    print(f'import time:        {import_ms:8.1f} ms')
+
+    if args.update_baseline:
+        with open(BASELINE, 'w') as f:
+            json.dump({'import_ms': round(import_ms, 1), 'boot_ms': round(boot_ms, 1),
+                       'tolerance': args.tolerance or 0.25}, f, indent=2)
+            f.write('\n')
+        print(f'baseline written to {os.path.relpath(BASELINE, ROOT)}')
+    else:
+        baseline = load_baseline()
+        if baseline is None:
+            print('no baseline recorded; run with --update-baseline')
+        else:
+            tolerance = args.tolerance if args.tolerance is not None else baseline.get('tolerance', 0.25)
+            for name, value in (('import_ms', import_ms), ('boot_ms', boot_ms)):
+                limit = baseline[name] * (1 + tolerance)
+                print(f'{name}: {value:.1f} (baseline {baseline[name]:.1f}, limit {limit:.1f})')
+                if value > limit:
+                    failures.append(f'{name} regressed: {value:.1f} > {limit:.1f}')
+
+    for failure in failures:
+        print('FAIL:', failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -13,6 +13,31 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'instance', 'knowledgebase.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Optional read replicas (comma-separated URLs): public pages read from
+    # them, and a user who just saved reads from the primary for a while
+    SQLALCHEMY_BINDS = {
+        f'replica_{number}': url.strip()
+        for number, url in enumerate(os.environ.get('DATABASE_REPLICA_URLS', '').split(','))
+        if url.strip()
+    }
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+    
+    # Connection pool, sized for threaded workers
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))  # seconds
+    
+    # Pragmas run on every SQLite connection, in this order (see
+    # app/sqlite_tuning.py); set a value to '' to leave SQLite's default
+    SQLITE_PRAGMAS = {
+        'busy_timeout': os.environ.get('SQLITE_BUSY_TIMEOUT', '5000'),  # ms
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': os.environ.get('SQLITE_CACHE_SIZE', '-16000'),  # negative = KiB
+        'mmap_size': os.environ.get('SQLITE_MMAP_SIZE', str(128 * 1024 * 1024)),  # bytes
+        'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+    }
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(hours=24)
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -23,6 +48,70 @@ class Config:
     ARTICLES_PER_PAGE = 20
     SEARCH_RESULTS_PER_PAGE = 20
     
+    # Rendered markdown cache: number of articles kept in memory per worker,
+    # and whether rendered HTML is also stored in the database (by admin
+    # saves and `flask warm-markdown-cache`; readers only read it)
+    MARKDOWN_CACHE_SIZE = int(os.environ.get('MARKDOWN_CACHE_SIZE', 256))
+    MARKDOWN_CACHE_PERSISTENT = os.environ.get('MARKDOWN_CACHE_PERSISTENT', 'true').lower() == 'true'
+    
+    # Full-page cache for anonymous readers: 'filesystem' (shared by all
+    # workers on the host), 'redis', 'memory' (per worker) or 'null' (off)
+    PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'filesystem')
+    PAGE_CACHE_TIMEOUT = int(os.environ.get('PAGE_CACHE_TIMEOUT', 300))  # seconds
+    PAGE_CACHE_DIR = os.path.join(basedir, 'instance', 'page_cache')
+    PAGE_CACHE_MEMORY_SIZE = 512
+    PAGE_CACHE_REDIS_URL = os.environ.get('PAGE_CACHE_REDIS_URL')
+
+    # Response compression: gzip, or brotli when `pip install brotli`
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', 'true').lower() == 'true'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))  # bytes
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzip, 1-9
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))  # brotli, 0-11
+    COMPRESS_MIMETYPES = [
+        'text/html', 'text/css', 'text/plain', 'text/xml',
+        'application/json', 'application/javascript', 'text/javascript',
+        'application/xml', 'image/svg+xml',
+    ]
+    
+    # Compiled template bytecode, shared by workers ('' to disable)
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR',
+                                                 os.path.join(basedir, 'instance', 'jinja_cache'))
+    
+    # Cached template fragments ({% cache %}); same backends as the page cache
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND', 'filesystem')
+    FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', 300))  # seconds
+    FRAGMENT_CACHE_DIR = os.path.join(basedir, 'instance', 'fragment_cache')
+    FRAGMENT_CACHE_MEMORY_SIZE = 512
+    FRAGMENT_CACHE_REDIS_URL = os.environ.get('FRAGMENT_CACHE_REDIS_URL')
+
+    # Live search suggestions from an in-memory index; workers read the
+    # changes made elsewhere from the suggestion_changes table every few
+    # seconds, and rebuild if they have not for longer than it keeps them
+    SUGGESTION_INDEX_ENABLED = os.environ.get('SUGGESTION_INDEX_ENABLED', 'true').lower() == 'true'
+    SUGGESTION_INDEX_CHECK_INTERVAL = float(os.environ.get('SUGGESTION_INDEX_CHECK_INTERVAL', 1))  # seconds
+    SUGGESTION_CHANGES_RETENTION = int(os.environ.get('SUGGESTION_CHANGES_RETENTION', 3600))  # seconds
+    
+    # Related articles under each article, precomputed by `flask build-related`
+    # and refreshed as articles are saved: how many are stored per article,
+    # and the share of the similarity score that comes from shared tags
+    RELATED_ARTICLES_COUNT = int(os.environ.get('RELATED_ARTICLES_COUNT', 10))
+    RELATED_ARTICLES_TAG_WEIGHT = float(os.environ.get('RELATED_ARTICLES_TAG_WEIGHT', 0.25))  # 0.0-1.0
+    
+    # Prometheus metrics at /metrics; added up over the worker processes
+    # when PROMETHEUS_MULTIPROC_DIR is set in the environment (gunicorn.conf.py)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    # Bearer token Prometheus must send to scrape /metrics (unset: open)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # Opt-in request profiling: Server-Timing headers, per-endpoint
+    # histograms at /admin/metrics and sampled profiles written to
+    # PROFILING_DIR (PROFILING_PROFILER 'cprofile' or 'pyinstrument')
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+    PROFILING_SERVER_TIMING = os.environ.get('PROFILING_SERVER_TIMING', 'true').lower() == 'true'
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))  # 0.0-1.0
+    PROFILING_PROFILER = os.environ.get('PROFILING_PROFILER', 'cprofile')
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(basedir, 'instance', 'profiles'))
+    
     # Admin credentials (hardcoded as requested)
     ADMIN_USERNAME = 'admin'
     ADMIN_PASSWORD = 'admin123'
@@ -0,0 +1,34 @@
+"""
+Gunicorn settings: ``gunicorn -c gunicorn.conf.py run:app``
+
+Points prometheus_client at a directory shared by the workers, so
+/metrics adds up all of them, empties it when the server starts and
+marks workers dead as they exit. Override with PROMETHEUS_MULTIPROC_DIR,
+and the address and worker count with GUNICORN_BIND and WEB_CONCURRENCY.
+"""
+import os
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# Read by prometheus_client when the app imports it, so it must be set
+# here, in the master, before the workers load the app
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(basedir, 'instance', 'metrics'))
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+
+def on_starting(server):
+    """Drop the metric files of the previous run, so counters start from zero"""
+    from app.metrics import clear_metrics_dir
+
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    os.makedirs(directory, exist_ok=True)
+    clear_metrics_dir(directory)
+
+
+def child_exit(server, worker):
+    """Stop counting the in-flight requests of a worker that exited"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
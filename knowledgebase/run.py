@@ -3,6 +3,7 @@
 Knowledge Base Application Entry Point
 """
 from app import create_app, db
+from app.commands import create_schema
 from app.models import User, Category, SubCategory, Article
 
 app = create_app()
@@ -21,7 +22,7 @@ def make_shell_context():
 @app.cli.command()
 def init_db():
     """Initialize the database and create admin user"""
-    db.create_all()
+    create_schema()
     
     # Check if admin user exists
     admin = User.query.filter_by(username='Jolleymi800').first()
@@ -37,16 +38,5 @@ def init_db():
     print('✓ Database initialized successfully')
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        
-        # Auto-create admin user if it doesn't exist
-        admin = User.query.filter_by(username='Jolleymi800').first()
-        if not admin:
-            admin = User(username='Jolleymi800')
-            admin.set_password('saddlebag-crinkly-deprive')
-            db.session.add(admin)
-            db.session.commit()
-            print('✓ Admin user created')
-    
+    # Run `flask init-db` once before the first start
     app.run(host='0.0.0.0', port=8888, debug=False)
@@ -8,6 +8,7 @@ to help you get started with your knowledge base.
 Run with: python sample_data.py
 """
 from app import create_app, db
+from app.commands import create_schema
 from app.models import User, Category, SubCategory, Article
 from datetime import datetime
 
@@ -16,6 +17,8 @@ def create_sample_data():
     app = create_app()
     
     with app.app_context():
+        create_schema()
+        
         # Check if sample data already exists
         if Category.query.count() > 0:
             print("❌ Sample data already exists. Clear your database first if you want to regenerate.")
@@ -416,7 +419,6 @@ If these solutions don't help:
                 author_id=admin.id,
                 published_at=datetime.utcnow()
             )
-            article.update_search_vector()
             db.session.add(article)
         
         db.session.commit()
@@ -0,0 +1,59 @@
+"""
+Shared fixtures: an app on a fresh SQLite database per test, with the
+page and fragment caches, metrics and the suggestion index off
+"""
+import pytest
+from app import create_app, db
+from app.commands import create_schema
+from app.models import User
+from config import Config
+
+
+def make_config(tmp_path, **overrides):
+    """Test configuration class using files under ``tmp_path``"""
+    settings = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + str(tmp_path / 'knowledgebase.db'),
+        'SQLALCHEMY_BINDS': {},
+        'PAGE_CACHE_BACKEND': 'null',
+        'FRAGMENT_CACHE_BACKEND': 'null',
+        'TEMPLATE_BYTECODE_CACHE_DIR': '',
+        'SUGGESTION_INDEX_ENABLED': False,
+        'METRICS_ENABLED': False,
+        'PROFILING_ENABLED': False,
+    }
+    settings.update(overrides)
+    return type('TestConfig', (Config,), settings)
+
+
+def create_test_app(config_class):
+    """App for ``config_class`` with its schema and the admin user created"""
+    app = create_app(config_class)
+    with app.app_context():
+        create_schema()
+        admin = User(username=app.config['ADMIN_USERNAME'])
+        admin.set_password(app.config['ADMIN_PASSWORD'])
+        db.session.add(admin)
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_test_app(make_config(tmp_path))
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': app.config['ADMIN_USERNAME'],
+                                     'password': app.config['ADMIN_PASSWORD']})
+    return client
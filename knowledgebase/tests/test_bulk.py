@@ -0,0 +1,50 @@
+"""
+Bulk article operations over more articles than fit in one IN (...) list
+"""
+from app import db
+from app.bulk import add_tags, delete_articles, move_articles, remove_tags, set_published
+from app.counters import recount_published_articles
+from app.models import Article, Category, Tag, article_tags
+
+ARTICLES = 1200
+
+
+def add_articles(count):
+    db.session.add_all([Category(id=1, name='From', slug='from'),
+                        Category(id=2, name='To', slug='to'),
+                        Tag(id=1, name='Tagged', slug='tagged')])
+    db.session.flush()
+    db.session.execute(db.insert(Article), [
+        {'id': id, 'title': f'Article {id}', 'slug': f'article-{id}', 'content': f'Text {id}',
+         'category_id': 1, 'is_published': True}
+        for id in range(1, count + 1)
+    ])
+    recount_published_articles()
+    db.session.commit()
+    return list(range(1, count + 1))
+
+
+def test_bulk_operations_cover_every_chunk(app):
+    with app.app_context():
+        ids = add_articles(ARTICLES)
+
+        tags = move_articles(ids + [ARTICLES + 1], category_id=2)
+        db.session.commit()
+        assert 'article:%d' % ARTICLES in tags
+        assert db.session.get(Category, 2).published_article_count == ARTICLES
+
+        set_published(ids[::2], False)
+        db.session.commit()
+        assert db.session.get(Category, 2).published_article_count == ARTICLES // 2
+
+        add_tags(ids, [1])
+        db.session.commit()
+        assert db.session.scalar(db.select(db.func.count()).select_from(article_tags)) == ARTICLES
+        remove_tags(ids[:700], [1])
+        db.session.commit()
+        assert db.session.scalar(db.select(db.func.count()).select_from(article_tags)) == 500
+
+        delete_articles(ids[:-1])
+        db.session.commit()
+        assert db.session.execute(db.select(Article.id)).scalars().all() == [ARTICLES]
+        assert db.session.get(Tag, 1).published_article_count == 1
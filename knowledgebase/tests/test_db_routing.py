@@ -0,0 +1,97 @@
+"""
+Read-replica routing, with the primary and one replica as two SQLite
+files: the replica starts as a copy of the primary and then lags behind,
+since nothing replicates to it
+"""
+import shutil
+import time
+import pytest
+from sqlalchemy import event
+from app import db, db_routing
+from app.models import Category
+from tests.conftest import create_test_app, make_config
+
+
+@pytest.fixture
+def routed_app(tmp_path):
+    replica = tmp_path / 'replica.db'
+    app = create_test_app(make_config(
+        tmp_path, SQLALCHEMY_BINDS={'replica_0': 'sqlite:///' + str(replica)}))
+    with app.app_context():
+        db.session.add(Category(name='Existing', slug='existing'))
+        db.session.commit()
+        # Closing the connections checkpoints the WAL into the file
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    shutil.copyfile(tmp_path / 'knowledgebase.db', replica)
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def statements(routed_app):
+    """Statements run on each bind (None is the primary) during the test"""
+    with routed_app.app_context():
+        engines = dict(db.engines)
+    statements = {key: [] for key in engines}
+    listeners = []
+    for key, engine in engines.items():
+        def before_cursor_execute(conn, cursor, statement, *args, key=key):
+            statements[key].append(statement)
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        listeners.append((engine, before_cursor_execute))
+    yield statements
+    for engine, listener in listeners:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+
+def login(client, app):
+    client.post('/auth/login', data={'username': app.config['ADMIN_USERNAME'],
+                                     'password': app.config['ADMIN_PASSWORD']})
+
+
+def test_public_pages_read_from_the_replica(routed_app, statements):
+    response = routed_app.test_client().get('/category/existing')
+
+    assert response.status_code == 200
+    assert statements['replica_0']
+    assert not statements[None]
+
+
+def test_admin_pages_read_from_the_primary(routed_app, statements):
+    client = routed_app.test_client()
+    login(client, routed_app)
+    del statements[None][:], statements['replica_0'][:]
+
+    assert client.get('/admin/categories').status_code == 200
+    assert statements[None]
+    assert not statements['replica_0']
+
+
+def test_writer_reads_own_writes_until_sticky_window_ends(routed_app, monkeypatch):
+    writer = routed_app.test_client()
+    login(writer, routed_app)
+    writer.post('/admin/category/new', data={'name': 'Fresh', 'order': 1})
+
+    # The replica lags: other readers do not see the new category yet
+    assert routed_app.test_client().get('/category/fresh').status_code == 404
+    # The writer is pinned to the primary and does
+    assert writer.get('/category/fresh').status_code == 200
+
+    later = time.time() + routed_app.config['REPLICA_STICKY_SECONDS'] + 1
+    monkeypatch.setattr(db_routing.time, 'time', lambda: later)
+    assert writer.get('/category/fresh').status_code == 404
+
+
+def test_primary_reads_inside_public_request(routed_app, statements):
+    with routed_app.test_request_context('/'):
+        routed_app.preprocess_request()
+        with db_routing.primary_reads():
+            db.session.execute(db.select(Category.id)).all()
+        assert statements[None] and not statements['replica_0']
+        db.session.execute(db.select(Category.id)).all()
+        assert statements['replica_0']
+        db.session.remove()
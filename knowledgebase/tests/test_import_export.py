@@ -0,0 +1,167 @@
+"""
+Article import: taxonomy records, skipping existing slugs, and batches
+retried when a concurrent save takes one of their slugs; and exports
+imported back into an empty knowledge base
+"""
+import io
+import pytest
+from sqlalchemy import event
+from app import db, importer as importer_module
+from app.exporter import export_stream
+from app.importer import ArticleImporter, iter_ndjson, iter_tar, parse_front_matter
+from app.models import Article, Category, SubCategory, Tag
+from tests.conftest import create_test_app, make_config
+from tests.test_query_counts import counting_queries
+
+TAXONOMY = [
+    {'type': 'category', 'name': 'Security', 'slug': 'sec', 'description': 'Keeping safe',
+     'icon': 'lock', 'order': 2},
+    {'type': 'category', 'name': 'Operations', 'order': 1},
+    {'type': 'subcategory', 'name': 'Access', 'category': 'Security', 'order': 3},
+    {'type': 'subcategory', 'name': 'Access', 'category': 'Operations'},
+    {'type': 'subcategory', 'name': 'Orphan', 'category': ''},
+    {'type': 'tag', 'name': 'tokens', 'color': '#ff0000'},
+    {'type': 'tag', 'name': 'api'},
+    {'type': 'tag', 'name': ''},
+]
+
+
+def article(title, **fields):
+    return dict({'title': title, 'content': f'About {title}', 'category': 'Security'}, **fields)
+
+
+def test_taxonomy_records_are_created_together(app):
+    with app.app_context():
+        importer = ArticleImporter()
+        commits = []
+        count_commit = commits.append
+        event.listen(db.engine, 'commit', count_commit)
+        with counting_queries(db.engine) as statements:
+            result = importer.run(TAXONOMY)
+        event.remove(db.engine, 'commit', count_commit)
+        inserts = [statement for statement in statements if statement.startswith('INSERT')]
+        # One INSERT per table and one commit, however many records
+        assert len(inserts) == 3
+        assert len(commits) == 1
+        assert result.error_count == 2
+
+        security = Category.query.filter_by(name='Security').one()
+        assert (security.slug, security.description, security.icon, security.order) == \
+            ('sec', 'Keeping safe', 'lock', 2)
+        assert [(sub.category.name, sub.slug, sub.order)
+                for sub in SubCategory.query.order_by(SubCategory.id)] == \
+            [('Security', 'access', 3), ('Operations', 'access', 0)]
+        assert {(tag.name, tag.color) for tag in Tag.query} == \
+            {('tokens', '#ff0000'), ('api', '#2563eb')}
+
+        # Importing them again creates nothing
+        assert importer.run(TAXONOMY).error_count == 2
+        assert Category.query.count() == 2
+
+
+def test_skip_existing_keeps_articles_whose_slug_is_taken(app):
+    with app.app_context():
+        ArticleImporter().run([article('Rotating tokens')])
+        result = ArticleImporter(skip_existing=True).run([
+            article('Rotating tokens', content='Changed'),
+            article('Auditing access'),
+        ])
+        assert (result.imported, result.skipped) == (1, 1)
+        assert Article.query.filter_by(slug='rotating-tokens').one().content == 'About Rotating tokens'
+
+        result = ArticleImporter().run([article('Rotating tokens')])
+        assert result.imported == 1
+        assert Article.query.filter_by(slug='rotating-tokens-1').count() == 1
+
+
+def test_batch_is_retried_when_a_concurrent_save_takes_a_slug(app, monkeypatch):
+    with app.app_context():
+        ArticleImporter().run([article('Existing')])
+        category_id = Category.query.one().id
+        allocate_slugs = importer_module.allocate_slugs
+        allocated = []
+
+        def racing_allocate_slugs(column, bases, **options):
+            slugs = allocate_slugs(column, bases, **options)
+            if column is Article.slug:
+                allocated.append(slugs)
+            if len(allocated) == 1:
+                # Another worker commits a slug this batch has just picked
+                with db.engine.begin() as connection:
+                    connection.execute(Article.__table__.insert(), {
+                        'title': 'Rotating tokens', 'slug': slugs[0],
+                        'content': 'Saved meanwhile', 'category_id': category_id,
+                    })
+            return slugs
+
+        monkeypatch.setattr(importer_module, 'allocate_slugs', racing_allocate_slugs)
+        result = ArticleImporter().run([article('Rotating tokens'), article('Auditing access')])
+
+        assert allocated == [['rotating-tokens', 'auditing-access'],
+                             ['rotating-tokens-1', 'auditing-access']]
+        assert (result.imported, result.batches, result.error_count) == (2, 1, 0)
+        assert Article.query.filter_by(slug='rotating-tokens-1').one().content == \
+            'About Rotating tokens'
+        assert Category.query.one().published_article_count == 4
+
+
+def add_knowledge_base():
+    ArticleImporter().run(TAXONOMY[:4] + TAXONOMY[5:7] + [
+        article('Rotating tokens', subcategory='Access', tags=['tokens', 'api'],
+                summary='When and how', date='2024-03-01T10:00:00'),
+        article('Draft notes', category='Operations', published=False, tags=['api']),
+        article('Auditing access', featured=True, content='# Audit\n\n---\n\nWith a rule'),
+    ])
+
+
+def snapshot():
+    """Everything an export carries, keyed by names and slugs rather than ids"""
+    return {
+        'categories': sorted(
+            (category.name, category.slug, category.description, category.icon, category.order,
+             category.published_article_count)
+            for category in Category.query),
+        'subcategories': sorted(
+            (sub.category.name, sub.name, sub.slug, sub.order, sub.published_article_count)
+            for sub in SubCategory.query),
+        'tags': sorted((tag.name, tag.slug, tag.color, tag.published_article_count)
+                       for tag in Tag.query),
+        'articles': sorted(
+            (a.slug, a.title, a.summary, a.content, a.category.name,
+             a.subcategory.name if a.subcategory else None, sorted(t.name for t in a.tags),
+             a.is_published, a.is_featured, a.created_at)
+            for a in Article.query),
+    }
+
+
+@pytest.mark.parametrize('format', ['ndjson', 'markdown'])
+def test_export_imports_into_an_empty_knowledge_base(app, tmp_path, format):
+    with app.app_context():
+        add_knowledge_base()
+        exported = snapshot()
+        data = b''.join(export_stream(format))
+
+    (tmp_path / 'target').mkdir()
+    target = create_test_app(make_config(tmp_path / 'target'))
+    try:
+        with target.app_context():
+            records = iter_ndjson(io.BytesIO(data)) if format == 'ndjson' \
+                else iter_tar(io.BytesIO(data))
+            result = ArticleImporter().run(records)
+            assert (result.imported, result.error_count) == (3, 0)
+            assert snapshot() == exported
+    finally:
+        with target.app_context():
+            db.engine.dispose()
+
+
+def test_front_matter_round_trips_through_markdown_export(app):
+    with app.app_context():
+        add_knowledge_base()
+        records = list(iter_tar(io.BytesIO(b''.join(export_stream('markdown')))))
+
+    documents = [record for record in records if record.get('type') is None]
+    audit = next(record for record in documents if record['slug'] == 'auditing-access')
+    # A '---' line inside the body does not end the front matter early
+    assert audit['content'] == '# Audit\n\n---\n\nWith a rule'
+    assert parse_front_matter('---\ntags:\n- a\n- b\n---\nBody') == ({'tags': ['a', 'b']}, 'Body')
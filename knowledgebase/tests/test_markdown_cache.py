@@ -0,0 +1,48 @@
+"""
+Rendered markdown cache: readers only read the shared table, which admin
+saves and `flask warm-markdown-cache` fill and prune
+"""
+from app import db
+from app.markdown_cache import (cache_key, render_markdown_cached, renderer_signature,
+                                warm_all_markdown_caches)
+from app.models import Article, Category, RenderedMarkdown
+
+
+def add_article(title, content):
+    category = Category.query.first() or Category(name='Guides', slug='guides')
+    article = Article(title=title, slug=title.lower(), content=content, category=category)
+    db.session.add(article)
+    db.session.commit()
+    return article
+
+
+def stored_keys():
+    return set(db.session.execute(db.select(RenderedMarkdown.key)).scalars())
+
+
+def test_reader_miss_is_not_written(app):
+    with app.app_context():
+        html = render_markdown_cached('# Heading')
+        assert '<h1' in html
+        assert stored_keys() == set()
+
+
+def test_warming_stores_renderings_and_prunes_unused_ones(app):
+    with app.app_context():
+        first = add_article('First', '# First')
+        add_article('Second', '# Second')
+        db.session.add_all([
+            RenderedMarkdown(key='a' * 64, signature='old renderer', html='<p>old</p>'),
+            RenderedMarkdown(key='b' * 64, signature=renderer_signature(), html='<p>gone</p>'),
+            RenderedMarkdown(key=cache_key('# First'), signature=renderer_signature(),
+                             html='<h1>First</h1>'),
+        ])
+        db.session.commit()
+
+        assert warm_all_markdown_caches(batch_size=1) == (1, 2)
+        assert stored_keys() == {cache_key('# First'), cache_key('# Second')}
+
+        first.content = '# First, edited'
+        db.session.commit()
+        assert warm_all_markdown_caches() == (1, 1)
+        assert stored_keys() == {cache_key('# First, edited'), cache_key('# Second')}
@@ -0,0 +1,59 @@
+"""
+Metrics added up over worker processes sharing PROMETHEUS_MULTIPROC_DIR,
+and /metrics access control
+"""
+import os
+import subprocess
+import sys
+from app import db
+from tests.conftest import create_test_app, make_config
+
+# A worker that handled a request and has one still in flight; prints its pid
+WORKER = '''
+import os
+from app.metrics import IN_FLIGHT, REQUESTS
+REQUESTS.labels('main.index', 'GET', 200).inc()
+IN_FLIGHT.inc()
+print(os.getpid())
+'''
+
+# The master reaping ``pid`` (gunicorn.conf.child_exit), then a scrape
+SCRAPE = '''
+import sys
+from prometheus_client import generate_latest, multiprocess
+from app.metrics import _registry
+multiprocess.mark_process_dead(int(sys.argv[1]))
+sys.stdout.write(generate_latest(_registry()).decode())
+'''
+
+
+def run(script, directory, *args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(directory))
+    return subprocess.run([sys.executable, '-c', script, *args], cwd=root, env=env,
+                          capture_output=True, text=True, check=True).stdout
+
+
+def test_workers_are_added_up_and_exited_ones_stop_counting_in_flight(tmp_path):
+    first = run(WORKER, tmp_path).strip()
+    run(WORKER, tmp_path)
+
+    exposition = run(SCRAPE, tmp_path, first)
+    assert 'kb_http_requests_total{endpoint="main.index",method="GET",status="200"} 2.0' \
+        in exposition
+    # Both worker processes have exited, but only one was marked dead
+    assert 'kb_http_requests_in_flight 1.0' in exposition
+
+
+def test_metrics_token(tmp_path):
+    app = create_test_app(make_config(tmp_path, METRICS_ENABLED=True, METRICS_TOKEN='s3cret'))
+    client = app.test_client()
+    try:
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+        assert response.status_code == 200
+        assert b'kb_http_requests_total' in response.data
+    finally:
+        with app.app_context():
+            db.engine.dispose()
@@ -0,0 +1,102 @@
+"""
+Tag-invalidated page and fragment caches
+"""
+import os
+import time
+import pytest
+from app import db
+from app.cache import FileSystemBackend, MemoryBackend, TaggedCache
+from app.models import Category
+from app.signals import notify_content_changed
+from tests.conftest import create_test_app, make_config
+
+
+@pytest.fixture
+def cached_app(tmp_path):
+    app = create_test_app(make_config(tmp_path, PAGE_CACHE_BACKEND='memory',
+                                      FRAGMENT_CACHE_BACKEND='memory'))
+    with app.app_context():
+        db.session.add(Category(name='Guides', slug='guides'))
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def tagged_cache(backend=None):
+    cache = TaggedCache(backend or MemoryBackend(), 'test:')
+    cache.invalidate(['other'])
+    return cache
+
+
+def test_invalidated_tag_makes_entry_stale():
+    cache = tagged_cache()
+    assert cache.set('key', 'value', ['article:1'], since=time.time())
+    assert cache.get('key') == 'value'
+
+    cache.invalidate(['article:1'])
+    assert cache.get('key') is None
+
+
+def test_entry_rendered_before_an_invalidation_is_not_stored():
+    cache = tagged_cache()
+    since = time.time()
+    cache.invalidate(['article:2'])
+
+    assert not cache.set('key', 'old value', ['article:1'], since=since)
+    assert cache.get('key') is None
+    assert cache.set('key', 'new value', ['article:1'], since=time.time())
+
+
+def test_nothing_is_stored_while_the_last_change_is_unknown():
+    cache = TaggedCache(MemoryBackend(), 'test:')
+
+    assert not cache.set('key', 'value', ['article:1'], since=time.time())
+    assert cache.set('key', 'value', ['article:1'], since=time.time())
+
+
+def test_entry_is_stale_once_its_tag_token_is_pruned(tmp_path):
+    backend = FileSystemBackend(str(tmp_path), threshold=6)
+    cache = tagged_cache(backend)
+    assert cache.set('old', 'before the change', ['article:1'], since=time.time())
+    cache.invalidate(['article:1'])
+    assert cache.get('old') is None
+    assert cache.set('key', 'after the change', ['article:1'], since=time.time())
+
+    # Tag tokens are written least often, so pruning drops them first
+    past, future = time.time() - 60, time.time() + 60
+    for key in ('tag:article:1', 'tag:other'):
+        os.utime(backend._path(key), (past, past))
+    os.utime(backend._path('test:key'), (future, future))
+    for number in range(6):
+        backend.set(f'filler:{number}', number)
+    assert backend.get('tag:article:1') is None
+    assert backend.get('test:key') is not None
+
+    assert cache.get('key') is None
+
+
+def test_page_key_ignores_unused_query_arguments(cached_app):
+    client = cached_app.test_client()
+
+    assert client.get('/category/guides?utm_source=mail').headers['X-Cache'] == 'MISS'
+    assert client.get('/category/guides').headers['X-Cache'] == 'HIT'
+    assert client.get('/category/guides?ref=1').headers['X-Cache'] == 'HIT'
+
+
+def test_page_changed_while_rendering_is_not_cached(cached_app, monkeypatch):
+    client = cached_app.test_client()
+    render_template = cached_app.jinja_env.get_template
+
+    def invalidating_get_template(*args, **kwargs):
+        # An admin saves the category after the view has read it
+        with cached_app.app_context():
+            notify_content_changed(['categories'])
+        return render_template(*args, **kwargs)
+
+    monkeypatch.setattr(cached_app.jinja_env, 'get_template', invalidating_get_template)
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    monkeypatch.undo()
+
+    assert client.get('/').headers['X-Cache'] == 'MISS'
+    assert client.get('/').headers['X-Cache'] == 'HIT'
@@ -0,0 +1,86 @@
+"""
+Listing pages run a fixed number of queries, however many categories,
+subcategories, tags and articles they list
+"""
+from contextlib import contextmanager
+import pytest
+from sqlalchemy import event
+from app import db
+from app.models import Article, Category, SubCategory, Tag
+
+PUBLIC_PAGES = ['/', '/category/area-0', '/category/area-0/topic-0-0', '/tag/tag-0']
+ADMIN_PAGES = ['/admin/categories', '/admin/subcategories', '/admin/tags', '/admin/articles']
+
+
+@contextmanager
+def counting_queries(engine):
+    """Count the statements ``engine`` executes inside this block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def add_content(categories, subcategories, articles):
+    """
+    Grow the catalogue to ``categories`` categories, add ``subcategories``
+    subcategories to each and ``articles`` articles to every subcategory,
+    so that every listed page, old or new, has more rows to show
+    """
+    tags = Tag.query.order_by(Tag.id).all()
+    for index in range(len(tags), categories):
+        tags.append(Tag(name=f'Tag {index}', slug=f'tag-{index}'))
+    existing = Category.query.count()
+    for index in range(existing, categories):
+        db.session.add(Category(name=f'Area {index}', slug=f'area-{index}', order=index))
+    for index, category in enumerate(Category.query.order_by(Category.id)):
+        first = category.subcategories.count()
+        for position in range(first, first + subcategories):
+            db.session.add(SubCategory(name=f'Topic {index} {position}',
+                                       slug=f'topic-{index}-{position}', category=category))
+    for subcategory in SubCategory.query.order_by(SubCategory.id):
+        first = subcategory.articles.count()
+        for number in range(first, first + articles):
+            db.session.add(Article(
+                title=f'{subcategory.name} {number}', slug=f'{subcategory.slug}-{number}',
+                content='Some **content**', summary='Summary',
+                category=subcategory.category, subcategory=subcategory,
+                is_featured=number == 0, tags=tags[:number + 1],
+            ))
+    db.session.commit()
+
+
+def query_counts(app, client, urls):
+    """Queries run by a request for each of ``urls``, after a warm-up request"""
+    counts = {}
+    with app.app_context():
+        engine = db.engine
+    for url in urls:
+        assert client.get(url).status_code == 200, url
+        with counting_queries(engine) as statements:
+            client.get(url)
+        counts[url] = len(statements)
+    return counts
+
+
+@pytest.mark.parametrize('pages, client_fixture', [
+    (PUBLIC_PAGES, 'client'),
+    (ADMIN_PAGES, 'admin_client'),
+])
+def test_listing_query_counts_do_not_grow(app, request, pages, client_fixture):
+    client = request.getfixturevalue(client_fixture)
+    with app.app_context():
+        add_content(categories=2, subcategories=1, articles=2)
+    small = query_counts(app, client, pages)
+
+    with app.app_context():
+        add_content(categories=8, subcategories=2, articles=5)
+    large = query_counts(app, client, pages)
+
+    assert large == small
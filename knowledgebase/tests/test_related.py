@@ -0,0 +1,81 @@
+"""
+Related articles: stale marks are stored in the database and refreshed
+after the response that caused them, or by `flask refresh-related`
+"""
+from app import db, related
+from app.models import Article, Category, RelatedArticle, StaleRelatedArticle
+from app.related import build_related_articles, find_related_articles, refresh_stale_related_articles
+from app.utils import build_search_document
+
+TOPICS = [
+    ('Kubernetes pod scheduling', 'kubernetes pods scheduler nodes affinity taints'),
+    ('Kubernetes node affinity', 'kubernetes nodes affinity scheduler labels pods'),
+    ('Postgres index tuning', 'postgres indexes vacuum planner queries btree'),
+    ('Postgres query planner', 'postgres planner queries statistics indexes joins'),
+    ('Redis cache eviction', 'redis cache eviction memory keys expiry'),
+]
+
+
+def add_articles():
+    category = Category(name='Guides', slug='guides')
+    db.session.add(category)
+    for number, (title, words) in enumerate(TOPICS):
+        content = ' '.join([words] * 5)
+        db.session.add(Article(title=title, slug=f'article-{number}', content=content,
+                               category=category,
+                               search_vector=build_search_document(title, '', content)))
+    db.session.commit()
+    build_related_articles()
+    db.session.commit()
+
+
+def related_titles(slug):
+    article = Article.query.filter_by(slug=slug).one()
+    return [other.title for other in find_related_articles(article)]
+
+
+def stale_ids():
+    return db.session.execute(db.select(StaleRelatedArticle.article_id)).scalars().all()
+
+
+def test_saved_article_is_refreshed_after_the_response(app, admin_client):
+    with app.app_context():
+        add_articles()
+        assert related_titles('article-4') == []
+        article_id = Article.query.filter_by(slug='article-4').one().id
+        category_id = Article.query.filter_by(slug='article-4').one().category_id
+
+    response = admin_client.post(f'/admin/article/{article_id}/edit', data={
+        'title': 'Redis as a Postgres cache',
+        'content': ' '.join(['postgres queries indexes planner redis cache'] * 5),
+        'category_id': category_id, 'is_published': 'on',
+    })
+    assert response.status_code == 302
+    with app.app_context():
+        # Saved and marked, but not refreshed before the response
+        assert stale_ids() == [article_id]
+        assert related_titles('redis-as-a-postgres-cache') == []
+
+    response.close()
+    with app.app_context():
+        assert stale_ids() == []
+        assert set(related_titles('redis-as-a-postgres-cache')[:2]) == \
+            {'Postgres query planner', 'Postgres index tuning'}
+
+
+def test_stale_marks_wait_for_refresh_related_when_too_many(app, monkeypatch):
+    monkeypatch.setattr(related, '_MAX_INCREMENTAL', 2)
+    with app.app_context():
+        add_articles()
+        for article in Article.query.all():
+            article.summary = 'Changed'
+        db.session.commit()
+        assert len(stale_ids()) == len(TOPICS)
+
+        # A request does not rebuild everything; the marks are kept
+        assert refresh_stale_related_articles() == 0
+        assert len(stale_ids()) == len(TOPICS)
+
+        assert refresh_stale_related_articles(rebuild=True) == len(TOPICS)
+        assert stale_ids() == []
+        assert db.session.scalar(db.select(db.func.count()).select_from(RelatedArticle))
@@ -0,0 +1,87 @@
+"""
+Unique slugs: allocation against existing rows, and the retry in
+commit_with_unique_slug() when a concurrent save takes the slug first
+"""
+import sqlite3
+from app import db, slugs
+from app.models import Article, Category
+from app.slugs import allocate_slugs, commit_with_unique_slug
+
+
+def database_path(app):
+    return app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+
+
+def test_allocate_slugs_numbers_collisions(app):
+    with app.app_context():
+        category = Category(name='Guides', slug='guides')
+        db.session.add(category)
+        db.session.add(Article(title='Setup', slug='setup', content='x', category=category))
+        db.session.add(Article(title='Setup', slug='setup-1', content='x', category=category))
+        db.session.commit()
+
+        assert allocate_slugs(Article.slug, ['setup', 'setup', 'other']) == \
+            ['setup-2', 'setup-3', 'other']
+
+
+def test_commit_retries_when_a_concurrent_save_takes_the_slug(app, monkeypatch):
+    with app.app_context():
+        category = Category(name='Guides', slug='guides')
+        db.session.add(category)
+        db.session.commit()
+        category_id = category.id
+
+        taken_suffixes = slugs.taken_suffixes
+        calls = []
+
+        def racing_taken_suffixes(column, bases, where=None):
+            taken = taken_suffixes(column, bases, where)
+            if not calls:
+                # Another worker commits the same slug after it was checked
+                with sqlite3.connect(database_path(app)) as other:
+                    other.execute(
+                        "INSERT INTO articles (title, slug, content, category_id) "
+                        "VALUES ('Setup', 'setup', 'theirs', ?)", (category_id,))
+            calls.append(bases)
+            return taken
+
+        monkeypatch.setattr(slugs, 'taken_suffixes', racing_taken_suffixes)
+        article = Article(title='Setup', content='mine', category_id=category_id)
+        db.session.add(article)
+        commit_with_unique_slug(article, 'setup')
+
+        assert len(calls) == 2
+        assert article.slug == 'setup-1'
+        assert article.content == 'mine'
+        assert db.session.execute(
+            db.select(Article.slug).order_by(Article.id)).scalars().all() == ['setup', 'setup-1']
+
+
+def test_commit_retry_keeps_edits_to_an_existing_row(app, monkeypatch):
+    with app.app_context():
+        category = Category(name='Guides', slug='guides')
+        article = Article(title='Draft', slug='draft', content='old', category=category)
+        db.session.add(article)
+        db.session.add(Article(title='Setup', slug='setup', content='theirs', category=category))
+        db.session.commit()
+
+        taken_suffixes = slugs.taken_suffixes
+        calls = []
+
+        def stale_taken_suffixes(column, bases, where=None):
+            # The edit's autoflush holds SQLite's write lock, so the
+            # concurrent save is simulated by a read from before it
+            # committed 'setup'
+            calls.append(bases)
+            if len(calls) == 1:
+                return {base: set() for base in bases}
+            return taken_suffixes(column, bases, where)
+
+        monkeypatch.setattr(slugs, 'taken_suffixes', stale_taken_suffixes)
+        article.title = 'Setup'
+        article.content = 'new'
+        commit_with_unique_slug(article, 'setup')
+
+        db.session.expire_all()
+        assert len(calls) == 2
+        assert (article.slug, article.title, article.content) == ('setup-1', 'Setup', 'new')
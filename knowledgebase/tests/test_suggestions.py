@@ -0,0 +1,96 @@
+"""
+Suggestion index: workers sharing a database apply each other's changes
+from the suggestion_changes log instead of rebuilding
+"""
+import pytest
+from app import create_app, db
+from app.models import Article, Category, SuggestionChange
+from app.suggestions import SuggestionIndex, get_suggestion_index
+from tests.conftest import create_test_app, make_config
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    """Two apps on one database, as two worker processes would be, and their build count"""
+    config = make_config(tmp_path, SUGGESTION_INDEX_ENABLED=True,
+                         SUGGESTION_INDEX_CHECK_INTERVAL=0)
+    first = create_test_app(config)
+    with first.app_context():
+        category = Category(name='Guides', slug='guides')
+        db.session.add(category)
+        for number, title in enumerate(['Kubernetes pods', 'Postgres indexes', 'Redis eviction']):
+            db.session.add(Article(title=title, slug=f'article-{number}', content=title,
+                                   category=category))
+        db.session.commit()
+    second = create_app(config)
+
+    builds = []
+    build = SuggestionIndex.build
+    monkeypatch.setattr(SuggestionIndex, 'build',
+                        lambda self, articles: builds.append(self) or build(self, articles))
+    yield first, second, builds
+    for app in (first, second):
+        with app.app_context():
+            db.engine.dispose()
+
+
+def titles(app, query):
+    with app.app_context():
+        return [payload['title'] for payload in get_suggestion_index().search(query)]
+
+
+def test_workers_apply_changes_without_rebuilding(workers):
+    first, second, builds = workers
+    assert titles(first, 'postgres') == ['Postgres indexes']
+    assert titles(second, 'postgres') == ['Postgres indexes']
+    assert len(builds) == 2
+
+    with first.app_context():
+        article = Article.query.filter_by(slug='article-1').one()
+        article.title = 'Postgres query planner'
+        db.session.commit()
+
+    assert titles(first, 'planner') == ['Postgres query planner']
+    assert titles(second, 'planner') == ['Postgres query planner']
+    assert titles(second, 'indexes') == []
+    assert len(builds) == 2
+
+
+def test_renamed_category_reindexes_its_articles(workers):
+    first, second, builds = workers
+    assert titles(second, 'redis') == ['Redis eviction']
+
+    with first.app_context():
+        Category.query.one().name = 'Howtos'
+        db.session.commit()
+
+    with second.app_context():
+        payloads = get_suggestion_index().search('redis')
+    assert [payload['category'] for payload in payloads] == ['Howtos']
+    assert len(builds) == 1
+
+
+def test_worker_behind_the_retained_changes_rebuilds(workers):
+    first, second, builds = workers
+    assert titles(second, 'redis') == ['Redis eviction']
+    second.extensions['suggestion_index']['synced_at'] -= \
+        second.config['SUGGESTION_CHANGES_RETENTION']
+
+    assert titles(second, 'redis') == ['Redis eviction']
+    assert len(builds) == 2
+
+
+def test_old_changes_are_pruned(workers):
+    first, second, builds = workers
+    with first.app_context():
+        logged = SuggestionChange.query.count()
+        article = Article.query.filter_by(slug='article-0').one()
+        article.title += ' guide'
+        db.session.commit()
+        assert SuggestionChange.query.count() == logged + 1
+
+        first.config['SUGGESTION_CHANGES_RETENTION'] = -1
+        article.title += ' again'
+        db.session.commit()
+        assert [(change.kind, change.entity_id) for change in SuggestionChange.query] == \
+            [('article', article.id)]